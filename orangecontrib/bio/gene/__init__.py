@@ -1,9 +1,20 @@
-from __future__ import absolute_import
+from __future__ import absolute_import, print_function
 import sys
 import os
 import time
+import mmap
+import warnings
 
-from ..utils import serverfiles
+import numpy
+import scipy.sparse
+import scipy.sparse.csgraph
+
+try:
+    from collections.abc import Mapping, Sequence
+except ImportError:
+    from collections import Mapping, Sequence
+
+from ..utils import serverfiles, mmapstore
 
 from .. import taxonomy as obiTaxonomy
 from .. import kegg as obiKEGG
@@ -81,7 +92,180 @@ class GeneHistory(object):
             setattr(self, attr, value)
 
 
+def _gene_aliases(line):
+    """Return the set of aliases (id, symbol, locus tag and synonyms) of
+    a gene in a gene_info line."""
+    info = GeneInfo(line)
+    return set(filter(None, [info.gene_id, info.symbol, info.locus_tag] +
+                      info.synonyms))
+
+
+class _TabIndex(object):
+    """
+    An index of lines in a tab separated file by the values in one of
+    its columns (the last line wins for repeated values). Only the line
+    offsets and keys are kept in memory; lines are read from the
+    (memory-mapped) file on demand.
+
+    If `names` is given (a function returning a set of names for a
+    line), an :class:`AliasIndex` of lower case names to line numbers is
+    also built.
+
+    The index is saved next to the file (with a ".index" suffix) and
+    reused while the file does not change.
+    """
+
+    VERSION = 1
+
+    def __init__(self, filename, arrays):
+        self.filename = filename
+        self.arrays = arrays
+        self.keys = arrays["keys"]
+        if "name_keys" in arrays:
+            self.names = AliasIndex(arrays["name_keys"], arrays["name_indptr"],
+                                    arrays["name_lines"], lower=True)
+        else:
+            self.names = None
+        self._data = None
+
+    @classmethod
+    def open(cls, filename, column, names=None):
+        path = filename + ".index"
+        source = mmapstore.file_stamp(filename)
+        try:
+            meta, arrays = mmapstore.read(path, version=cls.VERSION)
+            if meta.get("source") != source or meta.get("column") != column:
+                raise mmapstore.FormatError("%r is out of date" % path)
+            if names is not None and "name_keys" not in arrays:
+                raise mmapstore.FormatError("%r has no names" % path)
+        except (IOError, OSError, ValueError):
+            arrays = cls.build(filename, column, names)
+            try:
+                mmapstore.write(path, arrays,
+                                meta={"source": source, "column": column},
+                                version=cls.VERSION)
+            except (IOError, OSError) as err:
+                warnings.warn("Could not write the index of %r (%s)" %
+                              (filename, err), UserWarning)
+        return cls(filename, arrays)
+
+    @classmethod
+    def build(cls, filename, column, names=None):
+        with open(filename, "rb") as f:
+            data = f.read()
+        starts, ends, keys, groups = [], [], [], []
+        start = 0
+        for line in data.splitlines(True):
+            end = start + len(line.rstrip(b"\r\n"))
+            text = line[:end - start].decode("utf-8")
+            if text.strip() and not text.startswith("#"):
+                starts.append(start)
+                ends.append(end)
+                keys.append(text.split("\t", column + 1)[column])
+                if names is not None:
+                    groups.append(names(text))
+            start += len(line)
+
+        last = {}
+        for i, key in enumerate(keys):
+            last[key] = i
+        # keys in the order of their first appearance
+        first = dict((key, i) for i, key in enumerate(last))
+        unique, order = mmapstore.sorted_keys(list(last))
+        key_pos = numpy.empty(len(unique), dtype=numpy.int32)
+        key_pos[order] = numpy.arange(len(unique), dtype=numpy.int32)
+        key_lines = numpy.array(list(last.values()), dtype=numpy.int32)
+        line_keys = key_pos[numpy.array([first[key] for key in keys],
+                                        dtype=numpy.int64)]
+
+        arrays = {
+            "keys": unique,
+            "key_lines": key_lines[order],
+            "key_order": key_pos,
+            "line_start": numpy.array(starts, dtype=numpy.int64),
+            "line_end": numpy.array(ends, dtype=numpy.int64),
+            "line_keys": line_keys,
+        }
+        if names is not None:
+            index = AliasIndex.from_groups(groups, lower=True)
+            arrays.update({"name_keys": index.keys,
+                           "name_indptr": index.indptr,
+                           "name_lines": index.groups})
+        return arrays
+
+    def __len__(self):
+        return len(self.keys)
+
+    def line_number(self, key):
+        """Return the number of the line with `key` or -1."""
+        i = mmapstore.key_index(self.keys, key)
+        return int(self.arrays["key_lines"][i]) if i >= 0 else -1
+
+    def line(self, number):
+        """Return the `number`-th (indexed) line."""
+        if self._data is None:
+            self._data = _map_file(self.filename)
+        start = self.arrays["line_start"][number]
+        end = self.arrays["line_end"][number]
+        return self._data[start:end].decode("utf-8")
+
+    def key(self, number):
+        """Return the key of the `number`-th line."""
+        return self.keys[self.arrays["line_keys"][number]].decode("utf-8")
+
+    def ordered_keys(self):
+        """Return all keys in the order of their first appearance."""
+        return [self.keys[i].decode("utf-8")
+                for i in self.arrays["key_order"]]
+
+    def find(self, name):
+        """Return a list of keys of lines with `name` (see `names`)."""
+        lines = self.names.lookup(name)
+        if len(lines) == 1:
+            return [self.key(lines[0])]
+        return sorted(set(self.key(i) for i in lines))
+
+
+def _map_file(filename):
+    with open(filename, "rb") as f:
+        try:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:  # an empty file can not be mapped
+            return b""
+
+
+
+class _GeneHistoryMapping(Mapping):
+    """ A read-only {discontinued_gene_id: :class:`GeneHistory`} mapping
+    backed by an index of the gene history file. """
+
+    def __init__(self, index):
+        self._index = index
+
+    def __getitem__(self, key):
+        number = self._index.line_number(key)
+        if number < 0:
+            raise KeyError(key)
+        return GeneHistory(self._index.line(number))
+
+    def __contains__(self, key):
+        return self._index.line_number(key) >= 0
+
+    def __iter__(self):
+        return iter(self._index.ordered_keys())
+
+    def __len__(self):
+        return len(self._index)
+
+
 class NCBIGeneInfo(dict):
+    """ A dictionary like object for accessing NCBI gene info.
+
+    Records are indexed (by gene id and by gene names) in a file saved
+    next to the gene info file and are only read and parsed when
+    accessed, so opening gene info of an organism is fast and does not
+    load the whole file into memory.
+    """
     TAX_MAP = {
             "2104": "272634",  # Mycoplasma pneumoniae
             "4530": "39947",  # Oryza sativa
@@ -100,29 +284,44 @@ class NCBIGeneInfo(dict):
         
         self.taxid = self.organism_name_search(organism)
 
-
         fname = serverfiles.localpath_download("NCBI_geneinfo", "gene_info.%s.db" % self.taxid)
-        file = open(fname, "rt")
-        self.update(dict([(line.split("\t", 3)[1], line) for line in file.read().splitlines() if line.strip() and not line.startswith("#")]))
+        self._index = _TabIndex.open(fname, 1, names=_gene_aliases)
+        self._history = None
+
+        #the gene matcher (and its targets) are set when first needed
+        self._matcher = genematcher
+        self._matcher_targets_set = False
 
-        self.matcher = genematcher
-        if self.matcher == None:
+    def _default_matching(self):
+        # with the default matcher gene names are matched through the
+        # index of gene names
+        return self._matcher is None and self.taxid != '352472'
+
+    @property
+    def matcher(self):
+        if self._matcher is None:
             if self.taxid == '352472':
-                self.matcher = matcher([GMNCBI(self.taxid), GMDicty(), [GMNCBI(self.taxid), GMDicty()]])
+                self._matcher = matcher([GMNCBI(self.taxid), GMDicty(), [GMNCBI(self.taxid), GMDicty()]])
             else:
-                self.matcher = matcher([GMNCBI(self.taxid)])
+                self._matcher = matcher([_MatcherGeneInfo(self._index)])
+        if not self._matcher_targets_set:
+            #if this is done with a gene matcher, pool target names
+            self._matcher.set_targets(self.keys())
+            self._matcher_targets_set = True
+        return self._matcher
+
+    @matcher.setter
+    def matcher(self, matcher):
+        self._matcher = matcher
+        self._matcher_targets_set = True
 
-        #if this is done with a gene matcher, pool target names
-        self.matcher.set_targets(self.keys())
-        
     def history(self):
         if getattr(self, "_history", None) is None:
             fname = serverfiles.localpath_download("NCBI_geneinfo", "gene_history.%s.db" % self.taxid)
             try:
-                self._history = dict([(line.split("\t")[2], GeneHistory(line)) for line in open(fname, "rb").read().splitlines()])
-                
+                self._history = _GeneHistoryMapping(_TabIndex.open(fname, 2))
             except Exception as ex:
-                print >> sys.srderr, "Loading NCBI gene history failed.", ex
+                print("Loading NCBI gene history failed.", ex, file=sys.stderr)
                 self._history = {}
         return self._history
         
@@ -172,12 +371,37 @@ class NCBIGeneInfo(dict):
         """
         #id = self.translate.get(name, name)
         #print self.matcher.umatch(name), self.matcher.match(name)
-        id = self.matcher.umatch(name)
+        if self._default_matching():
+            id = self._umatch(name)
+        else:
+            id = self.matcher.umatch(name)
         return self[id]
 
+    def _umatch(self, name):
+        # equivalent to matcher([GMNCBI(taxid)]).umatch with all genes
+        # as targets: a gene id matches directly (as with MatcherDirect),
+        # other names match the gene ids among the aliases of the genes
+        # they name (a gene id can also be another gene's synonym, which
+        # makes the name ambiguous)
+        if name in self:
+            return name
+        ids = set()
+        for gene_id in self._index.find(name):
+            ids.update(alias for alias in _gene_aliases(self._line(gene_id))
+                       if alias in self)
+        return ids.pop() if len(ids) == 1 else None
+
+    def _line(self, key):
+        if dict.__contains__(self, key):
+            return dict.__getitem__(self, key)
+        number = self._index.line_number(key) if isinstance(key, basestring) else -1
+        if number < 0:
+            raise KeyError(key)
+        return self._index.line(number)
+
     def __getitem__(self, key):
 #        return self.get(gene_id, self.matcher[gene_id])
-        return GeneInfo(dict.__getitem__(self, key))
+        return GeneInfo(self._line(key))
 
     def __setitem__(self, key, value):
         if type(value) == str:
@@ -185,6 +409,29 @@ class NCBIGeneInfo(dict):
         else:
             dict.__setitem__(self, key, repr(value))
 
+    def __contains__(self, key):
+        return dict.__contains__(self, key) or \
+            (isinstance(key, basestring) and self._index.line_number(key) >= 0)
+
+    has_key = __contains__
+
+    def __len__(self):
+        return len(self._index) + \
+            sum(1 for key in dict.keys(self)
+                if self._index.line_number(key) < 0)
+
+    def __iter__(self):
+        for key in self._index.ordered_keys():
+            yield key
+        for key in dict.keys(self):
+            if self._index.line_number(key) < 0:
+                yield key
+
+    iterkeys = __iter__
+
+    def keys(self):
+        return list(self)
+
     def get(self, key, def_=None):
         try:
             return self[key]
@@ -192,12 +439,12 @@ class NCBIGeneInfo(dict):
             return def_
 
     def itervalues(self):
-        for val in dict.itervalues(self):
-            yield GeneInfo(val)
+        for key in self:
+            yield self[key]
 
     def iteritems(self):
-        for key, val in zip(self.iterkeys(), self.itervalues()):
-            yield key, val
+        for key in self:
+            yield key, self[key]
 
     if sys.version_info < (3, ):
         def values(self):
@@ -207,10 +454,10 @@ class NCBIGeneInfo(dict):
             return list(self.iteritems())
     else:
         def values(self):
-            return map(GeneInfo, super().values())
+            return self.itervalues()
 
         def items(self):
-            return ((key, GeneInfo(value)) for key, value in super().items())
+            return self.iteritems()
 
     @staticmethod
     def get_geneinfo_from_ncbi(file, progressCallback=None):
@@ -351,7 +598,7 @@ Gene matcher.
 "Database" for each organism is a list of sets of gene aliases.
 """
 
-from collections import defaultdict
+from collections import defaultdict, OrderedDict
 import os
 
 gene_matcher_path = None
@@ -447,6 +694,166 @@ def join_sets_l(lsets, lower=False):
         current = join_sets(current, b, lower=lower)
     return current
 
+def join_aliases(lsets, lower=False):
+    """
+    Joins multiple gene set mappings. If lower is True, lower case forms
+    of gene aliases are compared.
+
+    Unlike :func:`join_sets_l`, the join is transitive: groups from
+    different mappings that are connected through shared aliases end up
+    in a single group. Groups within one mapping are only joined through
+    groups from other mappings. Aliases are interned to integer ids and
+    the groups are joined with a union-find (connected components) pass,
+    so the time is near-linear in the total number of aliases.
+
+    The result does not depend on the order of the mappings (except for
+    the order of the returned groups).
+    """
+    groups = []
+    group_source = []
+    aliases = []
+    alias_group = []
+    for source, sets in enumerate(lsets):
+        for group in sets:
+            group = set(group)
+            keys = set(a.lower() for a in group) if lower else group
+            aliases.extend(keys)
+            alias_group.extend([len(groups)] * len(keys))
+            groups.append(group)
+            group_source.append(source)
+
+    if not groups:
+        return []
+
+    ngroups = len(groups)
+    _, alias_ids = numpy.unique(
+        numpy.array([a.encode("utf-8") for a in aliases], dtype=bytes),
+        return_inverse=True)
+    alias_ids = alias_ids.ravel()
+    alias_group = numpy.array(alias_group, dtype=numpy.int64)
+    sources = numpy.array(group_source, dtype=numpy.int64)[alias_group]
+
+    # an alias joins groups if it appears in more than one mapping
+    nsources = len(lsets)
+    pairs = numpy.unique(alias_ids * nsources + sources)
+    shared = numpy.bincount(pairs // nsources) > 1
+    edges = shared[alias_ids]
+
+    # bipartite graph of groups and (shared) aliases
+    nnodes = ngroups + len(shared)
+    graph = scipy.sparse.csr_matrix(
+        (numpy.ones(int(edges.sum()), dtype=numpy.int8),
+         (alias_group[edges], ngroups + alias_ids[edges])),
+        shape=(nnodes, nnodes))
+    _, labels = scipy.sparse.csgraph.connected_components(graph,
+                                                          directed=False)
+
+    labels = labels[:ngroups]
+    # components in the order of their first group
+    _, first, component = numpy.unique(labels, return_index=True,
+                                       return_inverse=True)
+    order = numpy.argsort(numpy.argsort(first))
+    joined = [set() for _ in range(len(first))]
+    for group, c in zip(groups, order[component.ravel()].tolist()):
+        joined[c].update(group)
+    return joined
+
+class AliasIndex(object):
+    """
+    A compact index of gene aliases to the indices of groups of aliases
+    containing them (see :func:`create_mapping`).
+
+    Aliases are interned in a sorted fixed width bytes array and the
+    group indices of each alias are stored in CSR form (`indptr`,
+    `groups`), so the index can be saved with :func:`write` and loaded
+    (memory-mapped) with :func:`read` without unpickling.
+    """
+
+    VERSION = 1
+
+    def __init__(self, keys, indptr, groups, lower=False):
+        self.keys = keys
+        self.indptr = indptr
+        self.groups = groups
+        self.lower = lower
+
+    @classmethod
+    def from_groups(cls, groups, lower=False):
+        """ Build the index from a list of sets of aliases. """
+        aliases = []
+        group_ids = []
+        for i, group in enumerate(groups):
+            if lower:
+                group = set(alias.lower() for alias in group)
+            else:
+                group = set(group)
+            aliases.extend(group)
+            group_ids.extend([i] * len(group))
+
+        keys, order = mmapstore.sorted_keys(aliases)
+        group_ids = numpy.array(group_ids, dtype=numpy.int32)[order]
+        keys, starts = numpy.unique(keys, return_index=True)
+        indptr = numpy.append(starts, len(group_ids)).astype(numpy.int64)
+        return cls(keys, indptr, group_ids, lower=lower)
+
+    @classmethod
+    def read(cls, path):
+        """
+        Load (memory-map) an index written with :func:`write`. Return
+        an (index, meta) tuple.
+        """
+        meta, arrays = mmapstore.read(path, version=cls.VERSION)
+        index = cls(arrays["keys"], arrays["indptr"], arrays["groups"],
+                    lower=meta["lower"])
+        return index, meta["user"]
+
+    def write(self, path, meta=None):
+        """ Save the index (and JSON serializable `meta`) to `path`. """
+        mmapstore.write(
+            path,
+            {"keys": self.keys, "indptr": self.indptr, "groups": self.groups},
+            meta={"lower": self.lower, "user": meta or {}},
+            version=self.VERSION)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def lookup(self, alias):
+        """ Return an array of indices of groups containing `alias`. """
+        if self.lower:
+            alias = alias.lower()
+        i = mmapstore.key_index(self.keys, alias)
+        if i < 0:
+            return self.groups[:0]
+        return self.groups[self.indptr[i]:self.indptr[i + 1]]
+
+    def lookup_many(self, aliases):
+        """
+        Look up a sequence of aliases at once. Return an (indptr, groups)
+        pair: groups of the i-th alias are groups[indptr[i]:indptr[i+1]].
+        """
+        if self.lower:
+            aliases = [alias.lower() for alias in aliases]
+        query = numpy.array([alias.encode("utf-8") for alias in aliases],
+                            dtype=bytes)
+        if not len(query) or not len(self.keys):
+            return (numpy.zeros(len(query) + 1, dtype=numpy.int64),
+                    self.groups[:0])
+        pos = numpy.searchsorted(self.keys, query)
+        pos = numpy.minimum(pos, len(self.keys) - 1)
+        found = self.keys[pos] == query
+        starts = self.indptr[pos][found]
+        counts = (self.indptr[pos + 1] - self.indptr[pos])[found]
+
+        indptr = numpy.zeros(len(query) + 1, dtype=numpy.int64)
+        indptr[1:][found] = counts
+        indptr = numpy.cumsum(indptr)
+        # positions of each result in self.groups
+        offsets = numpy.repeat(starts - indptr[:-1][found], counts)
+        take = numpy.arange(indptr[-1]) + offsets
+        return indptr, self.groups[take]
+
+
 class Matcher(object):
     """
     Matches an input gene to some target gene (set in advance).
@@ -472,6 +879,15 @@ class Matcher(object):
         mat = self.match(gene)
         return mat[0] if len(mat) == 1 else None
 
+    def match_many(self, genes):
+        """Return a list of matches (see :func:`match`) for each input gene."""
+        return [self.match(gene) for gene in genes]
+
+    def umatch_many(self, genes):
+        """Return a unique match (see :func:`umatch`) or None for each input gene."""
+        return [mat[0] if len(mat) == 1 else None
+                for mat in self.match_many(genes)]
+
     def explain(self, gene):
         """ 
         Return gene matches with explanations as lists of tuples:
@@ -529,6 +945,100 @@ def auto_pickle(filename, version, func, *args, **kwargs):
 
     return output
 
+ALIASES_VERSION = 1
+
+class AliasGroups(Sequence):
+    """
+    A read-only sequence of sets of aliases saved with
+    :func:`write_aliases`. Sets are decoded when accessed.
+    """
+
+    def __init__(self, blob, offsets, indptr):
+        self.strings = mmapstore.StringTable(blob, offsets)
+        self.indptr = indptr
+
+    def __len__(self):
+        return len(self.indptr) - 1
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        return set(self.strings[i] for i in
+                   range(self.indptr[index], self.indptr[index + 1]))
+
+    def __iter__(self):
+        # decode all aliases at once
+        data = self.strings.blob.tobytes()
+        offsets = self.strings.offsets.tolist()
+        aliases = [data[start:end].decode("utf-8")
+                   for start, end in zip(offsets[:-1], offsets[1:])]
+        indptr = self.indptr.tolist()
+        for start, end in zip(indptr[:-1], indptr[1:]):
+            yield set(aliases[start:end])
+
+def write_aliases(filename, aliases, version=None, index=None):
+    """
+    Save groups of gene aliases (a list of sets) and their lower case
+    :class:`AliasIndex` to `filename`. The file is replaced atomically,
+    so concurrent readers never see a partially written file.
+    """
+    groups = [sorted(group) for group in aliases]
+    blob, offsets = mmapstore.pack_strings(
+        [alias for group in groups for alias in group])
+    indptr = numpy.cumsum([0] + [len(group) for group in groups])
+    if index is None:
+        index = AliasIndex.from_groups(groups, lower=True)
+    mmapstore.write(
+        filename,
+        {"alias_blob": blob, "alias_offsets": offsets,
+         "group_indptr": indptr.astype(numpy.int64),
+         "keys": index.keys, "indptr": index.indptr, "groups": index.groups},
+        meta={"version": version},
+        version=ALIASES_VERSION)
+
+def read_aliases(filename, version=None):
+    """
+    Load (memory-map) aliases saved with :func:`write_aliases`. Return
+    a tuple of :class:`AliasGroups` and the lower case :class:`AliasIndex`.
+
+    Raise :class:`mmapstore.FormatError` if the file is not in the right
+    format or was saved for a different `version` (if not None).
+    """
+    meta, arrays = mmapstore.read(filename, version=ALIASES_VERSION)
+    if version != None and meta["version"] != version:
+        raise mmapstore.FormatError(
+            "%r has aliases version %r (expected %r)" %
+            (filename, meta["version"], version))
+    groups = AliasGroups(arrays["alias_blob"], arrays["alias_offsets"],
+                         arrays["group_indptr"])
+    index = AliasIndex(arrays["keys"], arrays["indptr"], arrays["groups"],
+                       lower=True)
+    return groups, index
+
+def auto_aliases(filename, version, func, *args, **kwargs):
+    """
+    Run function func (which returns groups of aliases) with given
+    arguments and save the results to a file named filename (see
+    :func:`write_aliases`). If results for a given filename AND version
+    were already saved, just load and return them.
+
+    Return a tuple of groups of aliases and their lower case alias index.
+    """
+    try:
+        return read_aliases(filename, version)
+    except (IOError, OSError, ValueError):
+        pass
+
+    aliases = [set(group) for group in func(*args, **kwargs)]
+    index = AliasIndex.from_groups(aliases, lower=True)
+    try:
+        write_aliases(filename, aliases, version, index=index)
+    except (IOError, OSError) as err:
+        warnings.warn("Could not save gene aliases (%s)" % err, UserWarning)
+    return aliases, index
+
 class MatcherAliases(Matcher):
     """
     Genes matcher based on a list of sets of given aliases.
@@ -540,26 +1050,33 @@ class MatcherAliases(Matcher):
     def __init__(self, aliases, ignore_case=True):
         self.aliases = aliases
         self.ignore_case = ignore_case
-        self.mdict = create_mapping(self.aliases, self.ignore_case)
+        self.alias_index = AliasIndex.from_groups(self.aliases,
+                                                  self.ignore_case)
+
+    @property
+    def mdict(self):
+        """ A dictionary of aliases to group ids (see :func:`create_mapping`).
+        Kept for backward compatibility; use `alias_index` instead. """
+        if not getattr(self, "saved_mdict", None):
+            self.saved_mdict = create_mapping(self.aliases, self.ignore_case)
+        return self.saved_mdict
 
     def to_ids(self, gene):
         """ Return ids of sets of aliases the gene belongs to. """
-        if self.ignore_case:
-            gene = gene.lower()
-        return self.mdict[gene]
+        return self.alias_index.lookup(gene).tolist()
 
     def set_targets(self, targets):
         """
         A reverse dictionary is made according to each target's membership
         in the sets of aliases.
         """
+        targets = list(targets)
+        indptr, ids = self.alias_index.lookup_many(targets)
         d = defaultdict(list)
         #d = id: [ targets ], where id is index of the set of aliases
-        for target in targets:
-            ids = self.to_ids(target)
-            if ids != None:
-                for id in ids:
-                    d[id].append(target)
+        for target, start, end in zip(targets, indptr[:-1], indptr[1:]):
+            for id in ids[start:end].tolist():
+                d[id].append(target)
         mo = MatchAliases(d, self)
         self.matcho = mo #backward compatibility - default match object
         return mo
@@ -567,6 +1084,8 @@ class MatcherAliases(Matcher):
     #this two functions are solely for backward compatibility
     def match(self, gene):
         return self.matcho.match(gene)
+    def match_many(self, genes):
+        return self.matcho.match_many(genes)
     def explain(self, gene):
         return self.matcho.explain(gene)
 
@@ -576,6 +1095,20 @@ class Match(object):
         """Returns an unique (only one matching target) target or None"""
         mat = self.match(gene)
         return mat[0] if len(mat) == 1 else None
+
+    def match_many(self, genes):
+        """Returns a list of matching targets for each gene"""
+        return [self.match(gene) for gene in genes]
+
+    def _match_many(self, genes):
+        # like match_many, but with None for genes without matches, which
+        # avoids allocating (and garbage collecting) many empty lists
+        return [m or None for m in self.match_many(genes)]
+
+    def umatch_many(self, genes):
+        """Returns an unique target or None for each gene"""
+        return [mat[0] if len(mat) == 1 else None
+                for mat in self.match_many(genes)]
  
 class MatchAliases(Match):
 
@@ -589,15 +1122,45 @@ class MatchAliases(Match):
         it. Target genes from the same sets of aliases are returned
         as input's match.
         """
-        inputgeneids = self.parent.to_ids(gene)
-        #return target genes with same ids
-        return list(set( \
-            reduce(lambda x,y: x+y, 
-                [ self.to_targets[igid] for igid in inputgeneids ], [])))
+        targets = self._targets(self.parent.to_ids(gene))
+        return targets if targets is not None else []
+
+    def match_many(self, genes):
+        """
+        Match a sequence of genes at once; the aliases of all genes are
+        looked up in a single pass over the alias index.
+        """
+        return [m if m is not None else [] for m in self._match_many(genes)]
+
+    def _match_many(self, genes):
+        indptr, ids = self.parent.alias_index.lookup_many(list(genes))
+        # only genes in groups with some targets need to be looked at
+        hit = numpy.isin(ids, numpy.fromiter(self.to_targets, dtype=int))
+        hits = numpy.append(0, numpy.cumsum(hit))
+        # the (hit) group ids of the i-th gene are ids[hits[i]:hits[i+1]]
+        hits = hits[indptr].tolist()
+        ids = ids[hit].tolist()
+        matches = [None] * (len(indptr) - 1)
+        for i in numpy.flatnonzero(numpy.diff(hits)).tolist():
+            matches[i] = self._targets(ids[hits[i]:hits[i + 1]])
+        return matches
+
+    def _targets(self, inputgeneids):
+        #return target genes with same ids (None if there are none)
+        found = [self.to_targets[igid] for igid in inputgeneids
+                 if self.to_targets.get(igid)]
+        if not found:
+            return None
+        if len(found) == 1:
+            return list(set(found[0]))
+        return list(set(target for targets in found for target in targets))
 
     def explain(self, gene):
         inputgeneids = self.parent.to_ids(gene)
-        return [ (self.to_targets[igid], self.parent.aliases[igid]) for igid in inputgeneids ]
+        # do not use [] on the (defaultdict) to_targets: it would add
+        # empty groups which would then count as matches
+        return [(self.to_targets.get(igid, []), self.parent.aliases[igid])
+                for igid in inputgeneids]
 
 class MatcherAliasesPickled(MatcherAliases):
     """
@@ -606,6 +1169,9 @@ class MatcherAliasesPickled(MatcherAliases):
     "create_aliases_version" and "create_aliases". Those are crucial for
     pickling of gene aliases to work.
 
+    Aliases are saved with :func:`write_aliases` together with their
+    lower case index and are memory-mapped when loaded.
+
     Loading of gene aliases is done lazily: they are loaded when they are
     needed. Loading of aliases for components of joined matchers is often 
     unnecessary and is therefore avoided. 
@@ -633,6 +1199,17 @@ class MatcherAliasesPickled(MatcherAliases):
 
     mdict = property(get_mdict, set_mdict)
 
+    def get_alias_index(self):
+        """ Creates (or loads) the alias index. Aliases are loaded if needed. """
+        if self.saved_alias_index is None:
+            self.saved_alias_index = self.load_alias_index()
+        return self.saved_alias_index
+
+    def set_alias_index(self, index):
+        self.saved_alias_index = index
+
+    alias_index = property(get_alias_index, set_alias_index)
+
     def set_targets(self, targets):
         return MatcherAliases.set_targets(self, targets)
 
@@ -654,16 +1231,34 @@ class MatcherAliasesPickled(MatcherAliases):
         if fn != None:
             if isinstance(fn, tuple): #if you pass tuple, look directly
                filename = fn[0]
+               if not mmapstore.is_store(filename):
+                   #aliases pickled with auto_pickle
+                   return auto_pickle(filename, ver, self.create_aliases)
             else:
                filename = os.path.join(buffer_path(), fn)
-            return auto_pickle(filename, ver, self.create_aliases)
+            aliases, index = auto_aliases(filename, ver, self.create_aliases)
+            if self.ignore_case and self.saved_alias_index is None:
+                self.saved_alias_index = index
+            return aliases
         else:
             #if either file version of version is None, do not pickle
             return self.create_aliases()
 
+    def load_alias_index(self):
+        """
+        Return the alias index. The lower case index is saved with the
+        aliases, so it is only built if the aliases are not saved or
+        case is not ignored.
+        """
+        aliases = self.aliases
+        if self.saved_alias_index is not None:
+            return self.saved_alias_index
+        return AliasIndex.from_groups(aliases, self.ignore_case)
+
     def __init__(self, ignore_case=True):
         self.aliases = []
         self.mdict = {}
+        self.alias_index = None
         self.ignore_case = ignore_case
         self.filename() # test if valid filename can be built
 
@@ -839,13 +1434,39 @@ class MatcherAliasesEnsembl(MatcherAliasesPickled):
         return dset_name, self.DEF_ATTRS
         
 
+class _GeneInfoAliases(Sequence):
+    """ Sets of aliases of genes (lines) in a gene info index. """
+
+    def __init__(self, index):
+        self._index = index
+
+    def __len__(self):
+        return len(self._index.arrays["line_start"])
+
+    def __getitem__(self, number):
+        return _gene_aliases(self._index.line(number))
+
+class _MatcherGeneInfo(MatcherAliases):
+    """
+    Matches gene names to NCBI gene ids using the names index of
+    :class:`NCBIGeneInfo` (equivalent to GMNCBI, but does not need
+    to load or save the aliases).
+    """
+
+    def __init__(self, index):
+        self.aliases = _GeneInfoAliases(index)
+        self.ignore_case = True
+        self.alias_index = index.names
+
 class MatcherAliasesPickledJoined(MatcherAliasesPickled):
     """
     Creates a new matcher by joining gene aliases from different data sets.
-    Sets of aliases are joined if they contain common genes.
+    Sets of aliases are joined if they contain common genes (see
+    :func:`join_aliases`).
 
     The joined gene matcher can only be pickled if the source gene
-    matchers are picklable.
+    matchers are picklable. Joined aliases are saved under the same
+    name regardless of the order of the source matchers.
     """
 
     def filename(self):
@@ -859,11 +1480,11 @@ class MatcherAliasesPickledJoined(MatcherAliasesPickled):
             return None
 
     def create_aliases(self):
-        return join_sets_l([ mat.aliases for mat in self.matchers ], lower=self.ignore_case)
+        return join_aliases([ mat.aliases for mat in self.matchers ], lower=self.ignore_case)
 
     def create_aliases_version(self):
         try:
-            return "v4_" + "__".join([ mat.create_aliases_version() for mat in self.matchers ])
+            return "v5_" + "__".join([ mat.create_aliases_version() for mat in self.matchers ])
         except:
             return None
 
@@ -874,8 +1495,12 @@ class MatcherAliasesPickledJoined(MatcherAliasesPickled):
 
         If ignore_case is True, ignores case when joining gene aliases.
         """
-        #FIXME: sorting of matchers to avoid multipying pickled files for
-        #different orderings.
+        #sort matchers to avoid multiplying saved files for different
+        #orderings; the join itself does not depend on the order
+        try:
+            matchers = sorted(matchers, key=lambda m: str(m.filename()))
+        except:
+            matchers = list(matchers)
         self.matchers = matchers
         allic = set([ m.ignore_case for m in self.matchers ])
         if len(allic) > 1:
@@ -888,18 +1513,35 @@ class MatcherSequence(Matcher):
     """
     Each gene goes through sequence of gene matchers (in the same order
     as in the matchers arguments) until a match is found.
+
+    Match objects for the last few sets of targets are memoized, so
+    setting the same targets again is free.
     """
-    
+
+    #: Number of memoized sets of targets.
+    cache_size = 4
+
     def __init__(self, matchers):
         self.matchers = matchers
+        self._matches = OrderedDict()
 
     def set_targets(self, targets):
-        ms = []
         targets = list(targets) #copy targets as multiple use would
                                 #be problematic if a generator was passed
-        for matcher in self.matchers:
-            ms.append(matcher.set_targets(targets))
-        om = MatchSequence(ms)
+        key = tuple(targets)
+        om = self._matches.pop(key, None)
+        if om is None:
+            ms = []
+            for matcher in self.matchers:
+                ms.append(matcher.set_targets(targets))
+            om = MatchSequence(ms, targets)
+        else:
+            # point the components back to the memoized match objects
+            for matcher, mo in zip(self.matchers, om.ms):
+                matcher.matcho = mo
+        self._matches[key] = om
+        while len(self._matches) > self.cache_size:
+            self._matches.popitem(last=False)
         self.matcho = om
         return om
 
@@ -910,10 +1552,22 @@ class MatcherSequence(Matcher):
     def explain(self, gene):
         return self.matcho.explain(gene)
 
+    def match_many(self, genes):
+        return self.matcho.match_many(genes)
+
+    def umatch_many(self, genes):
+        return self.matcho.umatch_many(genes)
+
+    def resolve(self, genes):
+        return self.matcho.resolve(genes)
+
 class MatchSequence(Match):
 
-    def __init__(self, ms):
+    def __init__(self, ms, targets=None):
         self.ms = ms
+        self.targets = targets
+        self._target_index = None
+        self._resolved = None
 
     def match(self, gene):
         for match in self.ms:
@@ -922,6 +1576,66 @@ class MatchSequence(Match):
                 return m
         return []
 
+    def match_many(self, genes):
+        """
+        Match a sequence of genes at once: all genes are passed to the
+        first stage in bulk, those without a match to the next, and so on.
+        """
+        return [m if m is not None else [] for m in self._match_many(genes)]
+
+    def _match_many(self, genes):
+        genes = list(genes)
+        matches = [None] * len(genes)
+        remaining = list(range(len(genes)))
+        for match in self.ms:
+            if not remaining:
+                break
+            found = match._match_many([genes[i] for i in remaining])
+            unmatched = []
+            for i, m in zip(remaining, found):
+                if m:
+                    matches[i] = m
+                else:
+                    unmatched.append(i)
+            remaining = unmatched
+        return matches
+
+    def umatch_many(self, genes):
+        if self.targets is None:
+            return Match.umatch_many(self, genes)
+        indices, _ = self.resolve(genes)
+        return [self.targets[i] if i >= 0 else None for i in indices.tolist()]
+
+    def resolve(self, genes):
+        """
+        Resolve a list of genes against the targets in a single pass.
+
+        Return a pair of arrays: the position in `targets` of the unique
+        matching target of each gene (-1 if there is none) and a boolean
+        array that is True for genes matching multiple targets. The
+        result for the last list of genes is memoized.
+        """
+        if self.targets is None:
+            raise ValueError("targets are not known")
+        genes = tuple(genes)
+        if self._resolved is not None and self._resolved[0] == genes:
+            return self._resolved[1]
+
+        if self._target_index is None:
+            self._target_index = {}
+            for i, target in enumerate(self.targets):
+                self._target_index.setdefault(target, i)
+
+        matches = self._match_many(genes)
+        indices = numpy.array(
+            [self._target_index[m[0]] if m is not None and len(m) == 1
+             else -1 for m in matches], dtype=int)
+        ambiguous = numpy.array(
+            [m is not None and len(m) > 1 for m in matches], dtype=bool)
+        indices.flags.writeable = ambiguous.flags.writeable = False
+        self._resolved = (genes, (indices, ambiguous))
+        return indices, ambiguous
+
     def explain(self, gene):
         for match in self.ms:
             m = match.match(gene)
@@ -948,6 +1662,8 @@ class MatcherDirect(Matcher):
     #this two functions are solely for backward compatibility
     def match(self, gene):
         return self.matcho.match(gene)
+    def match_many(self, genes):
+        return self.matcho.match_many(genes)
     def explain(self, gene):
         return self.matcho.explain(gene)
 
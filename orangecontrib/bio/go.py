@@ -31,6 +31,14 @@ from gzip import GzipFile
 from collections import defaultdict
 from operator import attrgetter
 
+try:
+    from collections.abc import Mapping, Sequence
+except ImportError:
+    from collections import Mapping, Sequence
+
+import numpy
+import scipy.sparse
+
 from orangecontrib.bio.utils import progress_bar_milestones
 
 try:
@@ -47,6 +55,7 @@ except NameError:
 
 from orangecontrib.bio.utils import serverfiles
 from orangecontrib.bio.utils import stats
+from orangecontrib.bio.utils import mmapstore
 
 from orangecontrib.bio import gene as obiGene, taxonomy as obiTaxonomy
 
@@ -267,6 +276,223 @@ class Instance(OBOObject):
     pass
 
 
+_OBO_ID_RE = re.compile(r"^id:([^!{\n]*)", re.MULTILINE)
+
+
+class _SnapshotTerms(Mapping):
+    """
+    A read-only {term_id: :class:`Term`} mapping backed by an ontology
+    snapshot. :class:`Term` instances are parsed on first access.
+    """
+    def __init__(self, ontology, meta, arrays):
+        self._ontology = ontology
+        self._keys = arrays["term_keys"]
+        self._stanzas = mmapstore.StringTable(arrays["stanza_blob"],
+                                              arrays["stanza_offsets"])
+        self._children = (arrays["child_indptr"], arrays["child_indices"],
+                          arrays["child_types"])
+        self._subsets = (arrays["subset_indptr"], arrays["subset_indices"])
+        self._rel_types = [intern(str(rel)) for rel in meta["rel_types"]]
+        self._subset_names = meta["subsets"]
+        self._cache = {}
+
+    def index(self, term_id):
+        """Return the integer index of `term_id` (or -1 if not present)."""
+        return mmapstore.key_index(self._keys, term_id)
+
+    def key(self, index):
+        """Return the term id at integer `index`."""
+        return intern(str(self._keys[index].decode("utf-8")))
+
+    def __getitem__(self, term_id):
+        term = self._cache.get(term_id)
+        if term is None:
+            i = self.index(term_id)
+            if i < 0:
+                raise KeyError(term_id)
+            term = Term(self._stanzas[i], self._ontology)
+            indptr, indices, types = self._children
+            start, end = indptr[i], indptr[i + 1]
+            term.related_to = set(
+                (self._rel_types[rel], self.key(child))
+                for child, rel in zip(indices[start:end], types[start:end]))
+            self._cache[term_id] = term
+        return term
+
+    def __contains__(self, term_id):
+        return term_id in self._cache or self.index(term_id) >= 0
+
+    def __iter__(self):
+        for key in self._keys.tolist():
+            yield key.decode("utf-8")
+
+    def __len__(self):
+        return len(self._keys)
+
+    def named_subset(self, subset):
+        """Return a list of term ids in a named `subset`."""
+        if subset not in self._subset_names:
+            return []
+        subset = self._subset_names.index(subset)
+        indptr, indices = self._subsets
+        terms = numpy.repeat(numpy.arange(len(self)), numpy.diff(indptr))
+        return [self.key(i) for i in terms[indices == subset]]
+
+
+class _TermClosure(object):
+    """
+    A transitive closure index of the ontology DAG (following all
+    relationship types). The (strict) ancestors and descendants of the
+    terms are stored as CSR (indptr, indices) arrays indexed by the term's
+    position in the sorted `keys` array.
+    """
+    #: Names of the arrays (stored in the ontology snapshot).
+    ARRAYS = ["ancestor_indptr", "ancestor_indices", "descendant_indptr",
+              "descendant_indices", "term_depth"]
+
+    def __init__(self, terms, keys, arrays):
+        self.terms = terms
+        self.keys = keys
+        self.arrays = arrays
+        self.ids = [intern(str(key.decode("utf-8")))
+                    for key in keys.tolist()]
+        self.parents = (arrays["parent_indptr"], arrays["parent_indices"])
+        self.ancestors = (arrays["ancestor_indptr"],
+                          arrays["ancestor_indices"])
+        self.descendants = (arrays["descendant_indptr"],
+                            arrays["descendant_indices"])
+        self.depth = arrays["term_depth"]
+        self._slims = None
+        self._slims_mask = None
+        self._slims_cache = {}
+
+    @classmethod
+    def from_terms(cls, terms):
+        """Build the index for a {term_id: :class:`Term`} mapping."""
+        ids = list(terms)
+        keys, order = mmapstore.sorted_keys(ids)
+        index = dict((ids[i], k) for k, i in enumerate(order))
+        parents = [sorted(set(index[p] for _, p in terms[ids[i]].related))
+                   for i in order]
+        arrays = {"parent_indices": numpy.array(
+            [p for l in parents for p in l], dtype=numpy.int32)}
+        arrays["parent_indptr"] = numpy.zeros(len(ids) + 1, dtype=numpy.int64)
+        arrays["parent_indptr"][1:] = numpy.cumsum([len(l) for l in parents])
+        arrays.update(cls.build(arrays["parent_indptr"],
+                                arrays["parent_indices"]))
+        return cls(terms, keys, arrays)
+
+    @staticmethod
+    def build(parent_indptr, parent_indices):
+        """
+        Compute the closure arrays from the parents CSR arrays.
+        """
+        n = len(parent_indptr) - 1
+        parents = [parent_indices[parent_indptr[i]:parent_indptr[i + 1]]
+                   .tolist() for i in range(n)]
+        children = [[] for _ in range(n)]
+        for i, ps in enumerate(parents):
+            for p in ps:
+                children[p].append(i)
+
+        # Ancestors in topological order (parents before children).
+        ancestors = [None] * n
+        pending = [len(set(ps)) for ps in parents]
+        queue = [i for i in range(n) if not pending[i]]
+        while queue:
+            i = queue.pop()
+            ancestors[i] = frozenset(parents[i]).union(
+                *[ancestors[p] for p in parents[i]])
+            for c in set(children[i]):
+                pending[c] -= 1
+                if not pending[c]:
+                    queue.append(c)
+
+        # Terms on a cycle (should not happen in a valid ontology).
+        for i in range(n):
+            if ancestors[i] is None:
+                visited, queue = set(), list(parents[i])
+                while queue:
+                    p = queue.pop()
+                    if p not in visited:
+                        visited.add(p)
+                        queue.extend(parents[p])
+                ancestors[i] = frozenset(visited)
+
+        # The minimum depth (a breadth first search from the root terms).
+        depth = numpy.ones(n, dtype=numpy.int32)
+        level = [i for i in range(n) if not parents[i]]
+        seen = set(level)
+        d = 1
+        while level:
+            d += 1
+            level = [c for i in level for c in children[i] if c not in seen]
+            seen.update(level)
+            depth[level] = d
+
+        indptr = numpy.zeros(n + 1, dtype=numpy.int64)
+        indptr[1:] = numpy.cumsum([len(a) for a in ancestors])
+        indices = numpy.array([j for a in ancestors for j in sorted(a)],
+                              dtype=numpy.int32)
+        transposed = scipy.sparse.csr_matrix(
+            (numpy.ones(len(indices), dtype=numpy.int8), indices, indptr),
+            shape=(n, n)).T.tocsr()
+        transposed.sort_indices()
+        return {"ancestor_indptr": indptr, "ancestor_indices": indices,
+                "descendant_indptr": transposed.indptr.astype(numpy.int64),
+                "descendant_indices": transposed.indices.astype(numpy.int32),
+                "term_depth": depth}
+
+    def index(self, term_id):
+        """Return the index of `term_id` (or -1 if not present)."""
+        return mmapstore.key_index(self.keys, term_id)
+
+    def _ids(self, csr, i):
+        indptr, indices = csr
+        ids = self.ids
+        return [ids[j] for j in indices[indptr[i]:indptr[i + 1]].tolist()]
+
+    def ancestor_ids(self, i):
+        return self._ids(self.ancestors, i)
+
+    def descendant_ids(self, i):
+        return self._ids(self.descendants, i)
+
+    def slims(self, i, slims_subset):
+        """
+        Return the most specific terms in `slims_subset` reachable from
+        the term at index `i` (results are cached for a `slims_subset`).
+        """
+        if self._slims != slims_subset:
+            self._slims = frozenset(slims_subset)
+            self._slims_mask = numpy.zeros(len(self.ids), dtype=bool)
+            self._slims_mask[[j for j in map(self.index, self._slims)
+                              if j >= 0]] = True
+            self._slims_cache = {}
+        return [self.ids[j] for j in self._slims_indices(i)]
+
+    def _slims_indices(self, i):
+        result = self._slims_cache.get(i)
+        if result is None:
+            mask = self._slims_mask
+            indptr, indices = self.ancestors
+            ancestors = indices[indptr[i]:indptr[i + 1]]
+            candidates = ancestors[mask[ancestors]]
+            if len(candidates) <= 1:
+                result = frozenset(candidates.tolist())
+            else:
+                indptr, indices = self.parents
+                result = set()
+                for p in indices[indptr[i]:indptr[i + 1]].tolist():
+                    if mask[p]:
+                        result.add(p)
+                    else:
+                        result.update(self._slims_indices(p))
+                result = frozenset(result)
+            self._slims_cache[i] = result
+        return result
+
+
 class Ontology(object):
     """
     :class:`Ontology` is the class representing a gene ontology.
@@ -286,6 +512,11 @@ class Ontology(object):
         >>> # Load the ontology at the specified CVS revision.
         >>> ontology = Ontology(rev="5.2092")
 
+    When loading the default (or a revision) ontology, a binary snapshot
+    of the parsed file is stored next to it on first use and memory-mapped
+    on subsequent loads; :class:`Term` objects are then only created when
+    accessed.
+
     """
     version = 1
 
@@ -297,6 +528,7 @@ class Ontology(object):
         self.alias_mapper = {}
         self.reverse_alias_mapper = defaultdict(set)
         self.header = ""
+        self._closure = None
 
         if filename is not None:
             self.parse_file(filename, progress_callback)
@@ -311,14 +543,14 @@ class Ontology(object):
                                     "gene_ontology_edit@rev%s.obo" % rev)
             if not os.path.exists(filename):
                 self.download_ontology_at_rev(rev, filename, pc)
-            self.parse_file(filename,
-                            lambda v: progress_callback(v / 2.0 + 50)
-                            if progress_callback else None)
+            self._parse_file_cached(filename,
+                                    lambda v: progress_callback(v / 2.0 + 50)
+                                    if progress_callback else None)
         else:
             filename = serverfiles.localpath_download(
                 "GO", "gene_ontology_edit.obo.tar.gz"
             )
-            self.parse_file(filename, progress_callback)
+            self._parse_file_cached(filename, progress_callback)
 
     @classmethod
     def load(cls, progress_callback=None):
@@ -341,6 +573,13 @@ class Ontology(object):
         object. The optional progressCallback will be called with a single
         argument to report on the progress.
         """
+        header, blocks = self._read_blocks(file)
+        self._parse_blocks(header, blocks, progress_callback)
+
+    @staticmethod
+    def _read_blocks(file):
+        """ Return the header and a list of stanzas of an OBO file.
+        """
         if isinstance(file, basestring):
             if os.path.isfile(file) and tarfile.is_tarfile(file):
                 f = tarfile.open(file).extractfile("gene_ontology_edit.obo")
@@ -355,9 +594,16 @@ class Ontology(object):
 
         data = [line.decode() if not isinstance(line, str) else line for line in f.readlines()]
         data = "".join([line for line in data if not line.startswith("!")])
-        self.header = data[: data.index("[Term]")]
+        header = data[: data.index("[Term]")]
         c = re.compile("\[.+?\].*?\n\n", re.DOTALL)
-        data = c.findall(data)
+        return header, c.findall(data)
+
+    def _parse_blocks(self, header, data, progress_callback=None):
+        if not isinstance(self.terms, dict):
+            # a lazily loaded snapshot
+            self.terms = dict(self.terms.items())
+        self.header = header
+        self._closure = None
 
         milestones = progress_bar_milestones(len(data), 90)
         for i, block in enumerate(builtinOBOObjects + data):
@@ -388,6 +634,139 @@ class Ontology(object):
             if progress_callback and i in milestones:
                 progress_callback(90.0 + 10.0 * i / len(self.terms))
 
+    #: Version of the binary ontology snapshot format.
+    SNAPSHOT_VERSION = 2
+
+    def _parse_file_cached(self, filename, progress_callback=None):
+        """ Load the ontology from a binary snapshot stored next to
+        `filename`. If the snapshot is missing or out of date parse the
+        file and (re)create the snapshot.
+
+        Terms in a snapshot are only created (parsed) when accessed.
+        """
+        snapshot = filename + ".snapshot"
+        source = mmapstore.file_stamp(filename)
+        try:
+            meta, arrays = mmapstore.read(snapshot,
+                                          version=self.SNAPSHOT_VERSION)
+            if meta.get("source") != source:
+                raise mmapstore.FormatError("%r is out of date" % snapshot)
+        except (IOError, OSError, ValueError):
+            header, blocks = self._read_blocks(filename)
+            self._parse_blocks(header, blocks, progress_callback)
+            try:
+                self._write_snapshot(snapshot, source, blocks)
+            except (IOError, OSError) as err:
+                warnings.warn("Could not write the ontology snapshot (%s)" %
+                              err, UserWarning)
+        else:
+            self._load_snapshot(meta, arrays)
+            if progress_callback:
+                progress_callback(100.0)
+
+    def _write_snapshot(self, path, source, blocks):
+        stanzas = {}
+        for block in blocks:
+            if block.startswith("[Term]"):
+                match = _OBO_ID_RE.search(block)
+                if match is not None:
+                    stanzas[match.group(1).strip()] = block
+
+        ids = list(self.terms)
+        keys, order = mmapstore.sorted_keys(ids)
+        ids = [ids[i] for i in order]
+        index = dict((id, i) for i, id in enumerate(ids))
+
+        rel_types = sorted(set(rel for term in self.terms.values()
+                               for rel, _ in term.related))
+        rel_index = dict((rel, i) for i, rel in enumerate(rel_types))
+        subsets = sorted(set(subset for term in self.terms.values()
+                             for subset in getattr(term, "subset", [])))
+        subset_index = dict((subset, i) for i, subset in enumerate(subsets))
+
+        def csr(lists, dtype=numpy.int32):
+            indptr = numpy.zeros(len(lists) + 1, dtype=numpy.int64)
+            indptr[1:] = numpy.cumsum([len(l) for l in lists])
+            indices = numpy.array([i for l in lists for i in l], dtype=dtype)
+            return indptr, indices
+
+        terms = [self.terms[id] for id in ids]
+        parents = [sorted((index[p], rel_index[r]) for r, p in t.related)
+                   for t in terms]
+        children = [sorted((index[c], rel_index[r]) for r, c in t.related_to)
+                    for t in terms]
+        arrays = {"term_keys": keys}
+        arrays["parent_indptr"], arrays["parent_indices"] = \
+            csr([[p for p, _ in l] for l in parents])
+        closure = self._term_closure()
+        for name in _TermClosure.ARRAYS:
+            arrays[name] = closure.arrays[name]
+        _, arrays["parent_types"] = \
+            csr([[r for _, r in l] for l in parents], numpy.int16)
+        arrays["child_indptr"], arrays["child_indices"] = \
+            csr([[c for c, _ in l] for l in children])
+        _, arrays["child_types"] = \
+            csr([[r for _, r in l] for l in children], numpy.int16)
+        arrays["subset_indptr"], arrays["subset_indices"] = \
+            csr([[subset_index[s] for s in getattr(t, "subset", [])]
+                 for t in terms], numpy.int16)
+        arrays["stanza_blob"], arrays["stanza_offsets"] = \
+            mmapstore.pack_strings([stanzas.get(id) or repr(self.terms[id])
+                                    for id in ids])
+
+        alt_keys, alt_order = mmapstore.sorted_keys(list(self.alias_mapper))
+        alt_ids = list(self.alias_mapper)
+        arrays["alt_keys"] = alt_keys
+        arrays["alt_terms"] = numpy.array(
+            [index[self.alias_mapper[alt_ids[i]]] for i in alt_order],
+            dtype=numpy.int32)
+
+        typedefs = [block for block in builtinOBOObjects + blocks
+                    if block.startswith("[Typedef]")]
+        instances = [block for block in blocks
+                     if block.startswith("[Instance]")]
+        meta = {"source": source, "header": self.header,
+                "rel_types": rel_types, "subsets": subsets,
+                "typedefs": typedefs, "instances": instances}
+        mmapstore.write(path, arrays, meta, version=self.SNAPSHOT_VERSION)
+
+    def _load_snapshot(self, meta, arrays):
+        self.header = meta["header"]
+        for block in meta["typedefs"]:
+            typedef = Typedef(block, self)
+            self.typedefs[typedef.id] = typedef
+        for block in meta["instances"]:
+            instance = Instance(block, self)
+            self.instances[instance.id] = instance
+
+        self.terms = _SnapshotTerms(self, meta, arrays)
+        keys = arrays["term_keys"]
+        self.alias_mapper = dict(
+            (alt.decode("utf-8"), keys[term].decode("utf-8"))
+            for alt, term in zip(arrays["alt_keys"].tolist(),
+                                 arrays["alt_terms"].tolist()))
+        self.reverse_alias_mapper = defaultdict(set)
+        self._closure = _TermClosure(self.terms, keys, arrays)
+
+    def _term_closure(self):
+        """
+        Return the transitive closure index of the ontology. The index is
+        (re)built if the terms changed since it was last built.
+        """
+        closure = self._closure
+        if closure is None or closure.terms is not self.terms or \
+                len(closure.ids) != len(self.terms):
+            closure = self._closure = _TermClosure.from_terms(self.terms)
+        return closure
+
+    def _term_index(self, closure, term):
+        i = closure.index(term)
+        if i < 0 and term in self.alias_mapper:
+            i = closure.index(self.alias_mapper[term])
+        if i < 0:
+            raise KeyError(term)
+        return i
+
     def defined_slims_subsets(self):
         """
         Return a list of defined subsets in the ontology.
@@ -408,6 +787,8 @@ class Ontology(object):
         .. seealso:: :func:`defined_slims_subsets`
 
         """
+        if isinstance(self.terms, _SnapshotTerms):
+            return self.terms.named_subset(subset)
         return [id for id, term in self.terms.items()
                 if subset in getattr(term, "subset", set())]
 
@@ -435,18 +816,11 @@ class Ontology(object):
         :param str term: Term ID.
 
         """
-        queue = set([term])
-        visited = set()
-        slims = set()
-        while queue:
-            term = queue.pop()
-            visited.add(term)
-            if term in self.slims_subset:
-                slims.add(term)
-            else:
-                queue.update(set(tid for _, tid in self[term].related) -
-                             visited)
-        return slims
+        if term in self.slims_subset:
+            return set([term])
+        closure = self._term_closure()
+        return set(closure.slims(self._term_index(closure, term),
+                                 self.slims_subset))
 
     def extract_super_graph(self, terms):
         """
@@ -456,13 +830,11 @@ class Ontology(object):
 
         """
         terms = [terms] if isinstance(terms, basestring) else terms
-        visited = set()
-        queue = set(terms)
-        while queue:
-            term = queue.pop()
-            visited.add(term)
-            queue.update(set(tid for _, tid in self[term].related) -
-                         visited)
+        closure = self._term_closure()
+        visited = set(terms)
+        for term in terms:
+            visited.update(
+                closure.ancestor_ids(self._term_index(closure, term)))
         return visited
 
     def extract_sub_graph(self, terms):
@@ -473,27 +845,22 @@ class Ontology(object):
 
         """
         terms = [terms] if type(terms) == str else terms
-        visited = set()
-        queue = set(terms)
-        while queue:
-            term = queue.pop()
-            visited.add(term)
-            queue.update(set(tid for _, tid in self[term].related_to) -
-                         visited)
+        closure = self._term_closure()
+        visited = set(terms)
+        for term in terms:
+            visited.update(
+                closure.descendant_ids(self._term_index(closure, term)))
         return visited
 
-    def term_depth(self, term, cache_={}):
+    def term_depth(self, term):
         """
         Return the minimum depth of a `term`.
 
         (length of the shortest path to this term from the top level term).
 
         """
-        if term not in cache_:
-            cache_[term] = min([self.term_depth(parent) + 1
-                                for _, parent in self[term].related] or
-                               [1])
-        return cache_[term]
+        closure = self._term_closure()
+        return int(closure.depth[self._term_index(closure, term)])
 
     def __getitem__(self, termid):
         """
@@ -620,6 +987,329 @@ class AnnotationRecord(_AnnotationRecordBase):
         return list(map(intern, self.DB_Object_Synonym.split("|")))
 
 
+#: A binary gene x term annotation `matrix` (:class:`scipy.sparse.csr_matrix`)
+#: with annotations propagated to all super terms, the `reach` matrix of
+#: super terms of the genes' direct annotations, the row (gene) and column
+#: (term) labels and the mappings from labels to indices.
+TermIncidence = namedtuple(
+    "TermIncidence",
+    ["matrix", "reach", "genes", "terms", "gene_index", "term_index"]
+)
+
+
+def _aspects_set(aspect):
+    if aspect is None:
+        return set(["P", "C", "F"])
+    elif isinstance(aspect, basestring):
+        return set([aspect])
+    else:
+        return set(aspect)
+
+
+def _p_values(prob, k, N, m, n):
+    """
+    Return `prob.p_value(k, N, m, n)` for all elements of arrays `k`, `m`
+    and `n`.
+    """
+    if hasattr(prob, "p_values"):
+        return prob.p_values(k, N, m, n)
+    k, m, n = numpy.broadcast_arrays(k, m, n)
+    return numpy.array([prob.p_value(int(k_), N, int(m_), int(n_))
+                        for k_, m_, n_ in zip(k, m, n)])
+
+
+def _fdr_adjusted(res):
+    """
+    Return the enriched terms dictionary `res` with FDR adjusted p-values.
+    """
+    res = sorted(res.items(), key=lambda x: x[1][1])
+    return dict([(id, (genes, p, ref))
+                 for (id, (genes, _, ref)), p in
+                 zip(res, stats.FDR([p for _, (_, p, _) in res]))])
+
+
+class _EnrichmentScorer(object):
+    """
+    Score query gene lists against a fixed reference using a
+    :class:`TermIncidence`.
+    """
+    def __init__(self, incidence, reference, prob, terms_mask=None):
+        self.incidence = incidence
+        self.reference = reference
+        self.prob = prob
+        self.terms_mask = terms_mask
+
+        gene_index = incidence.gene_index
+        ref_vec = numpy.zeros(len(incidence.genes))
+        ref_vec[[gene_index[g] for g in reference if g in gene_index]] = 1
+        self.ref_counts = \
+            incidence.matrix.T.dot(ref_vec).round().astype(int)
+
+    def query(self, genes):
+        """
+        Return a (rows, reference_rows, size) query tuple for a set of
+        (translated) `genes`.
+        """
+        gene_index = self.incidence.gene_index
+        rows = [gene_index[g] for g in genes if g in gene_index]
+        ref_rows = [gene_index[g] for g in genes
+                    if g in gene_index and g in self.reference]
+        return sorted(rows), sorted(ref_rows), len(genes)
+
+    def __call__(self, queries, progress_callback=None):
+        """
+        Score a list of `queries` (see :func:`query`). Return a list of
+        dictionaries mapping term ids to (genes, p_value, reference_count).
+        """
+        incidence = self.incidence
+        n_genes = len(incidence.genes)
+
+        def selection(rows_list):
+            indptr = numpy.cumsum([0] + [len(rows) for rows in rows_list])
+            indices = numpy.array([r for rows in rows_list for r in rows],
+                                  dtype=int)
+            return scipy.sparse.csr_matrix(
+                (numpy.ones(len(indices), dtype=numpy.int32), indices, indptr),
+                shape=(len(rows_list), n_genes))
+
+        reached = selection([rows for rows, _, _ in queries]) \
+            .dot(incidence.reach).tocsr()
+        counts = selection([rows for _, rows, _ in queries]) \
+            .dot(incidence.matrix).tocsr()
+        if self.terms_mask is not None:
+            reached = reached.multiply(self.terms_mask).tocsr()
+        reached.eliminate_zeros()
+        reached.sort_indices()
+
+        # All (query, term) pairs to score
+        query_ind = numpy.repeat(numpy.arange(len(queries)),
+                                 numpy.diff(reached.indptr))
+        cols = reached.indices
+        if len(cols):
+            k = numpy.asarray(counts[query_ind, cols]).ravel()
+        else:
+            k = numpy.zeros(0, dtype=int)
+        m = self.ref_counts[cols]
+        n = numpy.array([size for _, _, size in queries], dtype=int)[query_ind]
+        p_values = _p_values(self.prob, k, len(self.reference), m, n)
+        if progress_callback:
+            progress_callback(50.0)
+
+        # report the progress of collecting the genes in term blocks
+        milestones = progress_bar_milestones(len(cols), 50) - set([0])
+        results = []
+        for i, (_, ref_rows, _) in enumerate(queries):
+            start, end = reached.indptr[i], reached.indptr[i + 1]
+            query_matrix = incidence.matrix[ref_rows].tocsc()
+            res = {}
+            for j, col, k_, m_, p in zip(range(start, end), cols[start:end],
+                                         k[start:end], m[start:end],
+                                         p_values[start:end]):
+                if k_:
+                    rows = query_matrix.indices[query_matrix.indptr[col]:
+                                                query_matrix.indptr[col + 1]]
+                    mapped = [incidence.genes[ref_rows[r]] for r in rows]
+                else:
+                    mapped = []
+                res[incidence.terms[col]] = (mapped, float(p), int(m_))
+                if progress_callback and j in milestones:
+                    progress_callback(50.0 + 50.0 * j / len(cols))
+            results.append(res)
+        if progress_callback:
+            progress_callback(100.0)
+        return results
+
+
+_enrichment_scorer = None
+
+
+def _init_enrichment_worker(scorer):
+    global _enrichment_scorer
+    _enrichment_scorer = scorer
+
+
+def _enrichment_worker(queries):
+    return _enrichment_scorer(queries)
+
+
+class _AnnotationColumns(object):
+    """
+    Columnar (memory-mapped) annotation records. Genes and GO ids are
+    dictionary encoded (indices into sorted key arrays), the records are
+    grouped by gene and by term with CSR-like (indptr, records) arrays.
+    """
+    #: Version of the columnar annotations format.
+    VERSION = 1
+
+    def __init__(self, meta, arrays):
+        self.meta = meta
+        self.arrays = arrays
+        self.lines = mmapstore.StringTable(arrays["record_blob"],
+                                           arrays["record_offsets"])
+        self._gene_names = None
+        self._term_ids = None
+
+    def __len__(self):
+        return len(self.lines)
+
+    def record(self, index):
+        return AnnotationRecord.from_string(self.lines[index])
+
+    def records(self, indices):
+        return [self.record(i) for i in indices]
+
+    @property
+    def gene_names(self):
+        if self._gene_names is None:
+            self._gene_names = [key.decode("utf-8") for key in
+                                self.arrays["gene_keys"].tolist()]
+        return self._gene_names
+
+    @property
+    def term_ids(self):
+        if self._term_ids is None:
+            self._term_ids = [key.decode("utf-8") for key in
+                              self.arrays["term_keys"].tolist()]
+        return self._term_ids
+
+    def codes(self, column, values):
+        """Return the codes of `values` in a dictionary encoded column."""
+        return [i for i, value in enumerate(self.meta[column])
+                if value in values]
+
+    @classmethod
+    def write(cls, path, annotations, alias_mapper, header="", source=None):
+        """Write a list of :class:`AnnotationRecord` to `path`."""
+        genes = sorted(set(ann.geneName for ann in annotations))
+        terms = sorted(set(ann.GO_ID for ann in annotations))
+        evidence = sorted(set(ann.Evidence_Code for ann in annotations))
+        aspects = sorted(set(ann.Aspect for ann in annotations))
+        gene_keys, _ = mmapstore.sorted_keys(genes)
+        term_keys, _ = mmapstore.sorted_keys(terms)
+
+        def encode(values, keys):
+            return numpy.searchsorted(
+                keys, numpy.array([v.encode("utf-8") for v in values],
+                                  dtype=keys.dtype)).astype(numpy.int32)
+
+        def group(codes, n):
+            order = numpy.argsort(codes, kind="mergesort").astype(numpy.int32)
+            indptr = numpy.zeros(n + 1, dtype=numpy.int64)
+            indptr[1:] = numpy.cumsum(numpy.bincount(codes, minlength=n))
+            return indptr, order
+
+        record_gene = encode([ann.geneName for ann in annotations], gene_keys)
+        record_term = encode([ann.GO_ID for ann in annotations], term_keys)
+        evidence_index = dict((e, i) for i, e in enumerate(evidence))
+        aspect_index = dict((a, i) for i, a in enumerate(aspects))
+
+        arrays = {"gene_keys": gene_keys, "term_keys": term_keys,
+                  "record_gene": record_gene, "record_term": record_term}
+        arrays["record_blob"], arrays["record_offsets"] = \
+            mmapstore.pack_strings(["\t".join(ann) for ann in annotations])
+        arrays["record_evidence"] = numpy.array(
+            [evidence_index[ann.Evidence_Code] for ann in annotations],
+            dtype=numpy.int16)
+        arrays["record_aspect"] = numpy.array(
+            [aspect_index[ann.Aspect] for ann in annotations],
+            dtype=numpy.int8)
+        arrays["gene_indptr"], arrays["gene_records"] = \
+            group(record_gene, len(genes))
+        arrays["term_indptr"], arrays["term_records"] = \
+            group(record_term, len(terms))
+
+        aliases = list(alias_mapper)
+        alias_keys, order = mmapstore.sorted_keys(aliases)
+        arrays["alias_keys"] = alias_keys
+        arrays["alias_genes"] = encode(
+            [alias_mapper[aliases[i]] for i in order], gene_keys)
+
+        meta = {"source": source, "header": header,
+                "evidence_codes": evidence, "aspects": aspects}
+        mmapstore.write(path, arrays, meta, version=cls.VERSION)
+
+
+class _ColumnRecords(Sequence):
+    """A read-only list of :class:`AnnotationRecord` stored in columns."""
+    def __init__(self, columns):
+        self._columns = columns
+
+    def __len__(self):
+        return len(self._columns)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return self._columns.records(range(*index.indices(len(self))))
+        return self._columns.record(index)
+
+    def __getslice__(self, start, end):
+        return self[max(start, 0):max(end, 0)]
+
+
+class _ColumnGroups(Mapping):
+    """
+    A read-only {key: list of :class:`AnnotationRecord`} mapping of
+    annotations grouped by gene or term (`kind`) backed by columns.
+    As with a `defaultdict(list)` a missing key maps to an empty list.
+    """
+    def __init__(self, columns, kind):
+        self._columns = columns
+        arrays = columns.arrays
+        self._keys = arrays[kind + "_keys"]
+        self._indptr = arrays[kind + "_indptr"]
+        self._records = arrays[kind + "_records"]
+
+    def indices(self, key):
+        """Return the record indices for `key`."""
+        i = mmapstore.key_index(self._keys, key)
+        if i < 0:
+            return self._records[:0]
+        return self._records[self._indptr[i]:self._indptr[i + 1]]
+
+    def __getitem__(self, key):
+        return self._columns.records(self.indices(key))
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+    def __contains__(self, key):
+        return isinstance(key, basestring) and \
+            mmapstore.key_index(self._keys, key) >= 0
+
+    def __iter__(self):
+        for key in self._keys.tolist():
+            yield key.decode("utf-8")
+
+    def __len__(self):
+        return len(self._keys)
+
+
+class _ColumnAliases(Mapping):
+    """A read-only {alias: gene name} mapping backed by columns."""
+    def __init__(self, columns):
+        self._columns = columns
+        self._keys = columns.arrays["alias_keys"]
+        self._genes = columns.arrays["alias_genes"]
+
+    def __getitem__(self, alias):
+        i = mmapstore.key_index(self._keys, alias) \
+            if isinstance(alias, basestring) else -1
+        if i < 0:
+            raise KeyError(alias)
+        return self._columns.gene_names[self._genes[i]]
+
+    def __contains__(self, alias):
+        return isinstance(alias, basestring) and \
+            mmapstore.key_index(self._keys, alias) >= 0
+
+    def __iter__(self):
+        for key in self._keys.tolist():
+            yield key.decode("utf-8")
+
+    def __len__(self):
+        return len(self._keys)
+
+
 class Annotations(object):
     """
     :class:`Annotations` object holds the annotations.
@@ -639,12 +1329,18 @@ class Annotations(object):
         (see `GO web CVS
         <http://cvsweb.geneontology.org/cgi-bin/cvsweb.cgi/go/gene-associations/>`_)
 
+    .. note:: Annotation files in the local database directory are
+        converted to a columnar format (see :func:`write_columns`) on
+        first use. The columnar file is memory-mapped on subsequent loads
+        and the annotation records are only created when accessed.
+
     """
     version = 2
 
     def __init__(self, filename_or_organism=None, ontology=None, genematcher=None,
                  progress_callback=None, rev=None):
         self.ontology = ontology
+        self._columns = None
 
         #: A dictionary mapping a gene name (DB_Object_Symbol) to a
         #: set of all annotations of that gene.
@@ -674,7 +1370,13 @@ class Annotations(object):
 
         elif isinstance(filename_or_organism, basestring) and \
                 os.path.exists(filename_or_organism):
-            self.parse_file(filename_or_organism, progress_callback)
+            if os.path.isfile(filename_or_organism) and \
+                    os.path.dirname(os.path.abspath(filename_or_organism)) == \
+                    os.path.abspath(default_database_path):
+                self._parse_file_cached(filename_or_organism,
+                                        progress_callback)
+            else:
+                self.parse_file(filename_or_organism, progress_callback)
 
         elif isinstance(filename_or_organism, basestring):
             # Assuming organism code/name
@@ -693,7 +1395,7 @@ class Annotations(object):
                     self.DownloadAnnotationsAtRev(
                         code, rev, filename, progress_callback)
 
-                self.parse_file(filename, progress_callback)
+                self._parse_file_cached(filename, progress_callback)
                 self.taxid = to_taxid(code).pop()
             else:
                 a = self.Load(filename_or_organism, ontology, genematcher, progress_callback)
@@ -751,6 +1453,7 @@ class Annotations(object):
         """Set the ontology to use in the annotations mapping.
         """
         self.all_annotations = defaultdict(list)
+        self._incidence_cache = {}
         self._ontology = ontology
 
     def get_ontology(self):
@@ -795,11 +1498,17 @@ class Annotations(object):
             - a directory name containing the association file named
               gene_association
             - a path to the actual association file
+            - a path to a columnar file written by :func:`write_columns`
             - an open file-like object of the association file
 
         """
         if isinstance(file, basestring):
-            if os.path.isfile(file) and tarfile.is_tarfile(file):
+            if os.path.isfile(file) and mmapstore.is_store(file):
+                meta, arrays = mmapstore.read(
+                    file, version=_AnnotationColumns.VERSION)
+                self._load_columns(meta, arrays)
+                return
+            elif os.path.isfile(file) and tarfile.is_tarfile(file):
                 f = tarfile.open(file).extractfile("gene_association")
             elif os.path.isfile(file) and file.endswith(".gz"):
                 f = gzip.open(file)
@@ -825,6 +1534,67 @@ class Annotations(object):
             if progress_callback and i in milestones:
                 progress_callback(100.0 * i / len(lines))
 
+    def _parse_file_cached(self, filename, progress_callback=None):
+        """ Load the annotations from a columnar file stored next to
+        `filename`. If the columnar file is missing or out of date parse
+        the file and (re)create it.
+        """
+        path = filename + ".columns"
+        source = mmapstore.file_stamp(filename)
+        try:
+            meta, arrays = mmapstore.read(
+                path, version=_AnnotationColumns.VERSION)
+            if meta.get("source") != source:
+                raise mmapstore.FormatError("%r is out of date" % path)
+        except (IOError, OSError, ValueError):
+            self.parse_file(filename, progress_callback)
+            try:
+                _AnnotationColumns.write(path, self.annotations,
+                                         self.alias_mapper, self.header,
+                                         source)
+            except (IOError, OSError) as err:
+                warnings.warn("Could not write the columnar annotations "
+                              "(%s)" % err, UserWarning)
+        else:
+            self._load_columns(meta, arrays)
+            if progress_callback:
+                progress_callback(100.0)
+
+    def _load_columns(self, meta, arrays):
+        columns = _AnnotationColumns(meta, arrays)
+        self._columns = columns
+        self.header = meta["header"]
+        self.annotations = _ColumnRecords(columns)
+        self.gene_annotations = _ColumnGroups(columns, "gene")
+        self.term_anotations = _ColumnGroups(columns, "term")
+        self.all_annotations = defaultdict(list)
+        self._incidence_cache = {}
+        self._gene_names_dict = None
+        self._gene_names = None
+        self._alias_mapper = None
+
+    def _materialize_columns(self):
+        """Replace the columnar (read-only) annotations with in memory
+        lists and dictionaries (so they can be modified).
+        """
+        annotations = list(self.annotations)
+        self._columns = None
+        self.annotations = []
+        self.gene_annotations = defaultdict(list)
+        self.term_anotations = defaultdict(list)
+        for a in annotations:
+            self.add_annotation(a)
+
+    def write_columns(self, filename):
+        """Write the annotations to `filename` in a columnar binary format.
+
+        The file can be passed in place of an annotations file to
+        :class:`Annotations` (it is memory-mapped and not parsed).
+
+        """
+        _AnnotationColumns.write(filename, self.annotations,
+                                 self.alias_mapper, self.header)
+
     def add_annotation(self, a):
         """Add a single :class:`AnotationRecord` instance to this object.
         """
@@ -832,11 +1602,14 @@ class Annotations(object):
             a = AnnotationRecord(a)
         if not a.geneName or not a.GOId or a.Qualifier == "NOT":
             return
+        if self._columns is not None:
+            self._materialize_columns()
 
         self.gene_annotations[a.geneName].append(a)
         self.annotations.append(a)
         self.term_anotations[a.GOId].append(a)
         self.all_annotations = defaultdict(list)
+        self._incidence_cache = {}
 
         self._gene_names_dict = None
         self._gene_names = None
@@ -853,12 +1626,18 @@ class Annotations(object):
     @property
     def gene_names(self):
         if self._gene_names is None:
-            self._gene_names = set([ann.geneName for ann in self.annotations])
+            if self._columns is not None:
+                self._gene_names = set(self._columns.gene_names)
+            else:
+                self._gene_names = set([ann.geneName
+                                        for ann in self.annotations])
         return self._gene_names
 
     @property
     def alias_mapper(self):
-        if self._alias_mapper is None:
+        if self._alias_mapper is None and self._columns is not None:
+            self._alias_mapper = _ColumnAliases(self._columns)
+        elif self._alias_mapper is None:
             self._alias_mapper = {}
             for ann in self.annotations:
                 self._alias_mapper.update([(alias, ann.geneName)
@@ -880,27 +1659,21 @@ class Annotations(object):
 
         return dict([(alias(gene), gene) for gene in genes if alias(gene)])
 
-    def _collect_annotations(self, id, visited):
-        """ Recursive function collects and caches all annotations for id
+    def _sub_graph_terms(self, id):
+        """ Return `id`, all its sub terms and their alternative ids.
         """
-        if id not in self.all_annotations and id not in visited:
-            if id in self.ontology.reverse_alias_mapper:
-                annotations = [self.term_anotations.get(alt_id, [])
-                               for alt_id in
-                               self.ontology.reverse_alias_mapper[id]] + \
-                              [self.term_anotations[id]]
-            else:
-                ## annotations for this term alone
-                annotations = [self.term_anotations[id]]
-            visited.add(id)
-            for typeId, child in self.ontology[id].related_to:
-                aa = self._collect_annotations(child, visited)
-                if type(aa) == set:
-                    ## if it was already reduced in get_all_annotations
-                    annotations.append(aa)
-                else:
-                    annotations.extend(aa)
-            self.all_annotations[id] = annotations
+        terms = self.ontology.extract_sub_graph([id])
+        terms.update([alt_id for term in list(terms) for alt_id in
+                      self.ontology.reverse_alias_mapper.get(term, ())])
+        return terms
+
+    def _collect_annotations(self, id, visited=None):
+        """ Collect and cache the lists of annotations for id and all its
+        sub terms.
+        """
+        if id not in self.all_annotations:
+            self.all_annotations[id] = [self.term_anotations.get(term, [])
+                                        for term in self._sub_graph_terms(id)]
         return self.all_annotations[id]
 
     _CollectAnnotations = _collect_annotations
@@ -914,11 +1687,16 @@ class Annotations(object):
         """
         self._ensure_ontology()
         id = self.ontology.alias_mapper.get(id, id)
-        if id not in self.all_annotations or \
-                type(self.all_annotations[id]) == list:
+        if type(self.all_annotations.get(id)) != set:
             annot_set = set()
-            for annots in self._collect_annotations(id, set()):
-                annot_set.update(annots)
+            if self._columns is not None:
+                indices = [self.term_anotations.indices(term)
+                           for term in self._sub_graph_terms(id)]
+                annot_set.update(self._columns.records(
+                    numpy.unique(numpy.concatenate(indices))))
+            else:
+                for annots in self._collect_annotations(id):
+                    annot_set.update(annots)
             self.all_annotations[id] = annot_set
         return self.all_annotations[id]
 
@@ -941,7 +1719,7 @@ class Annotations(object):
     def get_enriched_terms(self, genes, reference=None, evidence_codes=None,
                            slims_only=False, aspect=None,
                            prob=stats.Binomial(), use_fdr=True,
-                           progress_callback=None):
+                           progress_callback=None, engine="python"):
         """ Return a dictionary of enriched terms, with tuples of
         (list_of_genes, p_value, reference_count) for items and term
         ids as keys. P-Values are FDR adjusted if use_fdr is True (default).
@@ -955,8 +1733,16 @@ class Annotations(object):
         :param aspect:
             Which aspects to use. Use all by default. "P", "F", "C"
             or a set containing these elements.
+        :param str engine:
+            Scoring engine. ``"python"`` (default) intersects annotation
+            sets term by term, ``"sparse"`` scores all terms at once using
+            a cached gene x term incidence matrix (see
+            :func:`term_incidence`). Both return the same result.
 
         """
+        if engine not in ("python", "sparse"):
+            raise ValueError("Unknown engine %r" % engine)
+
         revGenesDict = self.get_gene_names_translator(genes)
         genes = set(revGenesDict.keys())
         if reference:
@@ -965,52 +1751,142 @@ class Annotations(object):
         else:
             reference = self.gene_names
 
-        if aspect == None:
-            aspects_set = set(["P", "C", "F"])
-        elif isinstance(aspect, basestring):
-            aspects_set = set([aspect])
-        else:
-            aspects_set = aspect
-
+        aspects_set = _aspects_set(aspect)
         evidence_codes = set(evidence_codes or evidenceDict.keys())
         annotations = [ann
                        for gene in genes for ann in self.gene_annotations[gene]
                        if ann.Evidence_Code in evidence_codes and
                        ann.Aspect in aspects_set]
 
-        refAnnotations = set(
-            [ann
-             for gene in reference for ann in self.gene_annotations[gene]
-             if ann.Evidence_Code in evidence_codes and
-             ann.Aspect in aspects_set]
-        )
-
         annotationsDict = defaultdict(set)
         for ann in annotations:
             annotationsDict[ann.GO_ID].add(ann)
 
         self._ensure_ontology()
-        if slims_only and not self.ontology.slims_subset:
-            warnings.warn("Unspecified slims subset in the ontology! "
-                          "Using 'goslim_generic' subset", UserWarning)
-            self.ontology.set_slims_subset("goslim_generic")
+        self._ensure_slims_subset(slims_only)
 
         terms = annotationsDict.keys()
         filteredTerms = [term for term in terms if term in self.ontology]
-
         if len(terms) != len(filteredTerms):
             termDiff = set(terms) - set(filteredTerms)
             warnings.warn("%s terms in the annotations were not found in the "
                           "ontology." % ",".join(map(repr, termDiff)),
                           UserWarning)
 
-        terms = self.ontology.extract_super_graph(filteredTerms)
+        if engine == "sparse":
+            # building the (cached) incidence matrix takes the first half
+            scorer = self._enrichment_scorer(
+                reference, evidence_codes, aspects_set, prob, slims_only,
+                lambda v: progress_callback(v / 2.0)
+                if progress_callback else None)
+            res, = scorer([scorer.query(genes)],
+                          lambda v: progress_callback(v / 2.0 + 50)
+                          if progress_callback else None)
+            res = dict((term, ([revGenesDict[g] for g in mapped], p, ref))
+                       for term, (mapped, p, ref) in six.iteritems(res))
+        else:
+            terms = self.ontology.extract_super_graph(filteredTerms)
+            if slims_only:
+                terms = [term for term in terms
+                         if term in self.ontology.slims_subset]
+            res = self._enriched_terms_python(
+                terms, genes, revGenesDict, reference, evidence_codes,
+                aspects_set, prob, progress_callback)
+
+        if use_fdr:
+            res = _fdr_adjusted(res)
+        return res
+
+    def get_enriched_terms_batch(self, gene_lists, reference=None,
+                                 evidence_codes=None, slims_only=False,
+                                 aspect=None, prob=stats.Binomial(),
+                                 use_fdr=True, n_jobs=1, chunk_size=50,
+                                 progress_callback=None):
+        """ Return a list of enriched terms for each list of genes in
+        `gene_lists`. Each element has the same structure as the result
+        of :func:`get_enriched_terms`.
+
+        The reference is translated and the annotations are propagated
+        only once, and all lists in a chunk are scored together, which is
+        much faster then calling :func:`get_enriched_terms` for each list.
+
+        :param gene_lists: A list of gene lists.
+        :param int n_jobs:
+            Number of worker processes used to score the chunks
+            (default 1 scores them in this process).
+        :param int chunk_size: Number of gene lists scored at once.
+
+        See :func:`get_enriched_terms` for the other parameters.
+
+        """
+        if reference:
+            reference = set(self.get_gene_names_translator(reference).keys())
+        else:
+            reference = self.gene_names
+
+        aspects_set = _aspects_set(aspect)
+        evidence_codes = set(evidence_codes or evidenceDict.keys())
+
+        self._ensure_ontology()
+        self._ensure_slims_subset(slims_only)
+
+        scorer = self._enrichment_scorer(reference, evidence_codes,
+                                         aspects_set, prob, slims_only)
+        translators = [self.get_gene_names_translator(genes)
+                       for genes in gene_lists]
+        queries = [scorer.query(revGenesDict.keys())
+                   for revGenesDict in translators]
+        chunks = [queries[i: i + chunk_size]
+                  for i in range(0, len(queries), chunk_size)]
+
+        pool = None
+        if n_jobs > 1 and len(chunks) > 1:
+            import multiprocessing
+            pool = multiprocessing.Pool(
+                min(n_jobs, len(chunks)),
+                initializer=_init_enrichment_worker, initargs=(scorer,))
+            scored = pool.imap(_enrichment_worker, chunks)
+        else:
+            scored = (scorer(chunk) for chunk in chunks)
+
+        results = []
+        try:
+            for i, chunk_res in enumerate(scored):
+                for res in chunk_res:
+                    revGenesDict = translators[len(results)]
+                    res = dict((term, ([revGenesDict[g] for g in mapped],
+                                       p, ref))
+                               for term, (mapped, p, ref) in
+                               six.iteritems(res))
+                    if use_fdr:
+                        res = _fdr_adjusted(res)
+                    results.append(res)
+                if progress_callback:
+                    progress_callback(100.0 * (i + 1) / len(chunks))
+        finally:
+            if pool is not None:
+                pool.terminate()
+        return results
+
+    def _ensure_slims_subset(self, slims_only):
+        if slims_only and not self.ontology.slims_subset:
+            warnings.warn("Unspecified slims subset in the ontology! "
+                          "Using 'goslim_generic' subset", UserWarning)
+            self.ontology.set_slims_subset("goslim_generic")
+
+    def _enriched_terms_python(self, terms, genes, revGenesDict, reference,
+                               evidence_codes, aspects_set, prob,
+                               progress_callback=None):
+        refAnnotations = set(
+            [ann
+             for gene in reference for ann in self.gene_annotations[gene]
+             if ann.Evidence_Code in evidence_codes and
+             ann.Aspect in aspects_set]
+        )
         res = {}
 
         milestones = progress_bar_milestones(len(terms), 100)
         for i, term in enumerate(terms):
-            if slims_only and term not in self.ontology.slims_subset:
-                continue
             allAnnotations = self.get_all_annotations(term).intersection(refAnnotations)
 ##            allAnnotations.intersection_update(refAnnotations)
             allAnnotatedGenes = set([ann.geneName for ann in allAnnotations])
@@ -1026,13 +1902,141 @@ class Annotations(object):
                          len(mappedReferenceGenes))
             if progress_callback and i in milestones:
                 progress_callback(100.0 * i / len(terms))
-        if use_fdr:
-            res = sorted(res.items(), key=lambda x: x[1][1])
-            res = dict([(id, (genes, p, ref))
-                        for (id, (genes, _, ref)), p in
-                        zip(res, stats.FDR([p for _, (_, p, _) in res]))])
         return res
 
+    def _enrichment_scorer(self, reference, evidence_codes, aspects_set, prob,
+                           slims_only=False, progress_callback=None):
+        incidence = self.term_incidence(evidence_codes, aspects_set,
+                                        progress_callback)
+        if slims_only:
+            terms_mask = numpy.array([term in self.ontology.slims_subset
+                                      for term in incidence.terms], dtype=bool)
+        else:
+            terms_mask = None
+        return _EnrichmentScorer(incidence, reference, prob, terms_mask)
+
+    def term_incidence(self, evidence_codes=None, aspect=None,
+                       progress_callback=None):
+        """
+        Return a :class:`TermIncidence` binary gene x term matrix of
+        annotations propagated up the ontology.
+
+        A gene is annotated to a term if it is (directly) annotated to the
+        term or any of its sub terms with one of `evidence_codes` and in
+        one of the `aspect` (defaults to all). The result is cached and
+        reused until the annotations or the ontology change.
+        `progress_callback` is called with the progress (0 to 100) of
+        building the matrix.
+
+        """
+        evidence_codes = frozenset(evidence_codes or evidenceDict.keys())
+        aspect = frozenset(_aspects_set(aspect))
+
+        key = (evidence_codes, aspect)
+        if key not in self._incidence_cache:
+            self._ensure_ontology()
+            self._incidence_cache[key] = self._build_term_incidence(
+                evidence_codes, aspect, progress_callback)
+        if progress_callback:
+            progress_callback(100.0)
+        return self._incidence_cache[key]
+
+    def _direct_terms(self, evidence_codes, aspects_set):
+        """Yield (gene, set of directly annotated term ids) pairs."""
+        columns = self._columns
+        if columns is None:
+            for gene, annotations in six.iteritems(self.gene_annotations):
+                yield gene, set(ann.GO_ID for ann in annotations
+                                if ann.Evidence_Code in evidence_codes and
+                                ann.Aspect in aspects_set)
+            return
+
+        arrays = columns.arrays
+        mask = numpy.isin(arrays["record_evidence"],
+                          columns.codes("evidence_codes", evidence_codes)) & \
+            numpy.isin(arrays["record_aspect"],
+                       columns.codes("aspects", aspects_set))
+        n_terms = len(arrays["term_keys"])
+        pairs = numpy.unique(
+            arrays["record_gene"][mask].astype(numpy.int64) * n_terms +
+            arrays["record_term"][mask])
+        genes, terms = pairs // n_terms, pairs % n_terms
+        bounds = numpy.flatnonzero(numpy.diff(genes)) + 1
+        gene_names, term_ids = columns.gene_names, columns.term_ids
+        for gene_terms in numpy.split(numpy.arange(len(pairs)), bounds):
+            if len(gene_terms):
+                yield (gene_names[genes[gene_terms[0]]],
+                       set(term_ids[t] for t in terms[gene_terms]))
+
+    def _build_term_incidence(self, evidence_codes, aspects_set,
+                              progress_callback=None):
+        ontology_terms = self.ontology.terms
+        super_terms = {}
+        gene_index, term_index = {}, {}
+        rows, cols = [], []
+        reach_rows, reach_cols = [], []
+
+        n_genes = len(self.gene_names)
+        milestones = progress_bar_milestones(n_genes, 90)
+        for i, (gene, direct) in enumerate(
+                self._direct_terms(evidence_codes, aspects_set)):
+            if progress_callback and i in milestones:
+                progress_callback(90.0 * i / n_genes)
+            direct = [term for term in direct if term in self.ontology]
+            if not direct:
+                continue
+            row = gene_index.setdefault(gene, len(gene_index))
+            reached, counted = set(), set()
+            for term in direct:
+                if term not in super_terms:
+                    super_terms[term] = \
+                        self.ontology.extract_super_graph([term])
+                reached.update(super_terms[term])
+                # Only annotations to primary term ids are propagated
+                # (as in get_all_annotations).
+                if term in ontology_terms:
+                    counted.update(super_terms[term])
+
+            for term in reached:
+                col = term_index.setdefault(term, len(term_index))
+                reach_rows.append(row)
+                reach_cols.append(col)
+                if term in counted:
+                    rows.append(row)
+                    cols.append(col)
+
+        shape = (len(gene_index), len(term_index))
+        matrix = scipy.sparse.csc_matrix(
+            (numpy.ones(len(rows), dtype=numpy.int32), (rows, cols)),
+            shape=shape)
+
+        # Alternative term ids are scored as their primary terms.
+        for term, col in six.iteritems(term_index):
+            if term not in ontology_terms:
+                primary = term_index.get(self.ontology.alias_mapper[term])
+                if primary is not None:
+                    primary_rows = matrix.indices[matrix.indptr[primary]:
+                                                  matrix.indptr[primary + 1]]
+                    rows.extend(primary_rows)
+                    cols.extend([col] * len(primary_rows))
+
+        matrix = scipy.sparse.csr_matrix(
+            (numpy.ones(len(rows), dtype=numpy.int32), (rows, cols)),
+            shape=shape)
+        reach = scipy.sparse.csr_matrix(
+            (numpy.ones(len(reach_rows), dtype=numpy.int32),
+             (reach_rows, reach_cols)),
+            shape=shape)
+
+        genes = [None] * len(gene_index)
+        for gene, row in six.iteritems(gene_index):
+            genes[row] = gene
+        terms = [None] * len(term_index)
+        for term, col in six.iteritems(term_index):
+            terms[col] = term
+        return TermIncidence(matrix, reach, genes, terms,
+                             gene_index, term_index)
+
     def get_annotated_terms(self, genes, direct_annotation_only=False,
                             evidence_codes=None, progress_callback=None):
         """Return all terms that are annotated by genes with evidence_codes.
@@ -59,7 +59,6 @@ from datetime import datetime
 from contextlib import contextmanager
 
 from orangecontrib.bio import utils, taxonomy
-from orangecontrib.bio.utils import progress_bar_milestones
 from orangecontrib.bio.kegg import databases
 from orangecontrib.bio.kegg import entry
 
@@ -68,6 +67,7 @@ from orangecontrib.bio.kegg.brite import BriteEntry, Brite
 from orangecontrib.bio.kegg import api
 from orangecontrib.bio.kegg import conf
 from orangecontrib.bio.kegg import pathway
+from orangecontrib.bio.kegg import snapshot
 
 from functools import reduce
 
@@ -182,6 +182,19 @@ class Organism(object):
     def enzymes(self, genes=None):
         raise NotImplementedError()
 
+    def snapshot(self, release=None):
+        """
+        Return an :class:`~.snapshot.OrganismSnapshot` (an offline
+        gene/pathway index) for this organism.
+
+        If `release` is ``None`` the latest locally available snapshot
+        is used, as long as it is not older than allowed by the
+        ``conf.params["cache.invalidate"]`` policy (otherwise the current
+        KEGG release is used).
+
+        """
+        return snapshot.OrganismSnapshot.for_organism(self.org_code, release)
+
     def get_enriched_pathways(self, genes, reference=None,
                               prob=utils.stats.Binomial(), callback=None):
         """
@@ -189,40 +202,13 @@ class Organism(object):
         and (list_of_genes, p_value, num_of_reference_genes) tuples
         as items.
 
+        The enrichment is computed from the local :func:`snapshot`.
+
         """
-        if reference is None:
-            reference = self.genes.keys()
-        reference = set(reference)
-
-        allPathways = defaultdict(lambda: [[], 1.0, []])
-        milestones = progress_bar_milestones(len(genes), 100)
-        pathways_db = KEGGPathways()
-
-        pathways_for_gene = []
-        for i, gene in enumerate(genes):
-            pathways_for_gene.append(self.pathways([gene]))
-            if callback and i in milestones:
-                callback(i * 50.0 / len(genes))
-
-        # pre-cache for speed
-        pathways_db.pre_cache([pid for pfg in pathways_for_gene
-                               for pid in pfg])
-        for i, (gene, pathways) in enumerate(zip(genes, pathways_for_gene)):
-            for pathway in pathways:
-                if pathways_db.get_entry(pathway).gene:
-                    allPathways[pathway][0].append(gene)
-            if callback and i in milestones:
-                callback(50.0 + i * 50.0 / len(genes))
-
-        pItems = allPathways.items()
-
-        for i, (p_id, entry) in enumerate(pItems):
-            pathway = pathways_db.get_entry(p_id)
-            entry[2].extend(reference.intersection(pathway.gene or []))
-            entry[1] = prob.p_value(len(entry[0]), len(reference),
-                                    len(entry[2]), len(genes))
-        return dict([(pid, (genes, p, len(ref)))
-                     for pid, (genes, p, ref) in allPathways.items()])
+        result = self.snapshot().enrichment(genes, reference, prob)
+        if callback:
+            callback(100.0)
+        return result
 
     def get_genes_by_enzyme(self, enzyme):
         enzyme = KEGGEnzyme().get_entry(enzyme)
@@ -10,8 +10,9 @@ from operator import itemgetter
 import warnings
 import six
 
-from .service import web_service
+from .service import web_service, shared_fetcher, MAX_GET_IDS
 from .types import OrganismSummary, Definition, BInfo, Link
+from .entry import parse_fields
 
 
 # A list of all databases with names, abbreviations
@@ -46,6 +47,9 @@ class KeggApi(object):
 
     def __init__(self):
         self.service = web_service()
+        #: A :class:`~.service.ConcurrentFetcher` for bulk entry retrieval
+        #: (the process wide :func:`~.service.shared_fetcher` if ``None``)
+        self.fetcher = None
 
     def list_organisms(self):
         """
@@ -348,6 +352,10 @@ except ImportError:
     from Orange.utils import lru_cache
 
 
+#: Number of fetched entries written to the cache in a single transaction.
+CACHE_WRITE_SIZE = 200
+
+
 class CachedKeggApi(KeggApi):
     def __init__(self, store=None):
         KeggApi.__init__(self)
@@ -366,6 +374,11 @@ class CachedKeggApi(KeggApi):
         return getattr(self, "default_release", "")
 
     def set_default_release(self, release):
+        """
+        Set the KEGG `release` string (e.g. ``api.info("kegg").release``)
+        cached entries are tagged with. Entries cached under a different
+        release are invalid (refetched).
+        """
         self.default_release = release
 
     @cached_method
@@ -400,60 +413,119 @@ class CachedKeggApi(KeggApi):
         return KeggApi.link(self, target_db, source_db, ids)
 
     def _batch_get(self, ids):
-        if len(ids) > 10:
+        if len(ids) > MAX_GET_IDS:
             raise ValueError("Can batch at most 10 ids at a time.")
 
+        cached = self.get_entries(ids)
+
+        # Finally join all the results, but drop all None objects
+        entries = [cached[id].value for id in ids if id in cached]
+        entries = filter(lambda e: e is not None, entries)
+
+        rval = "".join(entries)
+        return rval
+
+    def get_entries(self, ids):
+        """
+        Return a dict mapping `ids` to their (valid) cache entries. The
+        entries for uncached ids are retrieved first (in batches of
+        :obj:`MAX_GET_IDS`). Each entry has the DBGET text as its `value`
+        and the parsed field tuples (see
+        :func:`~.entry.parse_fields`) as `parsed`.
+        """
         get = self.get
-        uncached = []
-        unmatched = set()
+        keys = dict((id, get.key_from_args((id,))) for id in ids)
 
+        # Which ids are already cached
         with closing(get.cache_store()) as store:
-            # Which ids are already cached
-            # TODO: Invalidate entries by release string.
-            for id in ids:
-                key = get.key_from_args((id,))
-                if not get.key_has_valid_cache(key, store):
-                    uncached.append(id)
+            cached = get.valid_entries(list(keys.values()), store)
 
-        if uncached:
-            # in case there are duplicate ids
-            uncached = sorted(set(uncached))
+        # in case there are duplicate ids
+        uncached = sorted(set(id for id in ids if keys[id] not in cached))
 
-            rval = KeggApi.get(self, uncached)
+        for start in range(0, len(uncached), MAX_GET_IDS):
+            batch = uncached[start: start + MAX_GET_IDS]
+            new = self._cache_entries(batch, KeggApi.get(self, batch), keys)
+            with closing(get.cache_store()) as store:
+                store.set_many(new)
+            cached.update(new)
 
-            if rval is not None:
-                entries = rval.split("///\n")
-            else:
-                entries = []
+        return dict((id, cached[keys[id]]) for id in ids
+                    if keys[id] in cached)
 
-            if entries and not entries[-1].strip():
-                # Delete the last single newline entry if present
-                del entries[-1]
+    def _cache_entries(self, ids, text, keys=None):
+        """
+        Split the DBGET `text` returned for `ids` and return a list of
+        (cache key, cache entry) tuples for the matched entries.
+        """
+        get = self.get
+        if keys is None:
+            keys = dict((id, get.key_from_args((id,))) for id in ids)
 
-            if len(entries) != len(uncached):
-                new_uncached, entries = match_by_ids(uncached, entries)
-                unmatched = set(uncached) - set(new_uncached)
-                uncached = new_uncached
-                warnings.warn("Unable to match entries for keys: %s." %
-                              ", ".join(map(repr, unmatched)))
+        if text is not None:
+            entries = text.split("///\n")
+        else:
+            entries = []
+
+        if entries and not entries[-1].strip():
+            # Delete the last single newline entry if present
+            del entries[-1]
+
+        if len(entries) != len(ids):
+            matched, entries = match_by_ids(ids, entries)
+            unmatched = set(ids) - set(matched)
+            ids = matched
+            warnings.warn("Unable to match entries for keys: %s." %
+                          ", ".join(map(repr, unmatched)))
+
+        mtime = datetime.now()
+        new = []
+        for id, text in zip(ids, entries):
+            if text is not None:
+                text = text + "///\n"
+                parsed = parse_fields(text)
+            else:
+                parsed = None
+            new.append((keys[id],
+                        cache_entry(text, mtime=mtime,
+                                    release=get.release_from_args((id,)),
+                                    parsed=parsed)))
+        return new
+
+    def pre_cache(self, ids, batch_size=MAX_GET_IDS, progress_callback=None):
+        """
+        Retrieve and cache DBGET entries for all `ids` without a valid
+        cache entry.
 
-            with closing(get.cache_store()) as store:
-                for id, entry in zip(uncached, entries):
-                    key = get.key_from_args((id,))
-                    if entry is not None:
-                        entry = entry + "///\n"
-                    store[key] = cache_entry(entry, mtime=datetime.now())
+        The entries are fetched in batches of `batch_size` ids with
+        concurrent requests (see :class:`~.service.ConcurrentFetcher`)
+        and stored in the cache in batches of :obj:`CACHE_WRITE_SIZE`.
 
-        # Finally join all the results, but drop all None objects
+        """
+        if batch_size > MAX_GET_IDS or batch_size < 1:
+            raise ValueError("Invalid batch_size")
 
-        with closing(get.cache_store()):
-            keys = [get.key_from_args((id,)) for id in ids]
-            entries = [store[key].value for key in keys]
+        get = self.get
+        keys = dict((id, get.key_from_args((id,))) for id in ids)
+        with closing(get.cache_store()) as store:
+            cached = get.valid_entries(list(keys.values()), store)
 
-        entries = filter(lambda e: e is not None, entries)
+        uncached = sorted(set(id for id in ids if keys[id] not in cached))
+        batches = [uncached[start: start + batch_size]
+                   for start in range(0, len(uncached), batch_size)]
 
-        rval = "".join(entries)
-        return rval
+        fetcher = self.fetcher or shared_fetcher()
+        new = []
+        with closing(get.cache_store()) as store:
+            for i, (batch, text) in enumerate(fetcher.map(batches)):
+                new.extend(self._cache_entries(batch, text, keys))
+                if len(new) >= CACHE_WRITE_SIZE:
+                    store.set_many(new)
+                    new = []
+                if progress_callback:
+                    progress_callback(100.0 * (i + 1) / len(batches))
+            if new:
+                store.set_many(new)
 
     @cached_method
     def conv(self, target_db, source):
@@ -3,16 +3,21 @@ Caching framework for cached kegg api calls.
 
 """
 import os
+import time
 import sqlite3
+import warnings
+import threading
 try:
     import cPickle as pickle
 except ImportError:
     import pickle
 
 from contextlib import closing
+from collections import OrderedDict
 
 from datetime import datetime, date, timedelta
 from . import conf
+from ..utils import sqlitepool
 
 import six
 
@@ -35,22 +40,134 @@ class Store(object):
         pass
 
 
+#: Maximum number of keys in a single ``IN (...)`` query.
+SQL_CHUNK_SIZE = 900
+
+#: Run a (background) compaction after this many bytes are written to
+#: a store (as a fraction of its `max_size`) ...
+COMPACT_WRITE_FRACTION = 1.0 / 16
+#: ... or at least this often (in seconds) while writing.
+COMPACT_INTERVAL = 600
+
+#: When compacting evict the least recently used entries until the
+#: total size is below this fraction of `max_size`.
+COMPACT_TARGET_FRACTION = 0.9
+
+
+def max_cache_size():
+    """
+    Return the configured (``conf.params["cache.max_size"]``) byte budget
+    of a cache store (0 if unbounded).
+    """
+    return int(conf.params["cache.max_size"])
+
+
+class _StoreState(object):
+    # Process wide state shared by all stores of a file.
+    def __init__(self):
+        self.lock = threading.Lock()
+        # key: access time of recently read keys (not yet written to the db)
+        self.touched = {}
+        self.written = 0
+        self.last_compact = 0
+        self.compacting = None
+
+_states = {}
+_states_lock = threading.Lock()
+
+
+def _forget_state(filename):
+    with _states_lock:
+        _states.pop(os.path.abspath(filename), None)
+
+
+def _init_connection(con):
+    # WAL commits do not need to sync the database (only checkpoints do)
+    con.execute("PRAGMA synchronous=NORMAL")
+
+
+def _loads(pickle_str):
+    if not six.PY3:
+        pickle_str = str(pickle_str)
+    return pickle.loads(pickle_str)
+
+
 class Sqlite3Store(Store, DictMixin):
+    """
+    A persistent (pickling) key/value store in an sqlite3 database.
+
+    All stores for the same `filename` share a process wide pool of
+    long-lived (per-thread) connections, so constructing a store is
+    cheap. The database is in WAL journal mode. Use :func:`get_many` and
+    :func:`set_many` to read/write many items in a single query or
+    transaction.
+
+    The total size of the stored values is kept under `max_size` bytes
+    (``conf.params["cache.max_size"]`` by default, 0 for unbounded) by
+    evicting the least recently used entries in a background
+    :func:`compact` step run periodically while writing.
 
-    def __init__(self, filename):
+    """
+    def __init__(self, filename, max_size=None):
+        Store.__init__(self)
         self.filename = filename
-        self.con = sqlite3.connect(filename)
-        self.con.execute("""
-            CREATE TABLE IF NOT EXISTS cache
-                (key TEXT UNIQUE,
-                 value TEXT
-                )
-        """)
-        self.con.execute("""
-            CREATE INDEX IF NOT EXISTS cache_index
-            ON cache (key)
-        """)
-        self.con.commit()
+        self.max_size = max_cache_size() if max_size is None else max_size
+        # Per-thread connections shared by all stores of `filename`
+        self.con = sqlitepool.shared(filename, init=_init_connection)
+        path = os.path.abspath(filename)
+        with _states_lock:
+            self._state = _states.get(path)
+            new = self._state is None
+            if new:
+                self._init_db()
+                self._state = _states[path] = _StoreState()
+        if new:
+            # Enforce the budget on files left by previous sessions
+            self.compact_async()
+
+    def _init_db(self):
+        # auto_vacuum can only be changed before the tables are created
+        self.con.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        self.con.execute("PRAGMA journal_mode=WAL")
+        with self.con:
+            self.con.execute("""
+                CREATE TABLE IF NOT EXISTS cache
+                    (key TEXT UNIQUE,
+                     value TEXT,
+                     atime REAL,
+                     size INTEGER
+                    )
+            """)
+            columns = [row[1] for row in
+                       self.con.execute("PRAGMA table_info(cache)")]
+            if "atime" not in columns:
+                # A store created by an older version
+                self.con.execute("ALTER TABLE cache ADD COLUMN atime REAL")
+                self.con.execute("ALTER TABLE cache ADD COLUMN size INTEGER")
+                self.con.execute("""
+                    UPDATE cache SET atime=0, size=length(value)
+                """)
+            self.con.execute("""
+                CREATE INDEX IF NOT EXISTS cache_index
+                ON cache (key)
+            """)
+            self.con.execute("""
+                CREATE INDEX IF NOT EXISTS cache_atime
+                ON cache (atime)
+            """)
+
+    def _touch(self, keys):
+        now = time.time()
+        with self._state.lock:
+            self._state.touched.update((key, now) for key in keys)
+
+    def _flush_touched(self):
+        # Write the access times of read keys (must be in a transaction)
+        with self._state.lock:
+            touched, self._state.touched = self._state.touched, {}
+        self.con.executemany("""
+            UPDATE cache SET atime=? WHERE key=?
+        """, [(atime, key) for key, atime in touched.items()])
 
     def __getitem__(self, key):
         cur = self.con.execute("""
@@ -62,28 +179,77 @@ class Sqlite3Store(Store, DictMixin):
         if not r:
             raise KeyError(key)
         else:
-            pickle_str = r[0][0]
-            if not six.PY3:
-                pickle_str = str(pickle_str)
             try:
-                return pickle.loads(pickle_str)
+                value = _loads(r[0][0])
             except Exception:
                 raise KeyError(key)
+            self._touch([key])
+            return value
+
+    def __contains__(self, key):
+        cur = self.con.execute("""
+            SELECT 1
+            FROM cache
+            WHERE key=?
+        """, (key,))
+        return cur.fetchone() is not None
+
+    def get_many(self, keys):
+        """
+        Return a dict with the (unpickled) values of all `keys` present
+        in the store.
+        """
+        keys = list(set(keys))
+        result = {}
+        for start in range(0, len(keys), SQL_CHUNK_SIZE):
+            chunk = keys[start: start + SQL_CHUNK_SIZE]
+            cur = self.con.execute("""
+                SELECT key, value
+                FROM cache
+                WHERE key IN ({})
+            """.format(", ".join(["?"] * len(chunk))), chunk)
+            for key, value in cur:
+                try:
+                    result[key] = _loads(value)
+                except Exception:
+                    pass
+        self._touch(result)
+        return result
 
     def __setitem__(self, key, value):
-        value = pickle.dumps(value)
-        self.con.execute("""
-            INSERT OR REPLACE INTO cache
-            VALUES (?, ?)
-        """, (key, value))
-        self.con.commit()
+        self.set_many([(key, value)])
+
+    def set_many(self, items):
+        """
+        Store all (key, value) `items` in a single transaction.
+        """
+        now = time.time()
+        rows = []
+        for key, value in items:
+            value = pickle.dumps(value)
+            rows.append((key, value, now, len(value)))
+        with self.con:
+            self.con.executemany("""
+                INSERT OR REPLACE INTO cache
+                VALUES (?, ?, ?, ?)
+            """, rows)
+            self._flush_touched()
+
+        state = self._state
+        with state.lock:
+            state.written += sum(row[3] for row in rows)
+            due = self.max_size and (
+                state.written >= self.max_size * COMPACT_WRITE_FRACTION or
+                now - state.last_compact >= COMPACT_INTERVAL)
+        if due:
+            self.compact_async()
 
     def __delitem__(self, key):
-        self.con.execute("""
-            DELETE FROM cache
-            WHERE key=?
-        """, (key,))
-        self.con.commit()
+        with self.con:
+            self.con.execute("""
+                DELETE FROM cache
+                WHERE key=?
+            """, (key,))
 
     def keys(self):
         cur = self.con.execute("""
@@ -92,15 +258,86 @@ class Sqlite3Store(Store, DictMixin):
         """)
         return [str(r[0]) for r in cur.fetchall()]
 
+    def size(self):
+        """
+        Return the total size (in bytes) of all stored values.
+        """
+        return self.con.execute(
+            "SELECT coalesce(sum(size), 0) FROM cache").fetchone()[0]
+
+    def compact(self, max_size=None):
+        """
+        Evict the least recently used entries if the total size exceeds
+        `max_size` (the store's `max_size` by default) and release the
+        freed space. Return the number of evicted entries.
+        """
+        if max_size is None:
+            max_size = self.max_size
+        with self._state.lock:
+            self._state.written = 0
+            self._state.last_compact = time.time()
+
+        evicted = []
+        with self.con:
+            self._flush_touched()
+            total = self.size()
+            if max_size and total > max_size:
+                target = total - int(max_size * COMPACT_TARGET_FRACTION)
+                cur = self.con.execute("""
+                    SELECT key, size FROM cache ORDER BY atime
+                """)
+                for key, size in cur:
+                    if target <= 0:
+                        break
+                    evicted.append(key)
+                    target -= size or 0
+                cur.close()
+                for start in range(0, len(evicted), SQL_CHUNK_SIZE):
+                    chunk = evicted[start: start + SQL_CHUNK_SIZE]
+                    self.con.execute("""
+                        DELETE FROM cache WHERE key IN ({})
+                    """.format(", ".join(["?"] * len(chunk))), chunk)
+        if evicted:
+            self.con.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchall()
+            self.con.execute("PRAGMA incremental_vacuum").fetchall()
+        return len(evicted)
+
+    def compact_async(self):
+        """
+        Run :func:`compact` in a background (daemon) thread unless one is
+        already running. Return the thread (or ``None``).
+        """
+        if not self.max_size:
+            return None
+
+        def run():
+            try:
+                self.compact()
+            except sqlite3.Error as err:
+                warnings.warn("Could not compact the cache %r: %s" %
+                              (self.filename, err), UserWarning)
+            finally:
+                with state.lock:
+                    state.compacting = None
+
+        state = self._state
+        with state.lock:
+            if state.compacting is not None:
+                return None
+            thread = state.compacting = threading.Thread(
+                target=run, name="kegg-cache-compact")
+        thread.daemon = True
+        thread.start()
+        return thread
+
     def close(self):
         pass
 
     def __len__(self):
-        return None
+        return self.con.execute("SELECT count(*) FROM cache").fetchone()[0]
 
     def __iter__(self):
-        return None
-
+        return iter(self.keys())
 
 
 class DictStore(Store, DictMixin):
@@ -119,14 +356,53 @@ class DictStore(Store, DictMixin):
 
 
 class cache_entry(object):
-    def __init__(self, value, mtime=None, expires=None):
+    def __init__(self, value, mtime=None, expires=None, release=None,
+                 parsed=None):
         self.value = value
         self.mtime = mtime
         self.expires = expires
+        #: The KEGG release (`last_modified` string) the value is from.
+        self.release = release
+        #: A parsed form of `value` (e.g. DBGET entry field tuples).
+        self.parsed = parsed
 
 _SESSION_START = datetime.now()
 
 
+class LRUCache(object):
+    """
+    A thread safe in-memory mapping keeping at most `maxsize` of the most
+    recently used items.
+    """
+    def __init__(self, maxsize=1000):
+        self.maxsize = maxsize
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value = self._items.pop(key)
+            except KeyError:
+                return default
+            self._items[key] = value
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._items.pop(key, None)
+            self._items[key] = value
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+    def __len__(self):
+        return len(self._items)
+
+
 class cached_wrapper(object):
     """
     TODO: needs documentation
@@ -154,9 +430,20 @@ class cached_wrapper(object):
             del store[key]
 
     def last_modified_from_args(self, args, kwargs=None):
-        if self.instance is not None:
+        if hasattr(self.instance, "last_modified"):
             return self.instance.last_modified(args)
 
+    def release_from_args(self, args, kwargs=None):
+        """
+        Return the KEGG release string the cached values for `args` are
+        tagged with (``None`` if not release aware).
+        """
+        last_modified = self.last_modified_from_args(args, kwargs)
+        if isinstance(last_modified, six.string_types) and last_modified:
+            return last_modified
+        else:
+            return None
+
     def invalidate_args(self, args):
         return self.invalidate_key(self.key_from_args(args))
 
@@ -173,7 +460,8 @@ class cached_wrapper(object):
             timestamp = datetime.now()
 
         with closing(self.cache_store()) as store:
-            store[key] = cache_entry(value, mtime=timestamp)
+            store[key] = cache_entry(value, mtime=timestamp,
+                                     release=self.release_from_args(args))
 
     def __call__(self, *args):
         key = self.key_from_args(args)
@@ -182,21 +470,44 @@ class cached_wrapper(object):
                 rval = store[key].value
             else:
                 rval = self.function(self.instance, *args)
-                store[key] = cache_entry(rval, datetime.now(), None)
+                store[key] = cache_entry(rval, datetime.now(), None,
+                                         self.release_from_args(args))
 
         return rval
 
+    def valid_entries(self, keys, store):
+        """
+        Return a dict of `keys` with a valid cache entry in `store`
+        (mapping to the entries).
+        """
+        if hasattr(store, "get_many"):
+            entries = store.get_many(keys)
+        else:
+            entries = dict((key, store[key]) for key in keys if key in store)
+        return dict((key, entry) for key, entry in entries.items()
+                    if self.is_entry_valid(entry, None))
+
     def key_has_valid_cache(self, key, store):
-        if key not in store:
+        try:
+            entry = store[key]
+        except KeyError:
             return False
         else:
-            entry = store[key]
             return self.is_entry_valid(entry, None)
 
     def is_entry_valid(self, entry, args):
-        # For now always return True, the caching architecture needs to be
-        # completely reworked
-        return True
+        """
+        Is the cache `entry` still valid.
+
+        An entry is invalid if it is tagged with a different KEGG release
+        than the current one (see :func:`release_from_args`), if it was
+        stored before the last modified date or if it is older than
+        allowed by the ``conf.params["cache.invalidate"]`` policy
+        ('always', 'session', 'daily' or 'weekly').
+
+        """
+        if not isinstance(entry, cache_entry):
+            return False
 
         # Need to check datetime first (it subclasses date)
         if isinstance(entry.mtime, datetime):
@@ -207,28 +518,44 @@ class cached_wrapper(object):
         else:
             return False
 
-        last_modified = self.last_modified_from_args(args)
+        if entry.expires is not None and entry.expires <= datetime.now():
+            return False
 
-        if isinstance(last_modified, date):
-            last_modified = datetime(last_modified.year, last_modified.month,
-                                     last_modified.day, 1, 1, 1)
-        elif isinstance(last_modified, str):
-            # Could have different format
-            mtime = mtime.strftime("%Y %m %d %H %M %S")
+        last_modified = self.last_modified_from_args(args)
 
-        elif last_modified is None:
-            if conf.params["cache.invalidate"] == "always":
+        if isinstance(last_modified, six.string_types):
+            # A release string
+            if last_modified and \
+                    getattr(entry, "release", None) != last_modified:
                 return False
-            elif conf.params["cache.invalidate"] == "session":
-                last_modified = _SESSION_START
-            elif conf.params["cache.invalidate"] == "daily":
-                last_modified = datetime.now().replace(hour=0, minute=0,
-                                                       second=0, microsecond=0)
-            elif conf.params["cache.invalidate"] == "weekly":
-                last_modified = datetime.now() - timedelta(7)
-            else:  # ???
-                pass
-        return last_modified <= mtime
+        elif isinstance(last_modified, datetime):
+            if last_modified > mtime:
+                return False
+        elif isinstance(last_modified, date):
+            if datetime(last_modified.year, last_modified.month,
+                        last_modified.day) > mtime:
+                return False
+
+        oldest = _oldest_valid_mtime(conf.params["cache.invalidate"])
+        return oldest is None or oldest <= mtime
+
+
+def _oldest_valid_mtime(policy):
+    """
+    Return the oldest valid entry mtime for a "cache.invalidate" `policy`
+    (``None`` if entries never expire).
+    """
+    if policy == "always":
+        return datetime.max
+    elif policy == "session":
+        return _SESSION_START
+    elif policy == "daily":
+        return datetime.now().replace(hour=0, minute=0, second=0,
+                                      microsecond=0)
+    elif policy == "weekly":
+        return datetime.now() - timedelta(7)
+    else:
+        return None
 
 
 class cached_method(object):
@@ -278,7 +605,12 @@ def clear_cache():
                         "of %r manually." % path)
 
     for cache_filename in glob.glob(os.path.join(path, "*.sqlite3")):
-        os.remove(cache_filename)
+        sqlitepool.release(cache_filename)
+        _forget_state(cache_filename)
+        for filename in [cache_filename, cache_filename + "-wal",
+                         cache_filename + "-shm"]:
+            if os.path.exists(filename):
+                os.remove(filename)
 
     for ko_filename in glob.glob(os.path.join(path, "*.keg")):
         os.remove(ko_filename)
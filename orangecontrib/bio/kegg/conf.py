@@ -23,6 +23,8 @@ default = """
 path = %(kegg_dir)s/
 store = sqlite3
 invalidate = weekly
+# maximum size (in bytes) of a cache store (0 for unbounded)
+max_size = 1073741824
 
 [service]
 transport = urllib2
@@ -49,6 +51,7 @@ _ALL_PARAMS = [
     "cache.path",
     "cache.store",
     "cache.invalidate",
+    "cache.max_size",
     "service.transport"
 ]
 
@@ -12,6 +12,7 @@ from contextlib import closing
 from . import entry
 from .entry import fields
 from . import api
+from . import caching
 
 
 def iter_take(source_iter, n):
@@ -53,6 +54,12 @@ def chain_iter(chains_iter):
 # ligand/compound.dbget
 
 
+#: Maximum number of parsed entries kept in memory (by all databases).
+ENTRY_CACHE_SIZE = 5000
+
+_entry_cache = caching.LRUCache(ENTRY_CACHE_SIZE)
+
+
 class DBDataBase(object):
     """
     Base class for a DBGET database interface.
@@ -185,17 +192,64 @@ class DBDataBase(object):
         Return the database entry for `key` as plain text.
         """
         key = self._add_db(key)
-        return self.api.get([key])
+        cached = self.api.get_entries([key]).get(key)
+        if cached is None or cached.value is None:
+            return ""
+        return cached.value
 
     def get_entry(self, key):
         """
         Return the database entry for `key` as an instance of `ENTRY_TYPE`.
+
+        .. note:: Entries are shared (cached in memory) and should not be
+            modified.
+
         """
-        text = self.get_text(key)
-        if not text or text == "None":
+        key = self._add_db(key)
+        entry = self._entry_from_lru(key)
+        if entry is None:
+            cached = self.api.get_entries([key]).get(key)
+            entry = self._entry_from_cache(cached)
+            if entry is not None:
+                self._entry_to_lru(key, cached, entry)
+        return entry
+
+    def _entry_cache_key(self, key):
+        # Entries from a different KEGG release must not be reused
+        return (self.ENTRY_TYPE, key, self.api.last_modified(None))
+
+    def _entry_from_lru(self, key):
+        """
+        Return the in-memory parsed entry for `key` if the api cache entry
+        it was parsed from is still valid (else ``None``).
+        """
+        item = _entry_cache.get(self._entry_cache_key(key))
+        if item is None:
             return None
+        stamp, entry = item
+        if self.api.get.is_entry_valid(stamp, (key,)):
+            return entry
         else:
-            return self.ENTRY_TYPE(text)
+            return None
+
+    def _entry_to_lru(self, key, cached, entry):
+        # Keep the cache entry's validity stamp (without the text) along
+        stamp = caching.cache_entry(None, cached.mtime, cached.expires,
+                                    getattr(cached, "release", None))
+        _entry_cache.put(self._entry_cache_key(key), (stamp, entry))
+
+    def _entry_from_cache(self, cached):
+        """
+        Return an `ENTRY_TYPE` instance from an api cache entry (or
+        ``None``). The stored parsed fields are used if available.
+        """
+        if cached is None or not cached.value or cached.value == "None":
+            return None
+        parsed = getattr(cached, "parsed", None)
+        if parsed is not None:
+            return self.ENTRY_TYPE.from_fields(parsed)
+        else:
+            return self.ENTRY_TYPE(cached.value)
 
     def find(self, name):
         """
@@ -220,28 +274,12 @@ class DBDataBase(object):
         if keys is None:
             keys = self.keys()
 
-        keys = map(self._add_db, keys)
-
-        get = self.api.get
+        keys = [self._add_db(key) for key in keys]
 
-        # drop all keys with a valid cache entry to minimize the number
-        # of 'get' requests.
-        with closing(get.cache_store()) as store:
-            def is_uncached(key):
-                cache_key = get.key_from_args((key,))
-                return not get.key_has_valid_cache(cache_key, store)
-            keys = [key for key in keys if is_uncached(key)]
-
-        start = 0
-
-        while start < len(keys):
-            batch = keys[start: start + batch_size]
-            self.api.get(batch)
-
-            if progress_callback:
-                progress_callback(100.0 * start / len(keys))
-
-            start += batch_size
+        # Only entries without a valid cache entry are retrieved (with
+        # concurrent requests)
+        self.api.pre_cache(keys, batch_size=batch_size,
+                           progress_callback=progress_callback)
 
     def batch_get(self, keys):
         """
@@ -250,25 +288,28 @@ class DBDataBase(object):
         are not yet cached.
 
         """
-        entries = []
-        batch_size = 10
         keys = list(map(self._add_db, keys))
+        entries = dict((key, self._entry_from_lru(key)) for key in keys)
+        missing = [key for key in keys if entries[key] is None]
+
+        if missing:
+            # Precache the entries first
+            self.pre_cache(missing)
 
-        # Precache the entries first
-        self.pre_cache(keys)
+            get = self.api.get
+            cache_keys = dict((key, get.key_from_args((key,)))
+                              for key in missing)
+            with closing(get.cache_store()) as store:
+                cached = store.get_many(list(cache_keys.values()))
 
-        start = 0
-        while start < len(keys):
-            batch = keys[start: start + batch_size]
-            batch_entries = self.api.get(batch)
-            if batch_entries is not None:
-                batch_entries = batch_entries.split("///\n")
-                # Remove possible empty last line
-                batch_entries = [e for e in batch_entries if e.strip()]
-                entries.extend(map(self.ENTRY_TYPE, batch_entries))
-            start += batch_size
+            for key in missing:
+                cached_entry = cached.get(cache_keys[key])
+                entry = self._entry_from_cache(cached_entry)
+                if entry is not None:
+                    self._entry_to_lru(key, cached_entry, entry)
+                entries[key] = entry
 
-        return entries
+        return [entries[key] for key in keys if entries[key] is not None]
 
     def _add_db(self, key):
         """
@@ -304,7 +345,7 @@ class GenomeEntry(entry.DBEntry):
 
     MULTIPLE_FIELDS = ["REFERENCE"]
 
-    def __init__(self, text):
+    def __init__(self, text=None):
         entry.DBEntry.__init__(self, text)
 
     @property
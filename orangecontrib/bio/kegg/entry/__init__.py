@@ -55,6 +55,45 @@ def entry_decorate(cls):
     return cls
 
 
+def parse_fields(text):
+    """
+    Parse `text` string containing a formated DBGET entry into a list of
+    (title, text, subsections) field tuples, where subsections is a list
+    of (title, text) tuples (or ``None`` if the field has none).
+
+    This is independent of the entry type and can be stored instead of
+    the text (see :func:`DBEntry.from_fields`).
+    """
+    parser = DBGETEntryParser()
+    field_tuples = []
+    current = None
+    current_subfield = None
+    for (event, title, text) in parser.parse_string(text):
+        if event == DBGETEntryParser.SECTION_START:
+            current = [title, text, None]
+        elif event == DBGETEntryParser.SECTION_END:
+            field_tuples.append(
+                (current[0], current[1],
+                 [tuple(sub) for sub in current[2]]
+                 if current[2] is not None else None))
+            current = None
+        elif event == DBGETEntryParser.SUBSECTION_START:
+            current_subfield = [title, text]
+            if current[2] is None:
+                current[2] = []
+        elif event == DBGETEntryParser.SUBSECTION_END:
+            current[2].append(current_subfield)
+            current_subfield = None
+        elif event == DBGETEntryParser.TEXT:
+            if current_subfield is not None:
+                current_subfield[1] += text
+            elif current is not None:
+                current[1] += text
+        elif event == DBGETEntryParser.ENTRY_END:
+            break
+    return field_tuples
+
+
 class DBEntry(object):
     """
     A DBGET entry object.
@@ -75,48 +114,40 @@ class DBEntry(object):
         """
         return self.entry.split(" ", 1)[0]
 
+    @classmethod
+    def from_fields(cls, field_tuples):
+        """
+        Create an entry from a list of field tuples (as returned by
+        :func:`parse_fields`) without parsing the text.
+        """
+        entry = cls()
+        entry._set_fields(field_tuples)
+        return entry
+
     def parse(self, text):
         """
         Parse `text` string containing a formated DBGET entry.
         """
-        parser = DBGETEntryParser()
-        gen = parser.parse_string(text)
+        self._set_fields(parse_fields(text))
+
+    def _set_fields(self, field_tuples):
         field_constructors = dict(self.FIELDS)
 
-        current = None
-        current_subfield = None
         entry_fields = []
-        for (event, title, text) in gen:
-            if event == DBGETEntryParser.SECTION_START:
-                if title in field_constructors:
-                    ftype = field_constructors[title]
-                else:
-                    ftype = fields.DBSimpleField
-                current = ftype(text)
-                if current.TITLE is None:
-                    current.TITLE = title
-            elif event == DBGETEntryParser.SECTION_END:
-                entry_fields.append(current)
-                current = None
-            elif event == DBGETEntryParser.SUBSECTION_START:
-                current_subfield = fields.DBSimpleField(text)
-                current_subfield.TITLE = title
-                if not isinstance(current, fields.DBFieldWithSubsections):
-                    # Upgrade simple fields to FieldWithSubsection
-                    new = fields.DBFieldWithSubsections(current.text)
-                    new.TITLE = current.TITLE
-                    current = new
-
-            elif event == DBGETEntryParser.SUBSECTION_END:
-                current.subsections.append(current_subfield)
-                current_subfield = None
-            elif event == DBGETEntryParser.TEXT:
-                if current_subfield is not None:
-                    current_subfield.text += text
-                elif current is not None:
-                    current.text += text
-            elif event == DBGETEntryParser.ENTRY_END:
-                break
+        for title, text, subsections in field_tuples:
+            ftype = field_constructors.get(title, fields.DBSimpleField)
+            if subsections is not None and \
+                    not issubclass(ftype, fields.DBFieldWithSubsections):
+                # Upgrade simple fields to FieldWithSubsection
+                ftype = fields.DBFieldWithSubsections
+            field = ftype(text)
+            if field.TITLE is None:
+                field.TITLE = title
+            for sub_title, sub_text in subsections or []:
+                subfield = fields.DBSimpleField(sub_text)
+                subfield.TITLE = sub_title
+                field.subsections.append(subfield)
+            entry_fields.append(field)
 
         self.fields = entry_fields
         self._consolidate()
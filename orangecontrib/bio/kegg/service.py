@@ -3,8 +3,17 @@
 """
 from __future__ import absolute_import
 
+import threading
+from multiprocessing.pool import ThreadPool
+
 REST_API = "http://rest.kegg.jp/"
 
+#: Maximum number of ids in a single DBGET `get` request.
+MAX_GET_IDS = 10
+
+#: Default number of concurrent requests of a :class:`ConcurrentFetcher`.
+MAX_WORKERS = 4
+
 
 def slumber_service():
     """
@@ -27,6 +36,103 @@ def slumber_service():
     return slumber_service._cached
 
 
+class ConcurrentFetcher(object):
+    """
+    Fetch KEGG DBGET entries with concurrent REST `get` requests.
+
+    At most `max_workers` requests are in flight at a time. Every worker
+    thread reuses its own persistent HTTP session (keep-alive
+    connections).
+
+    :param str base_url: REST API url (:obj:`REST_API` by default).
+    :param int max_workers: Number of concurrent requests.
+    :param float timeout: Request timeout (in seconds).
+
+    """
+    def __init__(self, base_url=None, max_workers=MAX_WORKERS, timeout=60):
+        if base_url is None:
+            base_url = REST_API
+        self.base_url = base_url.rstrip("/") + "/"
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._sessions = []
+        self._pool = None
+
+    def _session(self):
+        session = getattr(self._local, "session", None)
+        if session is None:
+            import requests
+            session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(
+                pool_connections=1, pool_maxsize=1, max_retries=3)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            self._local.session = session
+            with self._lock:
+                self._sessions.append(session)
+        return session
+
+    def get(self, ids):
+        """
+        Return the DBGET text for (at most :obj:`MAX_GET_IDS`) `ids`
+        (an empty string if none was found).
+        """
+        if len(ids) > MAX_GET_IDS:
+            raise ValueError("Can batch at most %i ids at a time." %
+                             MAX_GET_IDS)
+        response = self._session().get(
+            self.base_url + "get/" + "+".join(ids), timeout=self.timeout)
+        if response.status_code == 404:
+            return ""
+        response.raise_for_status()
+        return response.text
+
+    def map(self, batches):
+        """
+        Fetch all `batches` of ids and return an iterator over
+        (batch, text) tuples (in the order of completion).
+        """
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPool(self.max_workers)
+            pool = self._pool
+        return pool.imap_unordered(self._fetch, batches)
+
+    def _fetch(self, batch):
+        return batch, self.get(batch)
+
+    def close(self):
+        """
+        Stop the worker threads and close the HTTP sessions.
+        """
+        with self._lock:
+            pool, self._pool = self._pool, None
+            sessions, self._sessions = self._sessions, []
+        if pool is not None:
+            pool.close()
+            pool.join()
+        for session in sessions:
+            session.close()
+
+
+_shared_fetcher = None
+_shared_fetcher_lock = threading.Lock()
+
+
+def shared_fetcher():
+    """
+    Return a process wide :class:`ConcurrentFetcher` for the KEGG REST
+    api.
+    """
+    global _shared_fetcher
+    with _shared_fetcher_lock:
+        if _shared_fetcher is None:
+            _shared_fetcher = ConcurrentFetcher()
+        return _shared_fetcher
+
+
 from . import conf
 
 default_service = slumber_service
@@ -0,0 +1,337 @@
+"""
+Offline organism pathway snapshot
+=================================
+
+:class:`OrganismSnapshot` is a local index of the gene/pathway incidence
+for a single KEGG organism (built with three bulk KEGG REST calls and
+stored in :mod:`~orangecontrib.bio.utils.mmapstore` format). Pathway
+enrichment (:func:`OrganismSnapshot.enrichment`) runs entirely from the
+index without any network access.
+
+>>> snapshot = OrganismSnapshot.for_organism("hsa")  # doctest: +SKIP
+>>> snapshot.enrichment(["hsa:672", "hsa:675"])  # doctest: +SKIP
+{'path:hsa03440': (['hsa:672', 'hsa:675'], 1.3e-05, 41), ...
+
+"""
+from __future__ import absolute_import
+
+import os
+import re
+import glob
+from datetime import datetime
+
+import numpy
+
+from orangecontrib.bio import utils
+from orangecontrib.bio.utils import mmapstore
+
+from . import api
+from . import conf
+from .caching import touch_dir, _oldest_valid_mtime
+
+
+def _release_token(release):
+    """
+    Return a file name safe version of a KEGG `release` string.
+    """
+    return re.sub(r"[^0-9A-Za-z.+-]+", "_", release).strip("_")
+
+
+class OrganismSnapshot(object):
+    """
+    A gene/pathway incidence index of a KEGG organism.
+
+    :ivar str org: KEGG organism code.
+    :ivar str release: The KEGG release the snapshot was built from.
+    :ivar gene_keys: A sorted bytes array of gene ids (e.g. b"hsa:672").
+    :ivar pathway_keys: A sorted bytes array of pathway ids.
+    :ivar pathway_indptr: Pathway to gene CSR row pointers.
+    :ivar pathway_genes: Pathway to gene CSR column (gene) indices.
+    :ivar gene_indptr: Gene to pathway CSR row pointers.
+    :ivar gene_pathways: Gene to pathway CSR column (pathway) indices.
+
+    """
+    #: Version of the on disk format.
+    FORMAT_VERSION = 1
+
+    def __init__(self, org, release, gene_keys, pathway_keys,
+                 pathway_names, pathway_indptr, pathway_genes):
+        self.org = org
+        self.release = release
+        self.gene_keys = gene_keys
+        self.pathway_keys = pathway_keys
+        self.pathway_names = pathway_names
+        self.pathway_indptr = pathway_indptr
+        self.pathway_genes = pathway_genes
+
+        pathways = numpy.repeat(
+            numpy.arange(len(pathway_keys), dtype=numpy.int64),
+            numpy.diff(pathway_indptr))
+        self.gene_indptr, self.gene_pathways = mmapstore.csr(
+            pathway_genes, pathways, len(gene_keys))
+
+    @classmethod
+    def from_links(cls, org, release, genes, pathways, links):
+        """
+        Create the snapshot from a list of organism `genes` ids, a list
+        of (pathway id, name) `pathways` and (gene id, pathway id)
+        `links`. Genes and pathways referenced only by links are added.
+        """
+        links = [(g, p) for g, p in links]
+        genes = set(genes)
+        genes.update(g for g, _ in links)
+        genes = list(genes)
+        names = dict(pathways)
+        for _, p in links:
+            names.setdefault(p, "")
+        pathway_ids = list(names)
+
+        gene_keys, _ = mmapstore.sorted_keys(genes)
+        pathway_keys, order = mmapstore.sorted_keys(pathway_ids)
+        pathway_names = mmapstore.pack_strings(
+            [names[pathway_ids[i]] for i in order])
+
+        link_genes = mmapstore.key_indices(gene_keys, [g for g, _ in links])
+        link_pathways = mmapstore.key_indices(
+            pathway_keys, [p for _, p in links])
+        pathway_indptr, pathway_genes = mmapstore.csr(
+            link_pathways, link_genes, len(pathway_keys))
+        # duplicate links
+        if len(pathway_genes):
+            rows = numpy.repeat(numpy.arange(len(pathway_keys)),
+                                numpy.diff(pathway_indptr))
+            unique = numpy.ones(len(pathway_genes), dtype=bool)
+            unique[1:] = ((rows[1:] != rows[:-1]) |
+                          (pathway_genes[1:] != pathway_genes[:-1]))
+            pathway_indptr = numpy.zeros_like(pathway_indptr)
+            pathway_indptr[1:] = numpy.cumsum(
+                numpy.bincount(rows[unique], minlength=len(pathway_keys)))
+            pathway_genes = pathway_genes[unique]
+
+        return cls(org, release, gene_keys, pathway_keys,
+                   mmapstore.StringTable(*pathway_names),
+                   pathway_indptr, pathway_genes)
+
+    @classmethod
+    def build(cls, org, release=None, keggapi=None):
+        """
+        Build the snapshot for organism `org` from KEGG (using bulk
+        `list` and `link` calls).
+
+        An uncached :class:`~.api.KeggApi` is used by default. KEGG only
+        serves the current release, so a :class:`ValueError` is raised if
+        `release` is given and does not match it (the snapshot is always
+        labeled with the release it was built from).
+        """
+        if keggapi is None:
+            keggapi = api.KeggApi()
+        current = keggapi.info(org).release
+        if release is not None and release != current:
+            raise ValueError("Cannot build the {!r} snapshot for {!r} "
+                             "(current KEGG release is {!r})"
+                             .format(release, org, current))
+        return cls._fetch(org, current, keggapi)
+
+    @classmethod
+    def _fetch(cls, org, release, keggapi):
+        # build the snapshot labeled with the (verified) current `release`
+        genes = keggapi.get_genes_by_organism(org)
+        pathways = [(p.entry_id, p.definition)
+                    for p in keggapi.list_pathways(org)]
+        links = [(link.entry_id1, link.entry_id2)
+                 for link in keggapi.link("pathway", org)]
+        return cls.from_links(org, release, genes, pathways, links)
+
+    @classmethod
+    def filename(cls, org, release, cache_dir=None):
+        """
+        Return the snapshot file name for `org` and `release`.
+        """
+        if cache_dir is None:
+            cache_dir = conf.params["cache.path"]
+        return os.path.join(
+            os.path.expanduser(cache_dir),
+            "{}_pathways_{}.snapshot".format(org, _release_token(release)))
+
+    @classmethod
+    def load(cls, path):
+        """
+        Load (memory-map) the snapshot saved with :func:`save`.
+        """
+        meta, arrays = mmapstore.read(path, version=cls.FORMAT_VERSION)
+        return cls(meta["org"], meta["release"], arrays["gene_keys"],
+                   arrays["pathway_keys"],
+                   mmapstore.StringTable(arrays["pathway_names"],
+                                         arrays["pathway_name_offsets"]),
+                   arrays["pathway_indptr"], arrays["pathway_genes"])
+
+    def save(self, path):
+        """
+        Save the snapshot to `path`.
+        """
+        arrays = {"gene_keys": self.gene_keys,
+                  "pathway_keys": self.pathway_keys,
+                  "pathway_names": self.pathway_names.blob,
+                  "pathway_name_offsets": self.pathway_names.offsets,
+                  "pathway_indptr": self.pathway_indptr,
+                  "pathway_genes": self.pathway_genes}
+        meta = {"org": self.org, "release": self.release}
+        mmapstore.write(path, arrays, meta, version=self.FORMAT_VERSION)
+
+    @classmethod
+    def latest(cls, org, cache_dir=None):
+        """
+        Return the most recently saved local snapshot for `org` or
+        ``None`` if there is none or it is older than allowed by the
+        ``conf.params["cache.invalidate"]`` policy.
+        """
+        pattern = cls.filename(org, "", cache_dir).replace(
+            ".snapshot", "*.snapshot")
+        oldest = _oldest_valid_mtime(conf.params["cache.invalidate"])
+        for path in sorted(glob.glob(pattern), key=os.path.getmtime,
+                           reverse=True):
+            if oldest is not None and \
+                    datetime.fromtimestamp(os.path.getmtime(path)) < oldest:
+                break
+            try:
+                return cls.load(path)
+            except (IOError, OSError, ValueError):
+                continue
+        return None
+
+    @classmethod
+    def for_organism(cls, org, release=None, cache_dir=None, keggapi=None):
+        """
+        Return the snapshot for organism `org` and `release`.
+
+        If `release` is ``None`` the latest local snapshot is used (no
+        network access) unless it is older than allowed by the
+        ``conf.params["cache.invalidate"]`` policy, in which case the
+        current KEGG release is used. The snapshot is built and saved in
+        `cache_dir` (``conf.params["cache.path"]`` by default) if not
+        available locally.
+
+        """
+        if keggapi is None:
+            keggapi = api.KeggApi()
+        current = release is None
+        if release is None:
+            snapshot = cls.latest(org, cache_dir)
+            if snapshot is not None:
+                return snapshot
+            release = keggapi.info(org).release
+
+        path = cls.filename(org, release, cache_dir)
+        try:
+            snapshot = cls.load(path)
+        except (IOError, OSError, ValueError):
+            pass
+        else:
+            if current:
+                # still the current release; restart its validity period
+                os.utime(path, None)
+            return snapshot
+
+        if current:
+            snapshot = cls._fetch(org, release, keggapi)
+        else:
+            snapshot = cls.build(org, release, keggapi)
+        touch_dir(os.path.dirname(path))
+        snapshot.save(path)
+        return snapshot
+
+    def genes(self):
+        """
+        Return a list of all gene ids.
+        """
+        return [key.decode("utf-8") for key in self.gene_keys.tolist()]
+
+    def pathways(self):
+        """
+        Return a list of all pathway ids.
+        """
+        return [key.decode("utf-8") for key in self.pathway_keys.tolist()]
+
+    def pathway_name(self, pathway_id):
+        """
+        Return the name of pathway `pathway_id`.
+        """
+        i = mmapstore.key_index(self.pathway_keys, pathway_id)
+        if i < 0:
+            raise KeyError(pathway_id)
+        return self.pathway_names[i]
+
+    def genes_by_pathway(self, pathway_id):
+        """
+        Return a list of gene ids in pathway `pathway_id`.
+        """
+        i = mmapstore.key_index(self.pathway_keys, pathway_id)
+        if i < 0:
+            raise KeyError(pathway_id)
+        genes = self.pathway_genes[
+            self.pathway_indptr[i]:self.pathway_indptr[i + 1]]
+        return [key.decode("utf-8") for key in self.gene_keys[genes].tolist()]
+
+    def pathways_by_gene(self, gene_id):
+        """
+        Return a list of pathway ids including gene `gene_id`.
+        """
+        i = mmapstore.key_index(self.gene_keys, gene_id)
+        if i < 0:
+            return []
+        pathways = self.gene_pathways[
+            self.gene_indptr[i]:self.gene_indptr[i + 1]]
+        return [key.decode("utf-8")
+                for key in self.pathway_keys[pathways].tolist()]
+
+    def enrichment(self, genes, reference=None,
+                   prob=utils.stats.Binomial()):
+        """
+        Return a dictionary with enriched pathways ids as keys and
+        (list_of_genes, p_value, num_of_reference_genes) tuples as items
+        (only pathways with at least one gene from `genes` are included).
+
+        If `reference` is ``None`` all organism genes are used.
+
+        """
+        genes = list(genes)
+        npathways = len(self.pathway_keys)
+        gene_index = mmapstore.key_indices(self.gene_keys, genes)
+        query = numpy.flatnonzero(gene_index >= 0)
+        pos = mmapstore.gather(self.gene_indptr, gene_index[query])
+        hit_pathways = self.gene_pathways[pos]
+        hit_genes = numpy.repeat(
+            query, numpy.diff(self.gene_indptr)[gene_index[query]])
+        counts = numpy.bincount(hit_pathways, minlength=npathways)
+
+        if reference is None:
+            ref_size = len(self.gene_keys)
+            ref_counts = numpy.diff(self.pathway_indptr)
+        else:
+            reference = set(reference)
+            ref_size = len(reference)
+            ref_index = mmapstore.key_indices(self.gene_keys, list(reference))
+            in_reference = numpy.zeros(len(self.gene_keys), dtype=bool)
+            in_reference[ref_index[ref_index >= 0]] = True
+            rows = numpy.repeat(numpy.arange(npathways),
+                                numpy.diff(self.pathway_indptr))
+            ref_counts = numpy.bincount(
+                rows, weights=in_reference[self.pathway_genes],
+                minlength=npathways).astype(int)
+
+        enriched = numpy.flatnonzero(counts)
+        if not len(enriched):
+            return {}
+        p_values = prob.p_values(counts[enriched], ref_size,
+                                 ref_counts[enriched], len(genes))
+
+        # genes grouped by pathway (in input order)
+        order = numpy.argsort(hit_pathways, kind="mergesort")
+        groups = numpy.split(hit_genes[order],
+                             numpy.cumsum(counts[enriched])[:-1])
+        pathway_ids = self.pathway_keys[enriched].tolist()
+        return dict(
+            (pid.decode("utf-8"),
+             ([genes[i] for i in group], float(p), int(ref)))
+            for pid, group, p, ref in zip(pathway_ids, groups, p_values,
+                                          ref_counts[enriched]))
@@ -0,0 +1,372 @@
+import os
+import time
+import unittest
+import tempfile
+import shutil
+from contextlib import closing
+
+try:
+    from unittest import mock
+except ImportError:
+    import backports.unittest_mock
+    backports.unittest_mock.install()
+    from unittest import mock
+
+try:
+    from types import SimpleNamespace as namespace
+except ImportError:
+    class namespace(object):
+        def __init__(self, **kwargs): self.__dict__.update(kwargs)
+
+import threading
+from datetime import datetime, timedelta
+
+from six.moves import BaseHTTPServer, socketserver
+from six.moves.urllib.parse import unquote
+
+from orangecontrib.bio.kegg import caching
+from orangecontrib.bio.kegg import service
+from orangecontrib.bio.kegg import databases
+from orangecontrib.bio.kegg import conf as keggconf
+
+
+def entry_text(key):
+    return ("ENTRY       {}            Enzyme\n"
+            "NAME        Name of {}\n"
+            "///\n").format(key.split(":", 1)[1], key)
+
+
+class MockService(object):
+    def __init__(self):
+        self.requests = []
+
+    def get(self, ids):
+        self.requests.append(ids.split("+"))
+        text = "".join(entry_text(key) for key in ids.split("+")
+                       if not key.endswith("missing"))
+        return namespace(get=lambda: text)
+
+
+class LocalKeggServer(object):
+    """
+    A local stand-in for the KEGG REST `get` api (on a random port).
+    """
+    def __init__(self, requests=None, delay=0.0):
+        self.requests = [] if requests is None else requests
+        self.delay = delay
+        self.lock = threading.Lock()
+        self.in_flight = self.max_in_flight = 0
+        self.connections = set()
+        server = self
+
+        class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                with server.lock:
+                    server.in_flight += 1
+                    server.max_in_flight = max(server.max_in_flight,
+                                               server.in_flight)
+                    server.connections.add(self.client_address)
+                time.sleep(server.delay)
+                ids = unquote(self.path).split("/get/", 1)[1].split("+")
+                server.requests.append(ids)
+                text = "".join(entry_text(key) for key in ids
+                               if not key.endswith("missing"))
+                body = text.encode("utf-8")
+                with server.lock:
+                    server.in_flight -= 1
+                self.send_response(200 if body else 404)
+                self.send_header("Content-Type", "text/plain")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        class Server(socketserver.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+            daemon_threads = True
+
+        self.httpd = Server(("127.0.0.1", 0), Handler)
+        self.url = "http://127.0.0.1:{}/".format(self.httpd.server_address[1])
+        self.thread = threading.Thread(target=self.httpd.serve_forever,
+                                       kwargs={"poll_interval": 0.05})
+        self.thread.daemon = True
+        self.thread.start()
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def wait_compaction():
+    for state in list(caching._states.values()):
+        thread = state.compacting
+        if thread is not None:
+            thread.join()
+
+
+class ECDatabase(databases.DBDataBase):
+    DB = "ec"
+    ENTRY_TYPE = databases.EnzymeEntry
+
+
+class TestSqlite3Store(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix="kegg-tests")
+        self.filename = os.path.join(self.tmpdir, "cache.sqlite3")
+
+    def tearDown(self):
+        wait_compaction()
+        caching.sqlitepool.release(self.filename)
+        caching._forget_state(self.filename)
+        shutil.rmtree(self.tmpdir)
+
+    def test_store(self):
+        store = caching.Sqlite3Store(self.filename)
+        self.assertEqual(
+            store.con.execute("PRAGMA journal_mode").fetchone()[0], "wal")
+        store["a"] = [1, 2]
+        self.assertEqual(store["a"], [1, 2])
+        self.assertIn("a", store)
+        self.assertNotIn("b", store)
+        with self.assertRaises(KeyError):
+            store["b"]
+
+        store.set_many([("b", 2), ("c", {"c": 3})])
+        # all stores for the file share the connections
+        other = caching.Sqlite3Store(self.filename)
+        self.assertIs(other.con, store.con)
+        self.assertEqual(other.get_many(["a", "c", "x", "c"]),
+                         {"a": [1, 2], "c": {"c": 3}})
+        self.assertEqual(len(other), 3)
+        self.assertEqual(sorted(other), ["a", "b", "c"])
+        del other["b"]
+        self.assertEqual(sorted(store.keys()), ["a", "c"])
+
+        keys = ["key%i" % i for i in range(2000)]
+        store.set_many((key, i) for i, key in enumerate(keys))
+        values = store.get_many(keys)
+        self.assertEqual([values[key] for key in keys], list(range(2000)))
+
+    def test_rollback(self):
+        store = caching.Sqlite3Store(self.filename)
+        with self.assertRaises(Exception):
+            store.set_many([("a", 1), ("b", lambda: None)])
+        self.assertEqual(store.get_many(["a", "b"]), {})
+
+
+    def test_compact(self):
+        store = caching.Sqlite3Store(self.filename, max_size=0)
+        store.set_many(("key%i" % i, "x" * 1000) for i in range(100))
+        size = store.size()
+        self.assertGreater(size, 100000)
+        self.assertEqual(store.compact(), 0)
+        # make the first keys the most recently used
+        time.sleep(0.01)
+        store.get_many(["key%i" % i for i in range(10)])
+        evicted = store.compact(max_size=size // 2)
+        self.assertGreater(evicted, 0)
+        self.assertLessEqual(store.size(), size // 2)
+        self.assertEqual(len(store), 100 - evicted)
+        self.assertEqual(len(store.get_many("key%i" % i for i in range(10))),
+                         10)
+        self.assertNotIn("key10", store)
+
+    def test_compact_background(self):
+        store = caching.Sqlite3Store(self.filename, max_size=50000)
+        wait_compaction()
+        for i in range(20):
+            store.set_many(("key%i-%i" % (i, j), "x" * 1000)
+                           for j in range(10))
+            wait_compaction()
+        self.assertLessEqual(store.size(), 50000)
+        self.assertIn("key19-9", store)
+        self.assertNotIn("key0-0", store)
+
+    def test_migrate(self):
+        con = caching.sqlite3.connect(self.filename)
+        con.execute("CREATE TABLE cache (key TEXT UNIQUE, value TEXT)")
+        con.execute("INSERT INTO cache VALUES (?, ?)",
+                    ("a", caching.pickle.dumps(1)))
+        con.commit()
+        con.close()
+        store = caching.Sqlite3Store(self.filename)
+        self.assertEqual(store["a"], 1)
+        self.assertGreater(store.size(), 0)
+        store["b"] = 2
+        self.assertEqual(store.get_many(["a", "b"]), {"a": 1, "b": 2})
+
+
+class CachedApiTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix="kegg-tests")
+        self._old_cache_path = keggconf.params["cache.path"]
+        keggconf.params["cache.path"] = self.tmpdir
+        self._old_invalidate = keggconf.params["cache.invalidate"]
+        keggconf.params["cache.invalidate"] = "weekly"
+        with mock.patch("orangecontrib.bio.kegg.api.web_service",
+                        MockService):
+            self.db = ECDatabase()
+        self.service = self.db.api.service
+        self.server = LocalKeggServer(self.service.requests)
+        databases._entry_cache.clear()
+        self.db.api.fetcher = service.ConcurrentFetcher(self.server.url)
+
+    def tearDown(self):
+        self.db.api.fetcher.close()
+        self.server.close()
+        wait_compaction()
+        keggconf.params["cache.path"] = self._old_cache_path
+        keggconf.params["cache.invalidate"] = self._old_invalidate
+        filename = os.path.join(self.tmpdir, "kegg_api_cache_2.sqlite3")
+        caching.sqlitepool.release(filename)
+        caching._forget_state(filename)
+        shutil.rmtree(self.tmpdir)
+
+    def new_database(self):
+        with mock.patch("orangecontrib.bio.kegg.api.web_service",
+                        lambda: self.service):
+            db = ECDatabase()
+        db.api.fetcher = self.db.api.fetcher
+        return db
+
+
+class TestBatchGet(CachedApiTestCase):
+    def test_pre_cache(self):
+        keys = ["1.1.1.%i" % i for i in range(25)]
+        self.db.pre_cache(keys[:5])
+        self.assertEqual(len(self.service.requests), 1)
+        self.db.pre_cache(keys)
+        # only the uncached keys are requested
+        self.assertEqual([len(r) for r in self.service.requests],
+                         [5, 10, 10])
+        self.db.pre_cache(keys)
+        self.assertEqual(len(self.service.requests), 3)
+
+        entries = self.db.batch_get(keys[::-1])
+        self.assertEqual(len(self.service.requests), 3)
+        self.assertEqual([e.entry_key for e in entries], keys[::-1])
+        self.assertEqual(self.db.get_entry(keys[3]).entry_key, keys[3])
+
+    def test_batch_get_missing(self):
+        entries = self.db.batch_get(["1.1.1.1", "1.1.1.missing", "1.1.1.2"])
+        self.assertEqual([e.entry_key for e in entries],
+                         ["1.1.1.1", "1.1.1.2"])
+        text = self.db.api.get(["ec:1.1.1.1", "ec:1.1.1.2"])
+        self.assertEqual(text, entry_text("ec:1.1.1.1") +
+                         entry_text("ec:1.1.1.2"))
+        self.assertEqual(len(self.service.requests), 1)
+
+    def test_release(self):
+        keys = ["1.1.1.1", "1.1.1.2"]
+        self.db.api.set_default_release("Release 81.0")
+        self.db.pre_cache(keys)
+        self.db.pre_cache(keys)
+        self.assertEqual(len(self.service.requests), 1)
+        self.db.api.set_default_release("Release 82.0")
+        self.db.pre_cache(keys)
+        self.assertEqual(len(self.service.requests), 2)
+        self.db.pre_cache(keys)
+        self.assertEqual(len(self.service.requests), 2)
+
+    def test_invalidate(self):
+        keys = ["1.1.1.1", "1.1.1.2"]
+        self.db.pre_cache(keys)
+        get = self.db.api.get
+        with closing(get.cache_store()) as store:
+            key = get.key_from_args(("ec:1.1.1.1",))
+            entry = store[key]
+            self.assertTrue(get.is_entry_valid(entry, None))
+            entry.mtime = datetime.now() - timedelta(8)
+            self.assertFalse(get.is_entry_valid(entry, None))
+            store[key] = entry
+        self.db.pre_cache(keys)
+        self.assertEqual(self.service.requests[-1], ["ec:1.1.1.1"])
+
+        keggconf.params["cache.invalidate"] = "always"
+        self.db.pre_cache(keys)
+        self.assertEqual(len(self.service.requests), 3)
+        keggconf.params["cache.invalidate"] = "session"
+        self.db.pre_cache(keys)
+        self.assertEqual(len(self.service.requests), 3)
+
+
+class TestConcurrentFetcher(unittest.TestCase):
+    def setUp(self):
+        self.server = LocalKeggServer(delay=0.02)
+        self.fetcher = service.ConcurrentFetcher(self.server.url,
+                                                 max_workers=3)
+
+    def tearDown(self):
+        self.fetcher.close()
+        self.server.close()
+
+    def test_get(self):
+        self.assertEqual(self.fetcher.get(["ec:1.1.1.1", "ec:1.1.1.2"]),
+                         entry_text("ec:1.1.1.1") + entry_text("ec:1.1.1.2"))
+        self.assertEqual(self.fetcher.get(["ec:1.1.1.missing"]), "")
+        with self.assertRaises(ValueError):
+            self.fetcher.get(["ec:1.1.1.%i" % i for i in range(11)])
+
+    def test_map(self):
+        batches = [["ec:1.1.{}.{}".format(i, j) for j in range(10)]
+                   for i in range(30)]
+        results = list(self.fetcher.map(batches))
+        self.assertEqual(sorted(batch for batch, _ in results), sorted(batches))
+        for batch, text in results:
+            self.assertEqual(text, "".join(map(entry_text, batch)))
+        # requests are concurrent, but bounded
+        self.assertGreater(self.server.max_in_flight, 1)
+        self.assertLessEqual(self.server.max_in_flight, 3)
+        # and reuse the connections
+        self.assertLessEqual(len(self.server.connections), 3)
+
+
+class TestParsedEntries(CachedApiTestCase):
+    def test_get_entry(self):
+        keys = ["1.1.1.%i" % i for i in range(15)]
+        self.db.pre_cache(keys)
+        get = self.db.api.get
+        with closing(get.cache_store()) as store:
+            cached = store[get.key_from_args(("ec:1.1.1.1",))]
+        self.assertEqual(cached.parsed[0][0], "ENTRY")
+
+        with mock.patch.object(databases.EnzymeEntry, "parse") as parse:
+            entry = self.db.get_entry("1.1.1.1")
+            entries = self.db.batch_get(keys)
+            self.assertEqual(parse.call_count, 0)
+        self.assertEqual(entry.entry_key, "1.1.1.1")
+        self.assertEqual(entry.name, cached.value.split("\n")[1][12:])
+        self.assertEqual([e.entry_key for e in entries], keys)
+        # repeated access returns the in-memory entry
+        self.assertIs(self.db.get_entry("ec:1.1.1.1"), entry)
+        self.assertIs(self.db.batch_get(["1.1.1.1"])[0], entry)
+        self.assertIs(self.new_database().get_entry("1.1.1.1"), entry)
+
+        # entries cached without the parsed form are parsed
+        cached.parsed = None
+        with closing(get.cache_store()) as store:
+            store[get.key_from_args(("ec:1.1.1.1",))] = cached
+        databases._entry_cache.clear()
+        self.assertEqual(self.db.get_entry("1.1.1.1").entry_key, "1.1.1.1")
+        self.assertEqual(self.db.get_text("1.1.1.2"), entry_text("ec:1.1.1.2"))
+        self.assertEqual(len(self.service.requests), 2)
+
+        self.db.api.set_default_release("Release 82.0")
+        self.assertIsNot(self.db.get_entry("1.1.1.1"), entry)
+        self.assertEqual(len(self.service.requests), 3)
+
+    def test_expired_entry(self):
+        entry = self.db.get_entry("1.1.1.1")
+        self.assertIs(self.db.batch_get(["1.1.1.1"])[0], entry)
+        # parsed entries expire with the cache.invalidate policy
+        for stamp, _ in databases._entry_cache._items.values():
+            stamp.mtime -= timedelta(days=8)
+        self.assertIsNot(self.db.get_entry("1.1.1.1"), entry)
+        entry = self.db.get_entry("1.1.1.1")
+        for stamp, _ in databases._entry_cache._items.values():
+            stamp.mtime -= timedelta(days=8)
+        self.assertIsNot(self.db.batch_get(["1.1.1.1"])[0], entry)
+        self.assertEqual(len(self.service.requests), 1)
@@ -3,7 +3,10 @@ import doctest
 
 import unittest
 
-from orangecontrib.bio.kegg.entry import parser, fields, DBEntry, entry_decorate
+import pickle
+
+from orangecontrib.bio.kegg.entry import parser, fields, DBEntry, \
+    entry_decorate, parse_fields
 
 
 TEST_ENTRY = """\
@@ -33,6 +36,26 @@ class TestEntry(unittest.TestCase):
         self.assertEqual(entry.ENTRY.TITLE, "ENTRY")
         self.assertEqual(str(entry), TEST_ENTRY[:-4])
 
+    def test_from_fields(self):
+        parsed = parse_fields(TEST_ENTRY)
+        self.assertEqual(parsed[0], ("ENTRY", "test_id    something else\n",
+                                     None))
+        self.assertEqual(
+            parsed[2],
+            ("DESCRIPTION",
+             "This is a test's description.\nIt spans\nmultiple lines\n",
+             [("SUB", "This is a description's sub\nsection\n")]))
+        # the stored (pickled) form round trips
+        parsed = pickle.loads(pickle.dumps(parsed))
+        entry = Entry.from_fields(parsed)
+        expected = Entry(TEST_ENTRY)
+        self.assertEqual(entry.entry_key, "test_id")
+        self.assertEqual(str(entry), str(expected))
+        self.assertEqual([type(f) for f in entry.fields],
+                         [type(f) for f in expected.fields])
+        self.assertIsInstance(entry.DESCRIPTION,
+                              fields.DBFieldWithSubsections)
+
 
 class TestParser(unittest.TestCase):
     def test_parser(self):
@@ -0,0 +1,189 @@
+import unittest
+import tempfile
+import shutil
+import os
+import time
+
+try:
+    from types import SimpleNamespace as namespace
+except ImportError:
+    class namespace(object):
+        def __init__(self, **kwargs): self.__dict__.update(kwargs)
+
+from orangecontrib.bio.utils import stats
+from orangecontrib.bio.kegg import conf
+from orangecontrib.bio.kegg.types import Definition, Link
+from orangecontrib.bio.kegg.snapshot import OrganismSnapshot
+
+
+class MockKeggApi(object):
+    genes = ["hsa:1", "hsa:2", "hsa:3", "hsa:4", "hsa:5", "hsa:6"]
+    pathways = [("path:hsa00010", "Glycolysis"),
+                ("path:hsa00020", "Citrate cycle"),
+                ("path:hsa00030", "Pentose phosphate pathway")]
+    links = [("hsa:1", "path:hsa00010"), ("hsa:2", "path:hsa00010"),
+             ("hsa:3", "path:hsa00010"), ("hsa:2", "path:hsa00020"),
+             ("hsa:4", "path:hsa00020"), ("hsa:5", "path:hsa00030"),
+             ("hsa:2", "path:hsa00010")]
+
+    def __init__(self, release="Release 81.0+/01-18, Jan 17"):
+        self.release = release
+        self.calls = []
+
+    def info(self, db):
+        self.calls.append("info")
+        return namespace(release=self.release)
+
+    def get_genes_by_organism(self, org):
+        self.calls.append("list")
+        return list(self.genes)
+
+    def list_pathways(self, org):
+        self.calls.append("list pathway")
+        return [Definition(*p) for p in self.pathways]
+
+    def link(self, target_db, source_db=None, ids=None):
+        self.calls.append("link")
+        return [Link(*link) for link in self.links]
+
+
+def reference_enrichment(api, genes, reference=None,
+                         prob=stats.Binomial()):
+    # A direct (slow) implementation of Organism.get_enriched_pathways
+    if reference is None:
+        reference = api.genes
+    reference = set(reference)
+    members = {}
+    for gene, pathway in api.links:
+        members.setdefault(pathway, set()).add(gene)
+    hits = {}
+    for gene in genes:
+        for pathway, pgenes in sorted(members.items()):
+            if gene in pgenes:
+                hits.setdefault(pathway, []).append(gene)
+    items = sorted(hits.items())
+    ref_counts = [len(reference & members[pid]) for pid, _ in items]
+    p_values = prob.p_values([len(g) for _, g in items], len(reference),
+                             ref_counts, len(genes))
+    return dict((pid, (g, float(p), ref))
+                for (pid, g), p, ref in zip(items, p_values, ref_counts))
+
+
+class TestOrganismSnapshot(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix="kegg-tests")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_build(self):
+        api = MockKeggApi()
+        snapshot = OrganismSnapshot.build("hsa", keggapi=api)
+        self.assertEqual(snapshot.release, api.release)
+        self.assertEqual(snapshot.genes(), api.genes)
+        self.assertEqual(snapshot.pathways(),
+                         ["path:hsa00010", "path:hsa00020", "path:hsa00030"])
+        self.assertEqual(snapshot.genes_by_pathway("path:hsa00010"),
+                         ["hsa:1", "hsa:2", "hsa:3"])
+        self.assertEqual(snapshot.pathways_by_gene("hsa:2"),
+                         ["path:hsa00010", "path:hsa00020"])
+        self.assertEqual(snapshot.pathways_by_gene("hsa:6"), [])
+        self.assertEqual(snapshot.pathways_by_gene("hsa:100"), [])
+        self.assertEqual(snapshot.pathway_name("path:hsa00020"),
+                         "Citrate cycle")
+        with self.assertRaises(KeyError):
+            snapshot.genes_by_pathway("path:hsa99999")
+
+    def test_build_release(self):
+        api = MockKeggApi()
+        snapshot = OrganismSnapshot.build("hsa", api.release, keggapi=api)
+        self.assertEqual(snapshot.release, api.release)
+        # KEGG only serves the current release
+        with self.assertRaises(ValueError):
+            OrganismSnapshot.build("hsa", "Release 80.0", keggapi=api)
+        self.assertEqual(api.calls, ["info", "list", "list pathway", "link",
+                                     "info"])
+
+    def test_enrichment(self):
+        api = MockKeggApi()
+        snapshot = OrganismSnapshot.build("hsa", keggapi=api)
+        for genes, reference in [
+                (["hsa:2", "hsa:1", "hsa:100"], None),
+                (["hsa:2", "hsa:2", "hsa:5"], None),
+                (["hsa:1", "hsa:4"], ["hsa:1", "hsa:2", "hsa:4", "hsa:7"]),
+                (["hsa:6"], None),
+                ([], None)]:
+            for prob in [stats.Binomial(), stats.Hypergeometric()]:
+                result = snapshot.enrichment(genes, reference, prob)
+                expected = reference_enrichment(api, genes, reference, prob)
+                self.assertEqual(sorted(result), sorted(expected))
+                for pid in expected:
+                    self.assertEqual(result[pid][0], expected[pid][0])
+                    self.assertAlmostEqual(result[pid][1], expected[pid][1])
+                    self.assertEqual(result[pid][2], expected[pid][2])
+
+    def test_for_organism(self):
+        api = MockKeggApi()
+        snapshot = OrganismSnapshot.for_organism(
+            "hsa", cache_dir=self.tmpdir, keggapi=api)
+        self.assertEqual(api.calls, ["info", "list", "list pathway", "link"])
+        path = OrganismSnapshot.filename("hsa", api.release, self.tmpdir)
+        self.assertTrue(os.path.exists(path))
+
+        # The local snapshot is used without any KEGG calls
+        api.calls = []
+        loaded = OrganismSnapshot.for_organism(
+            "hsa", cache_dir=self.tmpdir, keggapi=api)
+        self.assertEqual(api.calls, [])
+        self.assertEqual(loaded.release, api.release)
+        self.assertEqual(loaded.genes(), snapshot.genes())
+        self.assertEqual(loaded.enrichment(["hsa:1", "hsa:2"]),
+                         snapshot.enrichment(["hsa:1", "hsa:2"]))
+
+        # A new release is built and saved alongside
+        api = MockKeggApi(release="Release 82.0")
+        OrganismSnapshot.for_organism(
+            "hsa", release="Release 82.0", cache_dir=self.tmpdir,
+            keggapi=api)
+        self.assertEqual(api.calls, ["info", "list", "list pathway", "link"])
+        self.assertEqual(len(os.listdir(self.tmpdir)), 2)
+
+        # Corrupted file is rebuilt
+        with open(path, "wb") as f:
+            f.write(b"garbage")
+        api = MockKeggApi()
+        OrganismSnapshot.for_organism(
+            "hsa", release=api.release, cache_dir=self.tmpdir, keggapi=api)
+        self.assertEqual(OrganismSnapshot.load(path).release, api.release)
+
+    def test_for_organism_expired(self):
+        policy = conf.params["cache.invalidate"]
+        self.addCleanup(conf.params.__setitem__, "cache.invalidate", policy)
+        conf.params["cache.invalidate"] = "weekly"
+
+        api = MockKeggApi()
+        OrganismSnapshot.for_organism(
+            "hsa", cache_dir=self.tmpdir, keggapi=api)
+        path = OrganismSnapshot.filename("hsa", api.release, self.tmpdir)
+        old = time.time() - 8 * 24 * 3600
+        os.utime(path, (old, old))
+
+        # An expired snapshot of the current release is reused (and renewed)
+        api.calls = []
+        OrganismSnapshot.for_organism(
+            "hsa", cache_dir=self.tmpdir, keggapi=api)
+        self.assertEqual(api.calls, ["info"])
+        self.assertGreater(os.path.getmtime(path), old)
+        api.calls = []
+        OrganismSnapshot.for_organism(
+            "hsa", cache_dir=self.tmpdir, keggapi=api)
+        self.assertEqual(api.calls, [])
+
+        # An expired snapshot of an old release is replaced
+        os.utime(path, (old, old))
+        api = MockKeggApi(release="Release 82.0")
+        snapshot = OrganismSnapshot.for_organism(
+            "hsa", cache_dir=self.tmpdir, keggapi=api)
+        self.assertEqual(snapshot.release, "Release 82.0")
+        self.assertEqual(api.calls, ["info", "list", "list pathway", "link"])
+        self.assertEqual(len(os.listdir(self.tmpdir)), 2)
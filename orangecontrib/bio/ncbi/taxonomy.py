@@ -7,6 +7,7 @@ import collections
 import textwrap
 
 from collections import namedtuple
+from contextlib import closing
 
 try:
     from urllib2 import urlopen
@@ -15,6 +16,8 @@ except ImportError:
 
 import six
 
+from ..utils import sqlitepool
+
 __all__ = ["Taxonomy"]
 
 pjoin = os.path.join
@@ -48,11 +51,20 @@ class taxon(_taxon):
 class Taxonomy(collections.Mapping):
     SCHEMA_VERSION = (0, 0, 1)
 
-    def __init__(self, taxdb):
-        self._con = sqlite3.connect(taxdb, timeout=15)
-        self._con.execute("""
+    def __init__(self, taxdb, readonly=False):
+        # Indexes are created through a separate connection (the shared
+        # connections can be read-only).
+        with closing(sqlite3.connect(taxdb, timeout=15)) as con:
+            self.create_db_index(con)
+        self._con = sqlitepool.shared(taxdb, readonly=readonly, timeout=15)
+
+    @classmethod
+    def create_db_index(cls, con):
+        con.executescript("""
             CREATE INDEX IF NOT EXISTS
-                index_names_tax_id ON names(tax_id)
+                index_names_tax_id ON names(tax_id);
+            CREATE INDEX IF NOT EXISTS
+                index_names_name ON names(name);
         """)
 
     def __node_query(self, tax_id):
@@ -98,11 +110,6 @@ class Taxonomy(collections.Mapping):
         return next(c)[0]
 
     def search(self, name, exact=True):
-        # First ensure the name column is indexed.
-        self._con.execute("""
-            CREATE INDEX IF NOT EXISTS
-                index_names_name ON names(name)""")
-
         if not exact:
             name = "{0}%".format(name)
             operator = "LIKE"
@@ -269,4 +276,5 @@ class Taxonomy(collections.Mapping):
                             for tax_id, name, name_class in names))
 
         con.commit()
+        cls.create_db_index(con)
         con.close()
@@ -14,13 +14,20 @@ import sqlite3
 import errno
 import posixpath
 import textwrap
+import warnings
+import itertools
+import io
 
 
 from io import StringIO, BytesIO
 from collections import defaultdict, namedtuple
 from operator import itemgetter
 
+import numpy
+
 from .utils import serverfiles
+from .utils import mmapstore
+from .utils import sqlitepool
 try:
     from Orange.utils import ConsoleProgressBar, wget
 except ImportError:
@@ -45,6 +52,84 @@ from . import taxonomy
 from .taxonomy import pickled_cache
 
 
+#: Number of values bound in a single ``IN (...)`` clause (must stay below
+#: SQLite's default limit of 999 host parameters).
+SQL_CHUNK_SIZE = 900
+
+
+def chunks(sequence, size=SQL_CHUNK_SIZE):
+    """
+    Split `sequence` into lists of at most `size` elements.
+    """
+    sequence = list(sequence)
+    for start in range(0, len(sequence), size):
+        yield sequence[start: start + size]
+
+
+def placeholders(n):
+    """
+    Return a string of `n` comma separated SQL parameter placeholders.
+    """
+    return ", ".join(["?"] * n)
+
+
+#: Number of rows inserted by a single ``executemany`` call when building
+#: the databases from flat files.
+INSERT_CHUNK_SIZE = 50000
+
+
+def read_chunks(filename, delimiter, chunksize=INSERT_CHUNK_SIZE,
+                progress=None):
+    """
+    Read a gzipped `delimiter` separated flat file (skipping the header
+    line) in lists of at most `chunksize` rows (lists of fields).
+
+    If `progress` is not ``None`` it is called with the number of
+    (compressed) bytes read since the previous call after every chunk.
+
+    """
+    with open(filename, "rb") as raw:
+        lines = io.TextIOWrapper(gzip.GzipFile(fileobj=raw, mode="rb"),
+                                 encoding="utf-8")
+        lines.readline()  # read the header line
+        position = 0
+        while True:
+            chunk = [line.rstrip("\n").split(delimiter)
+                     for line in itertools.islice(lines, chunksize)]
+            if progress is not None:
+                progress(raw.tell() - position)
+                position = raw.tell()
+            if not chunk:
+                break
+            yield chunk
+
+
+def bulk_load_connection(filename):
+    """
+    Connect to a new sqlite database at `filename` configured for bulk
+    loading (no rollback journal and no syncing to disk).
+    """
+    con = sqlite3.connect(filename)
+    con.execute("PRAGMA journal_mode=OFF")
+    con.execute("PRAGMA synchronous=OFF")
+    return con
+
+
+class BytesProgress(object):
+    """
+    Accumulate the number of bytes processed out of `total` and report
+    it to `callback(processed, total)`.
+    """
+    def __init__(self, total, callback):
+        self.total = total
+        self.processed = 0
+        self.callback = callback
+
+    def __call__(self, nbytes):
+        self.processed += nbytes
+        self.callback(self.processed, self.total)
+
+
 def mkdir_p(path, mode=0o777):
     try:
         os.makedirs(path, mode)
@@ -55,6 +140,292 @@ def mkdir_p(path, mode=0o777):
             raise
 
 
+def _codes(values):
+    """
+    Dictionary encode `values`. Return the (sorted) list of distinct
+    values and an int16 array of codes.
+    """
+    names = sorted(set(values))
+    index = dict((name, i) for i, name in enumerate(names))
+    return names, numpy.array([index[v] for v in values], dtype=numpy.int16)
+
+
+class PPIAdjacency(object):
+    """
+    A compressed sparse row (CSR) adjacency of a protein-protein
+    interaction network.
+
+    Proteins are coded by their index in the sorted array of protein ids
+    (see :func:`index` and :func:`index_many`); node arguments of all
+    methods are arrays of such indices. For each node `i` its
+    neighbours are ``indices[indptr[i]:indptr[i + 1]]`` with scores
+    ``scores[indptr[i]:indptr[i + 1]]``.
+
+    If available (STRING) the actions are stored in a separate CSR
+    structure with `mode` and `action` codes (see `mode_names` and
+    `action_names`).
+
+    Use :func:`PPIDatabase.adjacency` to get the (cached) adjacency of
+    a database.
+
+    """
+    #: Version of the on disk format.
+    FORMAT_VERSION = 1
+
+    def __init__(self, keys, indptr, indices, scores, actions=None,
+                 mode_names=(), action_names=(), meta=None):
+        self.keys = keys
+        self.indptr = indptr
+        self.indices = indices
+        self.scores = scores
+        if actions is None:
+            actions = (numpy.zeros(len(keys) + 1, dtype=numpy.int64),) + \
+                      tuple(numpy.zeros(0, dtype=dtype) for dtype in
+                            [numpy.int32, numpy.int16, numpy.int16,
+                             numpy.int16])
+        (self.action_indptr, self.action_targets, self.action_modes,
+         self.action_types, self.action_scores) = actions
+        self.mode_names = list(mode_names)
+        self.action_names = list(action_names)
+        self.meta = dict(meta or {})
+
+    @classmethod
+    def from_edges(cls, ids, edges, actions=(), symmetrize=False,
+                   score_dtype=numpy.int16, missing_score=-1):
+        """
+        Create the adjacency from protein `ids`, a sequence of
+        (id1, id2, score) `edges` and (optionally) a sequence of
+        (id1, id2, mode, action, score) `actions`. Proteins referenced
+        only by edges are added to the nodes.
+
+        If `symmetrize` is ``True`` add the (id2, id1) edge for every
+        (id1, id2) edge. Missing (``None``) scores are stored as
+        `missing_score`.
+
+        """
+        edges = list(edges)
+        actions = list(actions)
+        ids = set(ids)
+        ids.update(e[0] for e in edges)
+        ids.update(e[1] for e in edges)
+        ids = list(ids)
+        keys, order = mmapstore.sorted_keys(ids)
+        index = dict((ids[j], i) for i, j in enumerate(order))
+        nnodes = len(ids)
+
+        def endpoints(records):
+            source = numpy.array([index[r[0]] for r in records],
+                                 dtype=numpy.int32)
+            target = numpy.array([index[r[1]] for r in records],
+                                 dtype=numpy.int32)
+            return source, target
+
+        def score_array(scores, dtype):
+            return numpy.array(
+                [missing_score if s is None else s for s in scores],
+                dtype=dtype)
+
+        sources, targets = endpoints(edges)
+        scores = score_array([e[2] for e in edges], score_dtype)
+        if symmetrize:
+            sources, targets = (numpy.r_[sources, targets],
+                                numpy.r_[targets, sources])
+            scores = numpy.r_[scores, scores]
+        indptr, indices, scores = mmapstore.csr(
+            sources, targets, nnodes, scores)
+
+        # Actions can reference proteins without links
+        actions = [a for a in actions if a[0] in index and a[1] in index]
+        mode_names, modes = _codes([a[2] for a in actions])
+        action_names, types = _codes([a[3] for a in actions])
+        a_sources, a_targets = endpoints(actions)
+        a_scores = score_array([a[4] for a in actions], numpy.int16)
+        actions = mmapstore.csr(
+            a_sources, a_targets, nnodes, modes, types, a_scores)
+
+        return cls(keys, indptr, indices, scores, actions,
+                   mode_names, action_names)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Load (memory-map) the adjacency saved with :func:`save`.
+        """
+        meta, arrays = mmapstore.read(path, version=cls.FORMAT_VERSION)
+        actions = tuple(arrays[name] for name in
+                        ["action_indptr", "action_targets", "action_modes",
+                         "action_types", "action_scores"])
+        return cls(arrays["keys"], arrays["indptr"], arrays["indices"],
+                   arrays["scores"], actions, meta["mode_names"],
+                   meta["action_names"], meta["meta"])
+
+    def save(self, path):
+        """
+        Save the adjacency to `path` (in :mod:`utils.mmapstore` format).
+        """
+        arrays = {"keys": self.keys, "indptr": self.indptr,
+                  "indices": self.indices, "scores": self.scores,
+                  "action_indptr": self.action_indptr,
+                  "action_targets": self.action_targets,
+                  "action_modes": self.action_modes,
+                  "action_types": self.action_types,
+                  "action_scores": self.action_scores}
+        meta = {"mode_names": self.mode_names,
+                "action_names": self.action_names,
+                "meta": self.meta}
+        mmapstore.write(path, arrays, meta, version=self.FORMAT_VERSION)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def ids(self, nodes=None):
+        """
+        Return a list of protein ids of `nodes` (all if ``None``).
+        """
+        keys = self.keys if nodes is None else self.keys[nodes]
+        return [key.decode("utf-8") for key in keys.tolist()]
+
+    def index(self, id):
+        """
+        Return the node index of protein `id` (or -1 if not present).
+        """
+        return mmapstore.key_index(self.keys, id)
+
+    def index_many(self, ids):
+        """
+        Return an array of node indices of protein `ids` (-1 for ids
+        not present).
+        """
+        return mmapstore.key_indices(self.keys, ids)
+
+    def degrees(self):
+        """
+        Return an array of node degrees (number of stored edges).
+        """
+        return numpy.diff(self.indptr)
+
+    def edges(self, nodes=None, min_score=None):
+        """
+        Return the (sources, targets, scores) arrays of all edges
+        starting in `nodes` (all if ``None``) with at least `min_score`.
+        """
+        if nodes is None:
+            pos = numpy.arange(len(self.indices))
+            sources = numpy.repeat(numpy.arange(len(self)),
+                                   numpy.diff(self.indptr))
+        else:
+            nodes = numpy.asarray(nodes, dtype=numpy.int64)
+            pos = mmapstore.gather(self.indptr, nodes)
+            sources = numpy.repeat(
+                nodes, self.indptr[nodes + 1] - self.indptr[nodes])
+        targets, scores = self.indices[pos], self.scores[pos]
+        if min_score is not None:
+            mask = scores >= min_score
+            sources, targets, scores = \
+                sources[mask], targets[mask], scores[mask]
+        return sources, targets, scores
+
+    def actions(self, nodes=None):
+        """
+        Return the (sources, targets, modes, actions, scores) arrays of
+        the actions starting in `nodes` (all if ``None``). Modes and
+        actions are codes into `mode_names` and `action_names`.
+        """
+        if nodes is None:
+            nodes = numpy.arange(len(self))
+        nodes = numpy.asarray(nodes, dtype=numpy.int64)
+        pos = mmapstore.gather(self.action_indptr, nodes)
+        sources = numpy.repeat(
+            nodes, self.action_indptr[nodes + 1] - self.action_indptr[nodes])
+        return (sources, self.action_targets[pos], self.action_modes[pos],
+                self.action_types[pos], self.action_scores[pos])
+
+    def neighbors(self, nodes, min_score=None):
+        """
+        Return a sorted array of the neighbours of `nodes`.
+        """
+        _, targets, _ = self.edges(nodes, min_score)
+        return numpy.unique(targets)
+
+    def neighborhood(self, nodes, k=1, min_score=None):
+        """
+        Return a sorted array of all nodes at most `k` steps away from
+        `nodes` (including `nodes`).
+        """
+        visited = numpy.zeros(len(self), dtype=bool)
+        frontier = numpy.unique(numpy.asarray(nodes, dtype=numpy.int64))
+        visited[frontier] = True
+        for _ in range(k):
+            if not len(frontier):
+                break
+            reached = self.neighbors(frontier, min_score)
+            frontier = reached[~visited[reached]]
+            visited[frontier] = True
+        return numpy.flatnonzero(visited)
+
+    def subgraph(self, nodes, min_score=None):
+        """
+        Return the :class:`PPIAdjacency` of the subgraph induced by
+        `nodes` (with only the edges with at least `min_score`).
+        """
+        nodes = numpy.unique(numpy.asarray(nodes, dtype=numpy.int64))
+        remap = numpy.full(len(self), -1, dtype=numpy.int64)
+        remap[nodes] = numpy.arange(len(nodes))
+
+        def restrict(sources, targets, *columns):
+            sources, targets = remap[sources], remap[targets]
+            mask = targets >= 0
+            return mmapstore.csr(
+                sources[mask], targets[mask].astype(numpy.int32),
+                len(nodes), *[c[mask] for c in columns])
+
+        indptr, indices, scores = \
+            restrict(*self.edges(nodes, min_score))
+        actions = restrict(*self.actions(nodes))
+        return type(self)(self.keys[nodes], indptr, indices, scores,
+                          actions, self.mode_names, self.action_names,
+                          self.meta)
+
+    def to_sparse(self):
+        """
+        Return the adjacency as a `scipy.sparse.csr_matrix` of scores
+        (e.g. for network propagation).
+        """
+        import scipy.sparse
+        return scipy.sparse.csr_matrix(
+            (self.scores, self.indices, self.indptr),
+            shape=(len(self), len(self)))
+
+
+def _create_db_index(ppidb):
+    """
+    Create the indexes of `ppidb` (a :class:`BioGRID` or :class:`STRING`
+    instance) through a separate connection (`ppidb.db` can be read-only).
+
+    Return ``False`` (and warn) if the database file can not be written to,
+    in which case it is used without the missing indexes.
+    """
+    try:
+        if not os.access(ppidb.filename, os.W_OK):
+            raise sqlite3.OperationalError("read-only file")
+        con = sqlite3.connect(ppidb.filename)
+        try:
+            version = con.execute("PRAGMA schema_version").fetchone()
+            ppidb.create_db_index(con)
+            changed = \
+                con.execute("PRAGMA schema_version").fetchone() != version
+        finally:
+            con.close()
+    except sqlite3.OperationalError as err:
+        warnings.warn("Could not update the indexes of %r (%s); queries "
+                      "can be slow" % (ppidb.filename, err), UserWarning)
+        return False
+    if changed:
+        # Reconnect (read-only connections do not detect schema changes)
+        ppidb.db.close()
+    return True
+
+
 class PPIDatabase(object):
     """
     A general interface for protein-protein interaction database access.
@@ -99,6 +470,12 @@ class PPIDatabase(object):
         """
         raise NotImplementedError
 
+    def synonyms_many(self, ids):
+        """
+        Return a list of synonyms (see `synonyms`) for each id in `ids`.
+        """
+        return [self.synonyms(id) for id in ids]
+
     def all_edges(self, taxid=None):
         """
         Return a list of all edges. If `taxid` is not ``None`` return the
@@ -113,6 +490,19 @@ class PPIDatabase(object):
         """
         raise NotImplementedError
 
+    def edges_many(self, ids, min_score=None):
+        """
+        Return a list of all edges (3-tuples (id1, id2, score)) of all
+        `ids` (as returned by `edges` for each id). If `min_score` is not
+        ``None`` only return edges with at least this score.
+
+        """
+        edges = [edge for id in ids for edge in self.edges(id)]
+        if min_score is not None:
+            edges = [edge for edge in edges
+                     if edge[2] is not None and edge[2] >= min_score]
+        return edges
+
     def all_edges_annotated(self, taxid=None):
         """
         Return a list of all edges annotated. If taxid is not None
@@ -138,23 +528,76 @@ class PPIDatabase(object):
         """
         raise NotImplementedError
 
+    def search_ids(self, names, taxid=None):
+        """
+        Search the database for multiple protein names. Return a list
+        of matching primary ids (see `search_id`) for each name.
+
+        """
+        return [list(self.search_id(name, taxid)) for name in names]
+
     def extract_network(self, ids):
         """
         """
         from Orange import network
 
+        ids = list(ids)
         graph = network.Graph()
-        for id in ids:
-            graph.add_node(id, synonyms=",".join(self.synonyms(id)))
+        for id, synonyms in zip(ids, self.synonyms_many(ids)):
+            graph.add_node(id, synonyms=",".join(synonyms))
 
-        for id in ids:
-            edges = self.edges(id)
-
-            for id1, id2, score in edges:
-                graph.add_edge(id1, id2, weight=score)
+        for id1, id2, score in self.edges_many(ids):
+            graph.add_edge(id1, id2, weight=score)
 
         return graph
 
+    #: The dtype of scores in :func:`adjacency` and the value stored for
+    #: missing scores.
+    ADJACENCY_SCORE_DTYPE = numpy.int16
+    ADJACENCY_MISSING_SCORE = -1
+
+    #: Should the edges from `all_edges` be stored in both directions
+    #: in :func:`adjacency` (i.e. are the links stored only once).
+    ADJACENCY_SYMMETRIZE = False
+
+    def adjacency(self, taxid=None):
+        """
+        Return the :class:`PPIAdjacency` of all edges (of organism `taxid`
+        only if not ``None``).
+
+        The adjacency is saved next to the database file on first use
+        and memory-mapped afterwards (it is rebuilt when the database
+        file changes).
+
+        """
+        filename = getattr(self, "filename", None)
+        if filename is None or not os.path.isfile(filename):
+            return self._build_adjacency(taxid)
+
+        path = "{}.{}.adjacency".format(
+            filename, taxid if taxid is not None else "all")
+        source = mmapstore.file_stamp(filename)
+        try:
+            adjacency = PPIAdjacency.load(path)
+            if adjacency.meta.get("source") != source:
+                raise mmapstore.FormatError("%r is out of date" % path)
+        except (IOError, OSError, ValueError):
+            adjacency = self._build_adjacency(taxid)
+            adjacency.meta["source"] = source
+            try:
+                adjacency.save(path)
+            except (IOError, OSError) as err:
+                warnings.warn("Could not save the adjacency (%s)" % err,
+                              UserWarning)
+        return adjacency
+
+    def _build_adjacency(self, taxid=None):
+        return PPIAdjacency.from_edges(
+            self.ids(taxid), self.all_edges(taxid),
+            symmetrize=self.ADJACENCY_SYMMETRIZE,
+            score_dtype=self.ADJACENCY_SCORE_DTYPE,
+            missing_score=self.ADJACENCY_MISSING_SCORE)
+
     @classmethod
     def download_data(self):
         """
@@ -209,6 +652,17 @@ class BioGRID(PPIDatabase):
          official_symbol_interactor text,
          synonyms_interactor text,
          organism_interactor text,
+         """),
+        ("edges",
+         """\
+         biogrid_id text,
+         partner_id text,
+         link_id integer
+         """),
+        ("synonyms",
+         """\
+         biogrid_id text,
+         synonym text
          """)
     ]
 
@@ -254,12 +708,21 @@ class BioGRID(PPIDatabase):
         "31033": None
     }
 
-    def __init__(self):
-        self.filename = serverfiles.localpath_download(
-            self.DOMAIN, self.SERVER_FILE)
+    # Links are stored once per interaction and scores are mostly missing
+    ADJACENCY_SCORE_DTYPE = numpy.float32
+    ADJACENCY_MISSING_SCORE = numpy.nan
+    ADJACENCY_SYMMETRIZE = True
+
+    def __init__(self, database=None):
+        # The downloaded database is opened read-only
+        readonly = database is None
+        if database is None:
+            database = serverfiles.localpath_download(
+                self.DOMAIN, self.SERVER_FILE)
+        self.filename = database
 
         # assert version matches
-        self.db = sqlite3.connect(self.filename)
+        self.db = sqlitepool.shared(self.filename, readonly=readonly)
         self.init_db_index()
 
     def organisms(self):
@@ -287,6 +750,13 @@ class BioGRID(PPIDatabase):
 
         return [t[0] for t in cur.fetchall()]
 
+    @staticmethod
+    def _protein_synonyms(rec):
+        # rec: (entrez, systematic, official, "|" separated synonyms)
+        synonyms = list(rec[:-1]) + \
+                   (rec[-1].split("|") if rec[-1] is not None else [])
+        return [s for s in synonyms if s is not None]
+
     def synonyms(self, id):
         """
         Return a list of synonyms for primary `id`.
@@ -301,33 +771,55 @@ class BioGRID(PPIDatabase):
             (id,))
         rec = cur.fetchone()
         if rec:
-            synonyms = list(rec[:-1]) + \
-                       (rec[-1].split("|") if rec[-1] is not None else [])
-            return [s for s in synonyms if s is not None]
+            return self._protein_synonyms(rec)
         else:
             return []
 
+    def synonyms_many(self, ids):
+        """
+        Return a list of synonyms (see `synonyms`) for each id in `ids`.
+        """
+        ids = list(ids)
+        synonyms = {}
+        for chunk in chunks(set(ids)):
+            cur = self.db.execute("""\
+                select biogrid_id_interactor,
+                       entrez_gene_interactor,
+                       systematic_name_interactor,
+                       official_symbol_interactor,
+                       synonyms_interactor
+                from proteins
+                where biogrid_id_interactor in ({})
+                """.format(placeholders(len(chunk))), chunk)
+            for rec in cur:
+                synonyms.setdefault(rec[0], self._protein_synonyms(rec[1:]))
+        return [list(synonyms.get(id, [])) for id in ids]
+
+    def _taxid_links(self, columns, taxid):
+        # Links with at least one interactor from the `taxid` organism
+        # (through the `edges` table, each link is selected only once).
+        return self.db.execute("""\
+            select {}
+            from links
+            where rowid in (
+                select edges.link_id
+                from edges join proteins on
+                    edges.biogrid_id=proteins.biogrid_id_interactor
+                where proteins.organism_interactor=?)
+            """.format(columns), (taxid,))
+
     def all_edges(self, taxid=None):
         """
         Return a list of all edges. If taxid is not None return the
         edges for this organism only.
 
         """
+        columns = "biogrid_id_interactor_a, biogrid_id_interactor_b, score"
         if taxid is not None:
-            cur = self.db.execute("""\
-                select biogrid_id_interactor_a, biogrid_id_interactor_a, score
-                from links left join proteins on
-                    biogrid_id_interactor_a=biogrid_id_interactor or
-                    biogrid_id_interactor_b=biogrid_id_interactor
-                where organism_interactor=?
-            """, (taxid,))
+            cur = self._taxid_links(columns, taxid)
         else:
-            cur = self.db.execute("""\
-                select biogrid_id_interactor_a, biogrid_id_interactor_a, score
-                from links
-            """)
-        edges = cur.fetchall()
-        return edges
+            cur = self.db.execute("select {} from links".format(columns))
+        return cur.fetchall()
 
     def edges(self, id):
         """
@@ -335,14 +827,39 @@ class BioGRID(PPIDatabase):
         (a list of 3-tuples (id_a, id_b, score)).
 
         """
-
         cur = self.db.execute("""\
             select biogrid_id_interactor_a, biogrid_id_interactor_b, score
-            from links
-            where biogrid_id_interactor_a=? or biogrid_id_interactor_b=?
-        """, (id, id))
+            from edges join links on edges.link_id=links.rowid
+            where edges.biogrid_id=?
+        """, (id,))
         return cur.fetchall()
 
+    def edges_many(self, ids, min_score=None):
+        """
+        Return a list of all edges (3-tuples (id_a, id_b, score)) of all
+        `ids`. If `min_score` is not ``None`` only return edges with at
+        least this score.
+
+        """
+        ids = list(ids)
+        if min_score is not None:
+            condition, extra = "and score>=?", (min_score,)
+        else:
+            condition, extra = "", ()
+
+        byid = dict((id, []) for id in ids)
+        for chunk in chunks(set(ids), SQL_CHUNK_SIZE - 1):
+            cur = self.db.execute("""\
+                select edges.biogrid_id, biogrid_id_interactor_a,
+                       biogrid_id_interactor_b, score
+                from edges join links on edges.link_id=links.rowid
+                where edges.biogrid_id in ({}) {}
+                """.format(placeholders(len(chunk)), condition),
+                tuple(chunk) + extra)
+            for row in cur:
+                byid[row[0]].append(row[1:])
+        return [edge for id in ids for edge in byid[id]]
+
     def all_edges_annotated(self, taxid=None):
         """
         Return a list of all edges annotated. If taxid is not None
@@ -350,13 +867,7 @@ class BioGRID(PPIDatabase):
 
         """
         if taxid is not None:
-            cur = self.db.execute("""\
-                select *
-                from links left join proteins on
-                    biogrid_id_interactor_a=biogrid_id_interactor or
-                    biogrid_id_interactor_b=biogrid_id_interactor
-                where organism_interactor=?
-            """, (taxid,))
+            cur = self._taxid_links("*", taxid)
         else:
             cur = self.db.execute("""\
                 select *
@@ -369,10 +880,10 @@ class BioGRID(PPIDatabase):
         """ Return a list of all links
         """
         cur = self.db.execute("""\
-            select *
-            from links
-            where biogrid_id_interactor_a=? or biogrid_id_interactor_b=?
-        """, (id, id))
+            select links.*
+            from edges join links on edges.link_id=links.rowid
+            where edges.biogrid_id=?
+        """, (id,))
         return cur.fetchall()
 
     def search_id(self, name, taxid=None):
@@ -381,31 +892,32 @@ class BioGRID(PPIDatabase):
         primary ids. Use `taxid` to limit the results to a single organism.
 
         """
-        # TODO: synonyms_interactor can contain multiple synonyms
-        # (should create an indexed table of synonyms)
-        if taxid is None:
-            cur = self.db.execute("""\
-                select biogrid_id_interactor
-                from proteins
-                where (biogrid_id_interactor=? or
-                       entrez_gene_interactor=? or
-                       systematic_name_interactor=? or
-                       official_symbol_interactor=? or
-                       synonyms_interactor=?)
-            """, ((name,) * 5))
+        return self.search_ids([name], taxid)[0]
+
+    def search_ids(self, names, taxid=None):
+        """
+        Search the database for multiple protein names. Return a list
+        of matching primary ids (see `search_id`) for each name.
+
+        """
+        names = list(names)
+        if taxid is not None:
+            condition, extra = "and proteins.organism_interactor=?", (taxid,)
         else:
+            condition, extra = "", ()
+
+        found = dict((name, []) for name in names)
+        for chunk in chunks(set(names), SQL_CHUNK_SIZE - 1):
             cur = self.db.execute("""\
-                select biogrid_id_interactor
-                from proteins
-                where (biogrid_id_interactor=? or
-                       entrez_gene_interactor=? or
-                       systematic_name_interactor=? or
-                       official_symbol_interactor=? or
-                       synonyms_interactor=?)
-                      and organism_interactor=?
-            """, ((name,) * 5) + (taxid,))
-        res = map(itemgetter(0), cur)
-        return res
+                select distinct synonyms.synonym, synonyms.biogrid_id
+                from synonyms join proteins on
+                    synonyms.biogrid_id=proteins.biogrid_id_interactor
+                where synonyms.synonym in ({}) {}
+                """.format(placeholders(len(chunk)), condition),
+                tuple(chunk) + extra)
+            for name, id in cur:
+                found[name].append(id)
+        return [list(found[name]) for name in names]
 
     @classmethod
     def download_data(cls, address):
@@ -438,8 +950,8 @@ class BioGRID(PPIDatabase):
         next(rows)  # read the header line
 
         con = sqlite3.connect(os.path.join(dirname, BioGRID.SERVER_FILE))
-        con.execute("drop table if exists links")  # Drop old table
-        con.execute("drop table if exists proteins")  # Drop old table
+        for table in ["links", "proteins", "edges", "synonyms"]:
+            con.execute("drop table if exists %s" % table)  # Drop old table
 
         con.execute("""\
             create table links (
@@ -499,26 +1011,126 @@ class BioGRID(PPIDatabase):
             insert into proteins values (?, ?, ?, ?, ?, ?)
             """, proteins.values())
         con.commit()
+        cls.create_db_index(con)
         con.close()
 
     def init_db_index(self):
         """
-        Will create an indexes (if not already present) in the database
-        for faster searching by primary ids.
+        Will create the `edges` and `synonyms` lookup tables and indexes
+        (if not already present) in the database for faster searching by
+        primary ids and synonyms.
+
+        If the database can not be modified and lacks the lookup tables,
+        they are built in each connection's temporary database instead.
 
         """
-        self.db.execute("""\
-        create index if not exists index_on_biogrid_id_interactor_a
-           on links (biogrid_id_interactor_a)
-        """)
-        self.db.execute("""\
-        create index if not exists index_on_biogrid_id_interactor_b
-           on links (biogrid_id_interactor_b)
-        """)
-        self.db.execute("""\
-        create index if not exists index_on_biogrid_id_interactor
-           on proteins (biogrid_id_interactor)
-        """)
+        if _create_db_index(self):
+            return
+        cur = self.db.execute(
+            "select count(*) from sqlite_master "
+            "where type='table' and name in ('edges', 'synonyms')")
+        if cur.fetchone()[0] < 2:
+            self.db = sqlitepool.shared(self.filename,
+                                        readonly=self.db.readonly,
+                                        init=BioGRID._create_temp_lookup)
+
+    @classmethod
+    def _create_temp_lookup(cls, dbcon):
+        cls.create_db_index(dbcon, schema="temp")
+
+    @classmethod
+    def create_db_index(cls, dbcon, schema="main"):
+        """
+        Create the lookup tables (if not already present) and indexes.
+
+        The `edges` table holds both directions of every link
+        (`biogrid_id`, `partner_id`, `link_id`, where `link_id` is the
+        `rowid` in `links`), so interactions of a protein are found with
+        a single index seek. The `synonyms` table maps each of the
+        protein's ids and names (including the "|" separated
+        `synonyms_interactor`) to its `biogrid_id`.
+
+        With ``schema="temp"`` only the lookup tables (and their indexes)
+        are created, in the connection's temporary database.
+
+        """
+        master = "sqlite_temp_master" if schema == "temp" else "sqlite_master"
+
+        def exists(table):
+            cur = dbcon.execute(
+                "select name from %s "
+                "where type='table' and name=?" % master, (table,))
+            return cur.fetchone() is not None
+
+        with dbcon:
+            if not exists("edges"):
+                dbcon.execute("""\
+                    create table %s.edges (
+                        biogrid_id text,
+                        partner_id text,
+                        link_id integer
+                    )""" % schema)
+                dbcon.execute("""\
+                    insert into %s.edges
+                    select biogrid_id_interactor_a, biogrid_id_interactor_b,
+                           rowid
+                    from links""" % schema)
+                dbcon.execute("""\
+                    insert into %s.edges
+                    select biogrid_id_interactor_b, biogrid_id_interactor_a,
+                           rowid
+                    from links
+                    where biogrid_id_interactor_a is not
+                          biogrid_id_interactor_b""" % schema)
+
+            if not exists("synonyms"):
+                dbcon.execute("""\
+                    create table %s.synonyms (
+                        biogrid_id text,
+                        synonym text
+                    )""" % schema)
+                cur = dbcon.execute("""\
+                    select biogrid_id_interactor,
+                           entrez_gene_interactor,
+                           systematic_name_interactor,
+                           official_symbol_interactor,
+                           synonyms_interactor
+                    from proteins""")
+                dbcon.executemany(
+                    "insert into %s.synonyms values (?, ?)" % schema,
+                    ((rec[0], synonym) for rec in cur.fetchall()
+                     for synonym in
+                     set([rec[0]] + cls._protein_synonyms(rec[1:]))))
+
+            if schema == "temp":
+                dbcon.executescript(textwrap.dedent("""
+                    create index if not exists temp.index_edges_biogrid_id
+                        on edges (biogrid_id, link_id);
+
+                    create index if not exists temp.index_synonyms_synonym
+                        on synonyms (synonym);
+                """))
+                return
+
+            dbcon.executescript(textwrap.dedent("""
+                create index if not exists index_on_biogrid_id_interactor_a
+                    on links (biogrid_id_interactor_a);
+
+                create index if not exists index_on_biogrid_id_interactor_b
+                    on links (biogrid_id_interactor_b);
+
+                create index if not exists index_on_biogrid_id_interactor
+                    on proteins (biogrid_id_interactor);
+
+                create index if not exists index_on_organism_interactor
+                    on proteins (organism_interactor);
+
+                create index if not exists index_edges_biogrid_id
+                    on edges (biogrid_id, link_id);
+
+                create index if not exists index_synonyms_synonym
+                    on synonyms (synonym);
+            """))
 
 
 STRINGInteraction = namedtuple(
@@ -584,12 +1196,13 @@ class STRING(PPIDatabase):
         self.db = None
 
         if taxid is None and database is not None:
-            if isinstance(database, sqlite3.Connection):
+            if isinstance(database, (sqlite3.Connection,
+                                     sqlitepool.ConnectionPool)):
                 self.db = database
                 self.filename = None
             else:
                 self.filename = database
-                self.db = sqlite3.connect(database)
+                self.db = sqlitepool.shared(database)
         elif taxid is not None and database is None:
             self.filename = serverfiles.localpath_download(
                 self.DOMAIN, self.FILENAME.format(taxid=taxid)
@@ -602,7 +1215,9 @@ class STRING(PPIDatabase):
             assert False, "Not reachable"
 
         if self.db is None:
-            self.db = sqlite3.connect(self.filename)
+            # The downloaded databases are opened read-only
+            self.db = sqlitepool.shared(self.filename, readonly=True)
+        self.init_db_index()
 
     @classmethod
     def default_db_filename(cls, taxid):
@@ -654,6 +1269,22 @@ class STRING(PPIDatabase):
         res = cur.fetchall()
         return [r[0] for r in res]
 
+    def synonyms_many(self, ids):
+        """
+        Return a list of synonyms (see `synonyms`) for each id in `ids`.
+        """
+        ids = list(ids)
+        synonyms = dict((id, []) for id in ids)
+        for chunk in chunks(set(ids)):
+            cur = self.db.execute("""\
+                select protein_id, alias
+                from aliases
+                where protein_id in ({})
+                """.format(placeholders(len(chunk))), chunk)
+            for id, alias in cur:
+                synonyms[id].append(alias)
+        return [list(synonyms[id]) for id in ids]
+
     def synonyms_with_source(self, id):
         """
         Return a list of synonyms for primary `id` along with its
@@ -686,7 +1317,7 @@ class STRING(PPIDatabase):
                 """, (taxid,))
         else:
             cur = self.db.execute("""\
-                select protein_id1, protein_id1, score
+                select protein_id1, protein_id2, score
                 from links
                 """)
         return cur.fetchall()
@@ -702,11 +1333,70 @@ class STRING(PPIDatabase):
             """, (id,))
         return cur.fetchall()
 
+    def edges_many(self, ids, min_score=None):
+        """
+        Return a list of all edges (3-tuples (id1, id2, score)) of all
+        `ids`. If `min_score` is not ``None`` only return edges with at
+        least this score.
+
+        """
+        ids = list(ids)
+        if min_score is not None:
+            condition, extra = "and score>=?", (min_score,)
+        else:
+            condition, extra = "", ()
+
+        byid = dict((id, []) for id in ids)
+        for chunk in chunks(set(ids), SQL_CHUNK_SIZE - 1):
+            cur = self.db.execute("""\
+                select protein_id1, protein_id2, score
+                from links
+                where protein_id1 in ({}) {}
+                """.format(placeholders(len(chunk)), condition),
+                tuple(chunk) + extra)
+            for edge in cur:
+                byid[edge[0]].append(edge)
+        return [edge for id in ids for edge in byid[id]]
+
     def all_edges_annotated(self, taxid=None):
-        res = []
-        for id in self.ids(taxid):
-            res.extend(self.edges_annotated(id))
-        return res
+        """
+        Return a list of all edges annotated (see `edges_annotated`).
+        If taxid is not None return the edges for this organism only.
+
+        """
+        query = """\
+            select links.protein_id1, links.protein_id2, links.score,
+                   actions.action, actions.mode, actions.score
+            from links left join actions on
+                   links.protein_id1=actions.protein_id1 and
+                   links.protein_id2=actions.protein_id2
+            """
+        if taxid is not None:
+            cur = self.db.execute(query + """\
+                join proteins on links.protein_id1=proteins.protein_id
+                where taxid=?
+                """, (taxid,))
+        else:
+            cur = self.db.execute(query)
+        return [STRINGInteraction._make(row) for row in cur]
+
+    def _build_adjacency(self, taxid=None):
+        query = """\
+            select actions.protein_id1, actions.protein_id2,
+                   mode, action, actions.score
+            from actions
+            """
+        if taxid is not None:
+            cur = self.db.execute(query + """\
+                join proteins on actions.protein_id1=proteins.protein_id
+                where taxid=?
+                """, (taxid,))
+        else:
+            cur = self.db.execute(query)
+        return PPIAdjacency.from_edges(
+            self.ids(taxid), self.all_edges(taxid), cur.fetchall(),
+            score_dtype=self.ADJACENCY_SCORE_DTYPE,
+            missing_score=self.ADJACENCY_MISSING_SCORE)
 
     def edges_annotated(self, id):
         cur = self.db.execute("""\
@@ -734,20 +1424,70 @@ class STRING(PPIDatabase):
             """, (name, taxid))
         return map(itemgetter(0), cur)
 
+    def search_ids(self, names, taxid=None):
+        """
+        Search the database for multiple protein names. Return a list
+        of matching primary ids (see `search_id`) for each name.
+
+        """
+        names = list(names)
+        if taxid is not None:
+            condition, extra = "and proteins.taxid=?", (taxid,)
+        else:
+            condition, extra = "", ()
+
+        found = dict((name, []) for name in names)
+        for chunk in chunks(set(names), SQL_CHUNK_SIZE - 1):
+            cur = self.db.execute("""\
+                select aliases.alias, proteins.protein_id
+                from proteins natural join aliases
+                where aliases.alias in ({}) {}
+                """.format(placeholders(len(chunk)), condition),
+                tuple(chunk) + extra)
+            for name, id in cur:
+                found[name].append(id)
+        return [list(found[name]) for name in names]
+
     @classmethod
-    def download_data(cls, version, taxids=None):
+    def download_data(cls, version, taxids=None, processes=1):
         """
         Download the  PPI data for local work (this may take some time).
         Pass the version of the  STRING release e.g. v9.1.
+
+        If `processes` is greater than 1 the databases for different
+        taxids are built in that many parallel processes.
         """
         if taxids is None:
             taxids = cls.common_taxids()
-
-        for taxid in taxids:
-            cls.init_db(version, taxid)
+        taxids = list(taxids)
+
+        if processes > 1 and len(taxids) > 1:
+            import multiprocessing
+            pool = multiprocessing.Pool(min(processes, len(taxids)))
+            try:
+                pool.map(_init_db_worker,
+                         [(cls, version, taxid) for taxid in taxids])
+                pool.close()
+            finally:
+                pool.terminate()
+        else:
+            for taxid in taxids:
+                cls.init_db(version, taxid)
 
     @classmethod
-    def init_db(cls, version, taxid, cache_dir=None, dbfilename=None):
+    def init_db(cls, version, taxid, cache_dir=None, dbfilename=None,
+                progress_callback=None):
+        """
+        Build the database for `taxid` from the STRING `version` flat
+        files (downloaded to `cache_dir` if not already present).
+
+        The gzipped files are streamed in chunks of `INSERT_CHUNK_SIZE`
+        rows into a new database (without journaling) and the indexes
+        are created after all the data is loaded. If given
+        `progress_callback(processed, total)` is called with the number
+        of (compressed) bytes processed.
+
+        """
         if cache_dir is None:
             cache_dir = serverfiles.localpath(cls.DOMAIN)
 
@@ -763,15 +1503,6 @@ class STRING(PPIDatabase):
             url = url.format(flatfile=flatfile, version=version, taxid=taxid)
             return posixpath.basename(url), base_url + url
 
-        def ffname(pattern):
-            return pattern.format(taxid=taxid, version=version)
-
-        links_filename, links_url = paths("protein.links")
-
-        actions_filename, actions_url = paths("protein.actions")
-
-        aliases_filename, aliases_url = paths("protein.aliases")
-
         def download(filename, url):
             with open(pjoin(cache_dir, filename + ".tmp"), "wb") as dest:
                     wget(url, dst_obj=dest, progress=True)
@@ -779,113 +1510,93 @@ class STRING(PPIDatabase):
             shutil.move(pjoin(cache_dir, filename + ".tmp"),
                         pjoin(cache_dir, filename))
 
-        for fname, url in [(links_filename, links_url),
-                           (actions_filename, actions_url),
-                           (aliases_filename, aliases_url)]:
+        filenames = []
+        for flatfile in ["protein.links", "protein.actions",
+                         "protein.aliases"]:
+            fname, url = paths(flatfile)
             if not os.path.exists(pjoin(cache_dir, fname)):
                 download(fname, url)
+            filenames.append(pjoin(cache_dir, fname))
+
+        links_filename, actions_filename, aliases_filename = filenames
+
+        progress_bar = None
+        if progress_callback is None:
+            progress_bar = ConsoleProgressBar(
+                "Processing {}:".format(os.path.basename(links_filename)))
+            progress_callback = \
+                lambda processed, total: progress_bar(100.0 * processed / total)
+
+        progress = BytesProgress(
+            sum(os.stat(fname).st_size for fname in filenames),
+            progress_callback)
+        progress(0)
+
+        # Build into a temporary file so an interrupted build does not
+        # leave a partial database.
+        tmpfilename = dbfilename + ".tmp"
+        if os.path.exists(tmpfilename):
+            os.remove(tmpfilename)
+
+        con = bulk_load_connection(tmpfilename)
+        try:
+            with con:
+                cls.clear_db(con)
+
+                for chunk in read_chunks(links_filename, " ",
+                                         progress=progress):
+                    con.executemany(
+                        "INSERT INTO links VALUES (?, ?, ?)",
+                        [(p1, p2, int(score)) for p1, p2, score in chunk])
+
+                # protein ids are in the form of {taxid}.{name}
+                con.execute("""
+                    INSERT INTO proteins
+                    SELECT protein_id1,
+                           substr(protein_id1, 1, instr(protein_id1, '.') - 1)
+                    FROM (SELECT DISTINCT(protein_id1)
+                          FROM links
+                          ORDER BY protein_id1)
+                """)
 
-        links_fileobj = open(pjoin(cache_dir, links_filename), "rb")
-        actions_fileobj = open(pjoin(cache_dir, actions_filename), "rb")
-        aliases_fileobj = open(pjoin(cache_dir, aliases_filename), "rb")
-
-        # python 3 support
-        links_file = gzip.open(pjoin(cache_dir, links_filename), mode='rt')
-        actions_file = gzip.open(pjoin(cache_dir, actions_filename), mode='rt')
-        aliases_file = gzip.open(pjoin(cache_dir, aliases_filename), mode='rt')
-
-        progress = ConsoleProgressBar("Processing {}:".format(links_filename))
-        progress(0.0)
-
-        def st_size(filename):
-            return os.stat(pjoin(cache_dir, filename)).st_size
-
-        filesize = st_size(links_filename)
-
-        con = sqlite3.connect(dbfilename)
-
-        with con:
-            cls.clear_db(con)
-
-            links_file.readline()  # read the header line
-
-            reader = csv.reader(links_file, delimiter=" ")
-
-            def read_links(reader, progress):
-                for i, (p1, p2, score) in enumerate(reader):
-                    yield p1, p2, int(score)
-
-                    if i % 100000 == 0:
-                        # Update the progress every 100000 lines
-                        progress(100.0 * links_fileobj.tell() / filesize)
-
-            con.executemany("INSERT INTO links VALUES (?, ?, ?)",
-                            read_links(reader, progress))
-
-            progress.finish()
-
-            def part(string, sep, part):
-                return string.split(sep)[part]
-
-            con.create_function("part", 3, part)
-            con.execute("""
-                INSERT INTO proteins
-                SELECT protein_id1, part(protein_id1, '.', 0)
-                FROM (SELECT DISTINCT(protein_id1)
-                     FROM links
-                     ORDER BY protein_id1)
-            """)
-
-            filesize = st_size(actions_filename)
-
-            actions_file.readline()  # read header line
-
-            progress = ConsoleProgressBar("Processing actions:")
-            reader = csv.reader(actions_file, delimiter="\t")
-
-            def read_actions(reader):
-                for i, (p1, p2, mode, action, a_is_acting, score) in \
-                        enumerate(reader):
-                    yield p1, p2, mode, action, int(score)
-
-                    if i % 10000 == 0:
-                        progress(100.0 * actions_fileobj.tell() / filesize)
-
-            con.executemany("INSERT INTO actions VALUES (?, ?, ?, ?, ?)",
-                            read_actions(reader))
-
-            progress.finish()
-
-            filesize = st_size(aliases_filename)
-            aliases_file.readline()  # read header line
-            progress = ConsoleProgressBar("Processing aliases:")
-
-            reader = csv.reader(aliases_file, delimiter="\t")
-
-            def read_aliases(reader, progress):
-                for i, (taxid_proteinid, alias, source) in enumerate(reader):
-                    yield (taxid_proteinid, alias, source)
-                    if i % 10000 == 0:
-                        progress(100.0 * aliases_fileobj.tell() / filesize)
-
-            con.executemany("INSERT INTO aliases VALUES (?, ?, ?)",
-                            read_aliases(reader, progress))
-
-            progress.finish()
-
-            print("Indexing the database")
-            cls.create_db_index(con)
-
-            con.executescript("""
-                DROP TABLE IF EXISTS version;
-                CREATE TABLE version (
-                     string_version text,
-                     api_version text
-                );""")
-
-            con.execute("""
-                INSERT INTO version
-                VALUES (?, ?)""", (version, cls.VERSION))
+                # The actions score is in the last column (the number of
+                # columns differs between the STRING versions)
+                for chunk in read_chunks(actions_filename, "\t",
+                                         progress=progress):
+                    con.executemany(
+                        "INSERT INTO actions VALUES (?, ?, ?, ?, ?)",
+                        [(row[0], row[1], row[2], row[3], int(row[-1]))
+                         for row in chunk])
+
+                for chunk in read_chunks(aliases_filename, "\t",
+                                         progress=progress):
+                    con.executemany(
+                        "INSERT INTO aliases VALUES (?, ?, ?)",
+                        [tuple(row[:3]) for row in chunk])
+
+                if progress_bar is not None:
+                    progress_bar.finish()
+                    print("Indexing the database")
+                cls.create_db_index(con)
+
+                con.executescript("""
+                    DROP TABLE IF EXISTS version;
+                    CREATE TABLE version (
+                         string_version text,
+                         api_version text
+                    );""")
+
+                con.execute("""
+                    INSERT INTO version
+                    VALUES (?, ?)""", (version, cls.VERSION))
+        except BaseException:
+            con.close()
+            os.remove(tmpfilename)
+            raise
+        con.close()
+        # Shared pools must not keep reading the replaced (immutable) file
+        sqlitepool.release(dbfilename)
+        shutil.move(tmpfilename, dbfilename)
 
     @classmethod
     def clear_db(cls, dbcon):
@@ -911,12 +1622,26 @@ class STRING(PPIDatabase):
                 (protein_id TEXT, alias TEXT, source TEXT);
         """))
 
+    def init_db_index(self):
+        """
+        Create the indexes (if not already present) in the database
+        (databases created by older versions lack some of them).
+
+        """
+        if self.filename is None:
+            self.create_db_index(self.db)
+        else:
+            _create_db_index(self)
+
     @classmethod
     def create_db_index(cls, dbcon):
         dbcon.executescript(textwrap.dedent("""
             CREATE INDEX IF NOT EXISTS index_link_protein_id1
                 ON links (protein_id1);
 
+            CREATE INDEX IF NOT EXISTS index_link_protein_id1_score
+                ON links (protein_id1, score, protein_id2);
+
             CREATE INDEX IF NOT EXISTS index_action_protein_id1
                 ON actions (protein_id1);
 
@@ -990,6 +1715,8 @@ class STRINGDetailed(STRING):
         if taxid is not None and detailed_database is not None:
             raise ValueError("taxid and detailed_database are exclusive")
 
+        readonly = detailed_database is None
+
         db_file = serverfiles.localpath(self.DOMAIN, self.FILENAME)
         if taxid is not None and detailed_database is None:
             detailed_database = serverfiles.localpath_download(
@@ -1003,8 +1730,11 @@ class STRINGDetailed(STRING):
             detailed_database = serverfiles.localpath_download(
                 "PPI", "string-protein-detailed.sqlite")
 
-        self.db_detailed = sqlite3.connect(detailed_database)
-        self.db_detailed.execute("ATTACH DATABASE ? as string", (db_file,))
+        def attach(con):
+            con.execute("ATTACH DATABASE ? as string", (db_file,))
+
+        self.db_detailed = sqlitepool.ConnectionPool(
+            detailed_database, readonly=readonly, init=attach)
 
     def edges_annotated(self, id):
         edges = STRING.edges_annotated(self, id)
@@ -1027,8 +1757,13 @@ class STRINGDetailed(STRING):
             )
         return edges_nc
 
+    def all_edges_annotated(self, taxid=None):
+        # Include the evidence (see `edges_annotated`)
+        return PPIDatabase.all_edges_annotated(self, taxid)
+
     @classmethod
-    def init_db(cls, version, taxid, cache_dir=None, dbfilename=None):
+    def init_db(cls, version, taxid, cache_dir=None, dbfilename=None,
+                progress_callback=None):
         if cache_dir is None:
             cache_dir = serverfiles.localpath(cls.DOMAIN)
         if dbfilename is None:
@@ -1049,78 +1784,77 @@ class STRINGDetailed(STRING):
             with open(pjoin(cache_dir, filename), "wb") as dest:
                 wget(url, dest, progress=True)
 
-        links_fileobj = open(pjoin(cache_dir, filename), "rb")
-        links_file = gzip.open(pjoin(cache_dir, filename), mode='rt')
-
-        con = sqlite3.connect(dbfilename)
-        with con:
-            con.execute("""
-                DROP TABLE IF EXISTS evidence
-            """)
-
-            con.execute("""
-                CREATE TABLE evidence(
-                     protein_id1 TEXT,
-                     protein_id2 TEXT,
-                     neighborhood INTEGER,
-                     fusion INTEGER,
-                     cooccurence INTEGER,
-                     coexpression INTEGER,
-                     experimental INTEGER,
-                     database INTEGER,
-                     textmining INTEGER
-                    )
+        progress_bar = None
+        if progress_callback is None:
+            progress_bar = ConsoleProgressBar("Processing links file:")
+            progress_callback = \
+                lambda processed, total: progress_bar(100.0 * processed / total)
+        progress = BytesProgress(os.stat(pjoin(cache_dir, filename)).st_size,
+                                 progress_callback)
+        progress(0)
+
+        tmpfilename = dbfilename + ".tmp"
+        if os.path.exists(tmpfilename):
+            os.remove(tmpfilename)
+
+        con = bulk_load_connection(tmpfilename)
+        try:
+            with con:
+                con.execute("""
+                    CREATE TABLE evidence(
+                         protein_id1 TEXT,
+                         protein_id2 TEXT,
+                         neighborhood INTEGER,
+                         fusion INTEGER,
+                         cooccurence INTEGER,
+                         coexpression INTEGER,
+                         experimental INTEGER,
+                         database INTEGER,
+                         textmining INTEGER
+                        )
+                    """)
+
+                # The last column (combined score) is not stored
+                for chunk in read_chunks(pjoin(cache_dir, filename), " ",
+                                         progress=progress):
+                    con.executemany("""
+                        INSERT INTO evidence
+                        VALUES  (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                        """, [row[:9] for row in chunk])
+
+                if progress_bar is not None:
+                    progress_bar.finish()
+                    print("Indexing")
+                con.execute("""\
+                    CREATE INDEX IF NOT EXISTS index_evidence
+                        ON evidence (protein_id1, protein_id2)
                 """)
 
-            links_file.readline()  # Read header
-            links = csv.reader(links_file, delimiter=" ")
-
-            filesize = os.stat(pjoin(cache_dir, filename)).st_size
-
-            progress = ConsoleProgressBar("Processing links file:")
-            progress(1.0)
-
-            def read_links(reader):
-                for i, (p1, p2, n, f, c, cx, ex, db, t, _) in \
-                        enumerate(reader):
-                    yield p1, p2, n, f, c, cx, ex, db, t
-
-                    if i % 10000 == 0:
-                        progress(100.0 * links_fileobj.tell() / filesize)
-
-            con.executemany("""
-                INSERT INTO evidence
-                VALUES  (?, ?, ?, ?, ?, ?, ?, ?, ?)
-                """, read_links(links))
-
-            progress.finish()
-
-            print("Indexing")
-            con.execute("""\
-                CREATE INDEX IF NOT EXISTS index_evidence
-                    ON evidence (protein_id1, protein_id2)
-            """)
-
-            con.executescript("""
-                DROP TABLE IF EXISTS version;
-
-                CREATE TABLE version (
-                     string_version text,
-                     api_version text
-                );
-                """)
-
-            con.execute("""
-                INSERT INTO version
-                VALUES (?, ?)""", (version, cls.VERSION))
+                con.executescript("""
+                    DROP TABLE IF EXISTS version;
+
+                    CREATE TABLE version (
+                         string_version text,
+                         api_version text
+                    );
+                    """)
+
+                con.execute("""
+                    INSERT INTO version
+                    VALUES (?, ?)""", (version, cls.VERSION))
+        except BaseException:
+            con.close()
+            os.remove(tmpfilename)
+            raise
+        con.close()
+        # Shared pools must not keep reading the replaced (immutable) file
+        sqlitepool.release(dbfilename)
+        shutil.move(tmpfilename, dbfilename)
 
-    @classmethod
-    def download_data(cls, version, taxids=None):
-        if taxids is None:
-            taxids = cls.common_taxids()
 
-        for taxid in taxids:
-            cls.init_db(version, taxid)
+def _init_db_worker(args):
+    cls, version, taxid = args
+    cls.init_db(version, taxid)
 
 
 ##########
@@ -186,7 +186,7 @@ class Taxonomy(object):
         from .ncbi.taxonomy import Taxonomy
         # Ensure the taxonomy db is downloaded.
         filename = serverfiles.localpath_download(self.DOMAIN, self.FILENAME)
-        self._tax = Taxonomy(filename)
+        self._tax = Taxonomy(filename, readonly=True)
 
     def get_entry(self, id):
         try:
@@ -0,0 +1,140 @@
+import unittest
+
+import numpy
+import scipy.stats
+
+import Orange
+
+from orangecontrib.bio.utils import expression
+
+
+def column_values(X, y, column, c):
+    values = X[y == c, column]
+    return values[~numpy.isnan(values)]
+
+
+class TestArrayMeasures(unittest.TestCase):
+    def setUp(self):
+        rng = numpy.random.RandomState(42)
+        self.X = rng.lognormal(size=(12, 30))
+        self.X[rng.rand(*self.X.shape) < 0.1] = numpy.nan
+        self.X[:, 3] = numpy.nan
+        self.X[1:, 4] = numpy.nan
+        self.y = numpy.array([0, 0, 0, 0, 0, 1, 1, 1, 1, 2, 2, 2])
+
+    def test_signal_to_noise(self):
+        def s2n(a, b):
+            def stdevm(l):
+                m = numpy.mean(l)
+                return max(numpy.std(l, ddof=1), 0.2 * abs(1.0 if m == 0 else m))
+            return (numpy.mean(a) - numpy.mean(b)) / (stdevm(a) + stdevm(b))
+
+        scores = expression.signal_to_noise(self.X, self.y, 0, 1)
+        for i in range(5, self.X.shape[1]):
+            self.assertAlmostEqual(
+                scores[i], s2n(column_values(self.X, self.y, i, 0),
+                               column_values(self.X, self.y, i, 1)))
+        self.assertTrue(numpy.isnan(scores[3]))
+
+    def test_t_test(self):
+        t, prob = expression.t_test(self.X, self.y, 1, 2)
+        for i in range(5, self.X.shape[1]):
+            t_, prob_ = scipy.stats.ttest_ind(
+                column_values(self.X, self.y, i, 1),
+                column_values(self.X, self.y, i, 2))
+            self.assertAlmostEqual(t[i], t_)
+            self.assertAlmostEqual(prob[i], prob_)
+
+    def test_fold_change(self):
+        fc = expression.fold_change(self.X, self.y, 0, 2)
+        for i in range(5, self.X.shape[1]):
+            self.assertAlmostEqual(
+                fc[i], numpy.mean(column_values(self.X, self.y, i, 0)) /
+                numpy.mean(column_values(self.X, self.y, i, 2)))
+        self.assertEqual(fc[3], 1)
+        self.assertEqual(fc[4], 1)
+
+    def test_pearson_correlation(self):
+        r = expression.pearson_correlation(self.X, self.y)
+        for i in range(5, self.X.shape[1]):
+            known = ~numpy.isnan(self.X[:, i])
+            self.assertAlmostEqual(
+                r[i], numpy.corrcoef(self.y[known], self.X[known, i])[0, 1])
+
+    def test_anova(self):
+        f, prob = expression.anova(self.X, self.y)
+        for i in range(5, self.X.shape[1]):
+            f_, prob_ = scipy.stats.f_oneway(
+                *[column_values(self.X, self.y, i, c) for c in range(3)])
+            self.assertAlmostEqual(f[i], f_)
+            self.assertAlmostEqual(prob[i], prob_)
+        self.assertEqual((f[4], prob[4]), (0, 1))
+
+    def test_permutations(self):
+        rng = numpy.random.RandomState(0)
+        Y = numpy.array([rng.permutation(self.y) for _ in range(7)])
+        for measure in [lambda X, y: expression.signal_to_noise(X, y),
+                        lambda X, y: expression.t_test(X, y)[0],
+                        lambda X, y: expression.fold_change(X, y),
+                        expression.pearson_correlation,
+                        lambda X, y: expression.anova(X, y, 3)[1]]:
+            scores = measure(self.X, Y)
+            self.assertEqual(scores.shape, (7, self.X.shape[1]))
+            for y, row in zip(Y, scores):
+                numpy.testing.assert_allclose(row, measure(self.X, y))
+
+    def test_measure_scores(self):
+        measure = expression.MA_t_test(prob=True)
+        numpy.testing.assert_allclose(
+            measure.scores(self.X, self.y),
+            expression.t_test(self.X, self.y, 0, 1)[1])
+
+
+@unittest.skipUnless(hasattr(Orange, "feature"),
+                     "the measures' __call__ uses the Orange 2 API")
+class TestMeasures(unittest.TestCase):
+    def setUp(self):
+        rng = numpy.random.RandomState(42)
+        self.X = rng.lognormal(size=(12, 8))
+        self.X[rng.rand(*self.X.shape) < 0.1] = numpy.nan
+        self.X[:, 3] = numpy.nan
+        self.y = numpy.array([0, 0, 0, 0, 0, 1, 1, 1, 1, 2, 2, 2])
+
+        self.class_var = expression.DiscreteVariable(
+            "class", values=["a", "b", "c"])
+        domain = Orange.data.Domain(
+            [expression.ContinuousVariable("g%i" % i)
+             for i in range(self.X.shape[1])],
+            self.class_var)
+        self.data = Orange.data.Table(
+            domain,
+            [["?" if numpy.isnan(v) else float(v) for v in row] +
+             [self.class_var.values[c]] for row, c in zip(self.X, self.y)])
+
+    def assertScores(self, measure):
+        expected = [measure(i, self.data) for i in range(self.X.shape[1])]
+        numpy.testing.assert_allclose(
+            measure.scores(self.X, self.y, self.class_var), expected)
+
+    def test_scores(self):
+        for measure in [expression.MA_signalToNoise(),
+                        expression.MA_signalToNoise("c", "a"),
+                        expression.MA_t_test(),
+                        expression.MA_t_test("b", "c", prob=True),
+                        expression.MA_fold_change(),
+                        expression.MA_fold_change("c", "a")]:
+            self.assertScores(measure)
+
+    def test_scores_after_call(self):
+        # __call__ must not replace the default classes with values
+        for measure, scores in [
+                (expression.MA_signalToNoise(),
+                 expression.signal_to_noise(self.X, self.y, 0, 1)),
+                (expression.MA_t_test(),
+                 expression.t_test(self.X, self.y, 0, 1)[0]),
+                (expression.MA_fold_change(),
+                 expression.fold_change(self.X, self.y, 0, 1))]:
+            measure(0, self.data)
+            self.assertIsNone(measure.a)
+            numpy.testing.assert_allclose(
+                measure.scores(self.X, self.y), scores)
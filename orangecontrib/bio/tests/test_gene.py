@@ -0,0 +1,289 @@
+import os
+import pickle
+import shutil
+import tempfile
+import unittest
+
+from orangecontrib.bio import gene
+from orangecontrib.bio.utils import mmapstore
+
+
+ALIASES = [
+    set(["PTEN", "MMAC1", "TEP1"]),
+    set(["TP53", "P53", "LFS1"]),
+    set(["ELK1", "P53X"]),
+    set(["TEP1", "TLP1"]),
+]
+
+
+class ListMatcher(gene.MatcherAliasesPickled):
+    def __init__(self, aliases, name, ignore_case=True):
+        self._aliases = aliases
+        self.name = name
+        self.created = 0
+        gene.MatcherAliasesPickled.__init__(self, ignore_case=ignore_case)
+
+    def filename(self):
+        return self.name
+
+    def create_aliases_version(self):
+        return "v1"
+
+    def create_aliases(self):
+        self.created += 1
+        return self._aliases
+
+
+class TestJoinAliases(unittest.TestCase):
+    def test_join(self):
+        a = [set(["A", "a1"]), set(["B", "b1"]), set(["C"]), set(["x", "A"])]
+        b = [set(["a1", "B"]), set(["D"])]
+        c = [set(["b1", "E"]), set(["c"])]
+        joined = gene.join_aliases([a, b, c])
+        self.assertEqual(sorted(map(sorted, joined)),
+                         [["A", "B", "E", "a1", "b1"], ["A", "x"], ["C"],
+                          ["D"], ["c"]])
+        for order in [[c, b, a], [b, a, c]]:
+            self.assertEqual(sorted(map(sorted, gene.join_aliases(order))),
+                             sorted(map(sorted, joined)))
+
+        joined = gene.join_aliases([a, b, c], lower=True)
+        self.assertIn(set(["C", "c"]), joined)
+
+        # groups from one mapping are not joined by themselves
+        self.assertEqual(len(gene.join_aliases([a])), 4)
+        self.assertEqual(gene.join_aliases([]), [])
+
+    def test_joined_matcher(self):
+        m1 = ListMatcher(ALIASES[:2], "first")
+        m2 = ListMatcher([set(["MMAC1", "TLP1"]), set(["ELK1"])], "second")
+        joined = gene.MatcherAliasesPickledJoined([m2, m1])
+        self.assertEqual(joined.filename(),
+                         gene.MatcherAliasesPickledJoined([m1, m2]).filename())
+        joined.set_targets(["PTEN", "LFS1"])
+        self.assertEqual(joined.match("tlp1"), ["PTEN"])
+        self.assertEqual(joined.match("ELK1"), [])
+        self.assertEqual(joined.match("p53"), ["LFS1"])
+
+
+class TestAliasIndex(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_lookup(self):
+        mapping = gene.create_mapping(ALIASES, lower=True)
+        index = gene.AliasIndex.from_groups(ALIASES, lower=True)
+        self.assertEqual(len(index), len(mapping))
+        for alias in list(mapping) + ["MMac1", "missing", ""]:
+            self.assertEqual(set(index.lookup(alias)),
+                             mapping.get(alias.lower(), set()))
+
+        queries = ["tep1", "missing", "P53", "Elk1"]
+        indptr, groups = index.lookup_many(queries)
+        for i, alias in enumerate(queries):
+            self.assertEqual(set(groups[indptr[i]:indptr[i + 1]]),
+                             mapping.get(alias.lower(), set()))
+
+        index = gene.AliasIndex.from_groups(ALIASES, lower=False)
+        self.assertEqual(list(index.lookup("TEP1")), [0, 3])
+        self.assertEqual(list(index.lookup("tep1")), [])
+
+    def test_read_write(self):
+        path = os.path.join(self.tmpdir, "index")
+        gene.AliasIndex.from_groups(ALIASES, lower=True).write(path, {"a": 1})
+        index, meta = gene.AliasIndex.read(path)
+        self.assertEqual(meta, {"a": 1})
+        self.assertTrue(index.lower)
+        self.assertEqual(list(index.lookup("TEP1")), [0, 3])
+
+    def test_match_many(self):
+        matcher = gene.MatcherAliases(ALIASES)
+        matcher.set_targets(["pten", "LFS1", "TLP1", "other"])
+        genes = ["TEP1", "p53", "P53X", "MMAC1", "other", "unknown"]
+        matches = matcher.match_many(genes)
+        self.assertEqual([sorted(m) for m in matches],
+                         [sorted(matcher.match(g)) for g in genes])
+        self.assertEqual(sorted(matches[0]), ["TLP1", "pten"])
+        self.assertEqual(matcher.umatch_many(genes),
+                         [None, "LFS1", None, "pten", None, None])
+
+        direct = gene.matcher([], direct=True)
+        direct.set_targets(["pten", "TP53"])
+        self.assertEqual(direct.umatch_many(["PTEN", "tp53", "x"]),
+                         ["pten", "TP53", None])
+
+    def test_sequence(self):
+        matcher = gene.MatcherSequence([gene.MatcherDirect(),
+                                        gene.MatcherAliases(ALIASES)])
+        targets = ["PTEN", "TLP1", "TP53", "ELK1", "p53x"]
+        match = matcher.set_targets(targets)
+        genes = ["pten", "MMAC1", "TEP1", "LFS1", "P53X", "none"]
+        self.assertEqual([sorted(m) for m in match.match_many(genes)],
+                         [sorted(match.match(g)) for g in genes])
+
+        indices, ambiguous = matcher.resolve(genes)
+        self.assertEqual(indices.tolist(), [0, 0, -1, 2, 4, -1])
+        self.assertEqual(ambiguous.tolist(),
+                         [False, False, True, False, False, False])
+        self.assertEqual(matcher.umatch_many(genes),
+                         [match.umatch(g) for g in genes])
+        self.assertIs(match.resolve(genes), match.resolve(genes))
+
+        # match objects are memoized by targets
+        self.assertIs(matcher.set_targets(list(targets)), match)
+        self.assertIsNot(matcher.set_targets(targets[:2]), match)
+        self.assertIs(matcher.set_targets(iter(targets)), match)
+        # the components answer for the current targets
+        aliases = matcher.matchers[1]
+        self.assertEqual(aliases.match("MMAC1"), ["PTEN"])
+        self.assertEqual(aliases.matcho, match.ms[1])
+
+    def test_match_many_after_explain(self):
+        matcher = gene.MatcherSequence([gene.MatcherAliases(ALIASES),
+                                        gene.MatcherDirect()])
+        match = matcher.set_targets(["PTEN", "p53"])
+        genes = ["TLP1", "ELK1", "p53", "tep1"]
+        for g in genes:
+            match.ms[0].explain(g)
+        self.assertEqual(match.ms[0].explain("ELK1"), [([], ALIASES[2])])
+        self.assertEqual([sorted(m) for m in match.match_many(genes)],
+                         [sorted(match.match(g)) for g in genes])
+        self.assertEqual(match.match_many(["ELK1"]), [[]])
+        self.assertEqual(match.match_many(["p53"]), [["p53"]])
+
+    def test_read_write_aliases(self):
+        path = os.path.join(self.tmpdir, "aliases")
+        gene.write_aliases(path, ALIASES, version="v1")
+        groups, index = gene.read_aliases(path, version="v1")
+        self.assertEqual(len(groups), len(ALIASES))
+        self.assertEqual(list(groups), ALIASES)
+        self.assertEqual(groups[-1], ALIASES[-1])
+        self.assertEqual(list(index.lookup("tep1")), [0, 3])
+        with self.assertRaises(mmapstore.FormatError):
+            gene.read_aliases(path, version="v2")
+
+    def test_pickled_file(self):
+        path = os.path.join(self.tmpdir, "aliases.pck")
+        with open(path, "wb") as f:
+            pickle.dump(None, f, -1)
+            pickle.dump(ALIASES, f, -1)
+        matcher = gene.MatcherAliasesFile(path)
+        matcher.set_targets(["pten"])
+        self.assertEqual(matcher.match("TEP1"), ["pten"])
+
+        gene.write_aliases(path, ALIASES)
+        matcher = gene.MatcherAliasesFile(path)
+        matcher.set_targets(["pten"])
+        self.assertEqual(matcher.match("TEP1"), ["pten"])
+
+    def test_saved_aliases(self):
+        old_path = gene.gene_matcher_path
+        gene.gene_matcher_path = self.tmpdir
+        try:
+            matcher = ListMatcher(ALIASES, "list")
+            matcher.set_targets(["PTEN"])
+            self.assertEqual(matcher.match("mmac1"), ["PTEN"])
+            self.assertEqual(matcher.created, 1)
+            filename = os.path.join(self.tmpdir, "list")
+            self.assertTrue(mmapstore.is_store(filename))
+
+            # saved aliases and index are loaded without recreating them
+            matcher = ListMatcher(ALIASES, "list")
+            matcher.set_targets(["PTEN"])
+            self.assertEqual(matcher.match("mmac1"), ["PTEN"])
+            self.assertEqual(matcher.created, 0)
+            self.assertIsInstance(matcher.aliases, gene.AliasGroups)
+            self.assertEqual(list(matcher.aliases), ALIASES)
+            self.assertEqual(matcher.explain("mmac1"),
+                             [(["PTEN"], ALIASES[0])])
+
+            # aliases saved for a different version are recreated
+            matcher = ListMatcher(ALIASES[:2], "list")
+            matcher.create_aliases_version = lambda: "v2"
+            matcher.set_targets(["PTEN"])
+            self.assertEqual(matcher.created, 1)
+            self.assertEqual(len(matcher.aliases), 2)
+
+            # index is rebuilt when the case sensitivity differs
+            matcher = ListMatcher(ALIASES, "list", ignore_case=False)
+            matcher.set_targets(["PTEN"])
+            self.assertEqual(matcher.match("mmac1"), [])
+            self.assertEqual(matcher.match("MMAC1"), ["PTEN"])
+        finally:
+            gene.gene_matcher_path = old_path
+
+
+GENE_INFO = """\
+#Format: tax_id GeneID Symbol LocusTag Synonyms ...
+9606\t1\tA1BG\t-\tA1B|ABG|GAB\t-\t19\t19q13.4\talpha-1-B glycoprotein
+9606\t2\tA2M\t-\tA2MD|CPAMD5|FWP007|S863-7\t-\t12\t12p13.31\talpha-2-macroglobulin
+9606\t3\tA2MP1\tLT3\tA2MP|GAB\t-\t12\t12p13.31\tpseudogene
+
+9606\t9\tNAT1\t-\tAAC1|MNAT|2\t-\t8\t8p22\tN-acetyltransferase 1
+"""
+
+GENE_HISTORY = """\
+9606\t-\t4\tA12M1\t20050510
+9606\t2\t5\tA12M2\t20050510
+"""
+
+
+class TestNCBIGeneInfo(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        for name, contents in [("gene_info.9606.db", GENE_INFO),
+                               ("gene_history.9606.db", GENE_HISTORY)]:
+            with open(os.path.join(self.tmpdir, name), "w") as f:
+                f.write(contents)
+        self._localpath_download = gene.serverfiles.localpath_download
+        gene.serverfiles.localpath_download = \
+            lambda domain, filename: os.path.join(self.tmpdir, filename)
+
+    def tearDown(self):
+        gene.serverfiles.localpath_download = self._localpath_download
+        shutil.rmtree(self.tmpdir)
+
+    def test_info(self):
+        for _ in range(2):  # build, then reuse the index
+            info = gene.NCBIGeneInfo("9606")
+            self.assertEqual(len(info), 4)
+            self.assertEqual(info.keys(), ["1", "2", "3", "9"])
+            self.assertIn("3", info)
+            self.assertNotIn("4", info)
+            self.assertEqual(info["2"].symbol, "A2M")
+            self.assertEqual(info["3"].synonyms, ["A2MP", "GAB"])
+            self.assertEqual([g.gene_id for g in info.values()],
+                             ["1", "2", "3", "9"])
+            with self.assertRaises(KeyError):
+                info["4"]
+        self.assertTrue(os.path.exists(
+            os.path.join(self.tmpdir, "gene_info.9606.db.index")))
+
+        info["10"] = "9606\t10\tNAT2\t-\t-\t-\t8\t8p22\tNAT2"
+        self.assertEqual(len(info), 5)
+        self.assertEqual(info["10"].symbol, "NAT2")
+
+    def test_matching(self):
+        info = gene.NCBIGeneInfo("9606")
+        # gene 2's id is also a synonym of gene 9 (NAT1, MNAT)
+        names = ["1", "a2m", "CPAMD5", "LT3", "GAB", "MNAT", "unknown", "2",
+                 "NAT1"]
+        self.assertEqual([info._umatch(name) for name in names],
+                         ["1", "2", "2", "3", None, None, None, "2", None])
+        self.assertEqual(info("cpamd5").symbol, "A2M")
+        self.assertIsNone(info.get_info("GAB"))
+        self.assertEqual([info.matcher.umatch(name) for name in names],
+                         [info._umatch(name) for name in names])
+
+    def test_history(self):
+        history = gene.NCBIGeneInfo("9606").history()
+        self.assertEqual(len(history), 2)
+        self.assertEqual(history["5"].discontinued_symbol, "A12M2")
+        self.assertNotIn("2", history)
+
+
+if __name__ == "__main__":
+    unittest.main()
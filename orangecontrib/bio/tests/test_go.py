@@ -0,0 +1,353 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from six import StringIO
+
+from orangecontrib.bio import go
+from orangecontrib.bio.utils import stats
+
+
+ONTOLOGY = """format-version: 1.2
+subsetdef: goslim_generic "Generic GO slim"
+
+[Term]
+id: GO:0000001
+name: root
+namespace: biological_process
+subset: goslim_generic
+
+[Term]
+id: GO:0000002
+name: a
+namespace: biological_process
+is_a: GO:0000001 ! root
+
+[Term]
+id: GO:0000003
+name: b
+namespace: biological_process
+alt_id: GO:0000013
+is_a: GO:0000001 ! root
+subset: goslim_generic
+
+[Term]
+id: GO:0000004
+name: c
+namespace: biological_process
+is_a: GO:0000002 ! a
+relationship: part_of GO:0000003 ! b
+
+[Term]
+id: GO:0000005
+name: d
+namespace: molecular_function
+
+"""
+
+GENES = [
+    ("G1", "GO:0000004", "IDA", "P"),
+    ("G2", "GO:0000002", "IEA", "P"),
+    ("G3", "GO:0000003", "IDA", "P"),
+    ("G4", "GO:0000013", "TAS", "P"),
+    ("G5", "GO:0000001", "IDA", "P"),
+    ("G5", "GO:0000005", "IDA", "F"),
+    ("G6", "GO:0000005", "IEA", "F"),
+    ("G7", "GO:0000004", "IMP", "P"),
+    ("G8", "GO:0000003", "IDA", "P"),
+]
+
+
+def annotations_file():
+    lines = []
+    for gene, term, evidence, aspect in GENES:
+        fields = ["DB", gene + "_id", gene, "", term, "PMID:1", evidence, "",
+                  aspect, "", gene.lower(), "gene", "taxon:1", "20100101",
+                  "DB", "", ""]
+        lines.append("\t".join(fields) + "\n")
+    return StringIO("!gaf-version: 2.0\n" + "".join(lines))
+
+
+class TestEnrichment(unittest.TestCase):
+    def setUp(self):
+        self.ontology = go.Ontology(StringIO(ONTOLOGY))
+        self.annotations = go.Annotations(annotations_file(),
+                                          ontology=self.ontology)
+
+    def assertSameEnrichment(self, *args, **kwargs):
+        expected = self.annotations.get_enriched_terms(
+            *args, engine="python", **kwargs)
+        actual = self.annotations.get_enriched_terms(
+            *args, engine="sparse", **kwargs)
+        self.assertEqual(set(expected), set(actual))
+        for term in expected:
+            genes, p, ref = expected[term]
+            genes_, p_, ref_ = actual[term]
+            self.assertEqual(sorted(genes), sorted(genes_))
+            self.assertAlmostEqual(p, p_)
+            self.assertEqual(ref, ref_)
+
+    def test_sparse_engine(self):
+        for prob in [stats.Binomial(), stats.Hypergeometric()]:
+            for use_fdr in [True, False]:
+                self.assertSameEnrichment(["G1", "G3", "G4"], prob=prob,
+                                          use_fdr=use_fdr)
+        self.assertSameEnrichment(["G1", "G2", "G5", "G6"])
+        self.assertSameEnrichment(["G1", "g5"], aspect="P")
+        self.assertSameEnrichment(["G1", "G5", "G6"], aspect=["F"])
+        self.assertSameEnrichment(["G1", "G2", "G3"],
+                                  evidence_codes=["IDA", "IMP"])
+        self.assertSameEnrichment(["G1", "G3"], reference=["G1", "G2", "G8"])
+        self.assertSameEnrichment(["G1", "G7"], slims_only=True)
+
+    def test_sparse_progress(self):
+        progress = []
+        self.annotations.get_enriched_terms(
+            ["G1", "G2", "G5", "G6"], engine="sparse",
+            progress_callback=progress.append)
+        self.assertGreater(len(progress), 3)
+        self.assertEqual(progress, sorted(progress))
+        self.assertEqual(progress[-1], 100.0)
+        # the incidence matrix is reused
+        progress = []
+        self.annotations.get_enriched_terms(
+            ["G1", "G3"], engine="sparse", progress_callback=progress.append)
+        self.assertGreater(len(progress), 2)
+        self.assertEqual(progress, sorted(progress))
+
+    def test_batch(self):
+        gene_lists = [["G1", "G3", "G4"], ["G1", "G2", "G5", "G6"], [],
+                      ["G7"], ["G1", "G2", "G3", "G8", "unknown"]]
+        for kwargs in [{}, {"aspect": "P", "prob": stats.Hypergeometric()},
+                       {"reference": ["G1", "G2", "G3", "G5"]},
+                       {"slims_only": True, "use_fdr": False}]:
+            expected = [self.annotations.get_enriched_terms(genes, **kwargs)
+                        for genes in gene_lists]
+            for n_jobs, chunk_size in [(1, 50), (1, 2), (2, 2)]:
+                actual = self.annotations.get_enriched_terms_batch(
+                    gene_lists, n_jobs=n_jobs, chunk_size=chunk_size,
+                    **kwargs)
+                self.assertEqual(len(actual), len(gene_lists))
+                for res, res_ in zip(expected, actual):
+                    self.assertEqual(set(res), set(res_))
+                    for term in res:
+                        self.assertEqual(sorted(res[term][0]),
+                                         sorted(res_[term][0]))
+                        self.assertAlmostEqual(res[term][1], res_[term][1])
+                        self.assertEqual(res[term][2], res_[term][2])
+
+    def test_term_incidence(self):
+        incidence = self.annotations.term_incidence(aspect="P")
+        matrix = incidence.matrix
+        row = incidence.gene_index["G1"]
+        terms = set(incidence.terms[col]
+                    for col in matrix.indices[matrix.indptr[row]:
+                                              matrix.indptr[row + 1]])
+        # GO:0000013 is an alternative id of GO:0000003
+        self.assertEqual(terms, set(["GO:0000001", "GO:0000002",
+                                     "GO:0000003", "GO:0000004",
+                                     "GO:0000013"]))
+        self.assertIs(incidence, self.annotations.term_incidence(aspect="P"))
+
+        self.annotations.add_annotation(
+            "\t".join(["DB", "G9_id", "G9", "", "GO:0000002", "", "IDA", "",
+                       "P", "", "", "gene", "taxon:1", "20100101", "DB", "",
+                       ""]))
+        incidence = self.annotations.term_incidence(aspect="P")
+        self.assertIn("G9", incidence.gene_index)
+
+
+class TestOntologyClosure(unittest.TestCase):
+    def setUp(self):
+        self.ontology = go.Ontology(StringIO(ONTOLOGY))
+
+    def test_graphs(self):
+        ontology = self.ontology
+        self.assertEqual(ontology.extract_super_graph(["GO:0000004"]),
+                         set(["GO:0000001", "GO:0000002", "GO:0000003",
+                              "GO:0000004"]))
+        self.assertEqual(ontology.extract_super_graph("GO:0000002"),
+                         set(["GO:0000001", "GO:0000002"]))
+        self.assertEqual(ontology.extract_super_graph(["GO:0000013"]),
+                         set(["GO:0000001", "GO:0000013"]))
+        self.assertEqual(ontology.extract_sub_graph(["GO:0000001"]),
+                         set(["GO:0000001", "GO:0000002", "GO:0000003",
+                              "GO:0000004"]))
+        self.assertEqual(ontology.extract_sub_graph(["GO:0000003",
+                                                     "GO:0000005"]),
+                         set(["GO:0000003", "GO:0000004", "GO:0000005"]))
+        self.assertRaises(KeyError, ontology.extract_super_graph,
+                          ["GO:0000099"])
+
+    def test_term_depth(self):
+        depths = dict((term, self.ontology.term_depth(term))
+                      for term in self.ontology)
+        self.assertEqual(depths, {"GO:0000001": 1, "GO:0000002": 2,
+                                  "GO:0000003": 2, "GO:0000004": 3,
+                                  "GO:0000005": 1})
+        self.assertEqual(self.ontology.term_depth("GO:0000013"), 2)
+        # depths are not shared between ontologies
+        ontology = go.Ontology(StringIO(ONTOLOGY.replace(
+            "relationship: part_of GO:0000003 ! b",
+            "is_a: GO:0000005 ! d")))
+        self.assertEqual(ontology.term_depth("GO:0000004"), 2)
+
+    def test_slims(self):
+        ontology = self.ontology
+        ontology.set_slims_subset("goslim_generic")
+        self.assertEqual(ontology.slims_for_term("GO:0000004"),
+                         set(["GO:0000001", "GO:0000003"]))
+        self.assertEqual(ontology.slims_for_term("GO:0000002"),
+                         set(["GO:0000001"]))
+        self.assertEqual(ontology.slims_for_term("GO:0000003"),
+                         set(["GO:0000003"]))
+        ontology.set_slims_subset(["GO:0000002"])
+        self.assertEqual(ontology.slims_for_term("GO:0000004"),
+                         set(["GO:0000002"]))
+        self.assertEqual(ontology.slims_for_term("GO:0000003"), set())
+
+    def test_invalidate(self):
+        ontology = self.ontology
+        self.assertEqual(ontology.term_depth("GO:0000004"), 3)
+        ontology.parse_file(StringIO(
+            "format-version: 1.2\n\n[Term]\nid: GO:0000006\nname: e\n"
+            "is_a: GO:0000004 ! c\n\n"))
+        self.assertEqual(ontology.extract_super_graph(["GO:0000006"]),
+                         set(["GO:0000001", "GO:0000002", "GO:0000003",
+                              "GO:0000004", "GO:0000006"]))
+        self.assertIn("GO:0000006",
+                      ontology.extract_sub_graph(["GO:0000002"]))
+        self.assertEqual(ontology.term_depth("GO:0000006"), 4)
+
+
+class TestOntologySnapshot(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmpdir, "gene_ontology_edit.obo")
+        with open(self.filename, "w") as f:
+            f.write(ONTOLOGY)
+        self._localpath_download = go.serverfiles.localpath_download
+        go.serverfiles.localpath_download = lambda *args: self.filename
+
+    def tearDown(self):
+        go.serverfiles.localpath_download = self._localpath_download
+        shutil.rmtree(self.tmpdir)
+
+    def test_snapshot(self):
+        parsed = go.Ontology()
+        self.assertIsInstance(parsed.terms, dict)
+        self.assertTrue(os.path.exists(self.filename + ".snapshot"))
+
+        loaded = go.Ontology()
+        self.assertNotIsInstance(loaded.terms, dict)
+        self.assertEqual(len(loaded), len(parsed))
+        self.assertEqual(sorted(loaded), sorted(parsed))
+        self.assertEqual(loaded.header, parsed.header)
+        self.assertEqual(loaded.alias_mapper, parsed.alias_mapper)
+        self.assertEqual(set(loaded.typedefs), set(parsed.typedefs))
+        for term_id in parsed:
+            self.assertEqual(repr(loaded[term_id]), repr(parsed[term_id]))
+            self.assertEqual(loaded[term_id].related,
+                             parsed[term_id].related)
+            self.assertEqual(loaded[term_id].related_to,
+                             parsed[term_id].related_to)
+        self.assertIn("GO:0000013", loaded)
+        self.assertEqual(loaded["GO:0000013"].id, "GO:0000003")
+        self.assertNotIn("GO:0000099", loaded)
+        self.assertEqual(sorted(loaded.named_slims_subset("goslim_generic")),
+                         sorted(parsed.named_slims_subset("goslim_generic")))
+        for term_id in parsed:
+            self.assertEqual(loaded.extract_super_graph([term_id]),
+                             parsed.extract_super_graph([term_id]))
+            self.assertEqual(loaded.extract_sub_graph([term_id]),
+                             parsed.extract_sub_graph([term_id]))
+            self.assertEqual(loaded.term_depth(term_id),
+                             parsed.term_depth(term_id))
+
+    def test_out_of_date_snapshot(self):
+        go.Ontology()
+        with open(self.filename, "w") as f:
+            f.write(ONTOLOGY.replace("name: root", "name: the root"))
+        os.utime(self.filename, (0, 0))
+        ontology = go.Ontology()
+        self.assertEqual(ontology["GO:0000001"].name, "the root")
+        self.assertEqual(go.Ontology()["GO:0000001"].name, "the root")
+
+
+class TestAnnotationColumns(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmpdir, "gene_association.test")
+        with open(self.filename, "w") as f:
+            f.write(annotations_file().getvalue())
+        self._default_database_path = go.default_database_path
+        go.default_database_path = self.tmpdir
+        self.ontology = go.Ontology(StringIO(ONTOLOGY))
+
+    def tearDown(self):
+        go.default_database_path = self._default_database_path
+        shutil.rmtree(self.tmpdir)
+
+    def assertSameAnnotations(self, parsed, loaded):
+        self.assertEqual(list(loaded.annotations), list(parsed.annotations))
+        self.assertEqual(loaded.header, parsed.header)
+        self.assertEqual(loaded.gene_names, parsed.gene_names)
+        self.assertEqual(dict(loaded.alias_mapper), parsed.alias_mapper)
+        self.assertEqual(set(loaded.gene_annotations),
+                         set(parsed.gene_annotations))
+        for gene in list(parsed.gene_annotations) + ["unknown"]:
+            self.assertEqual(loaded.gene_annotations[gene],
+                             parsed.gene_annotations[gene])
+        for term in ["GO:0000003", "GO:0000013", "GO:0000099"]:
+            self.assertEqual(loaded.term_anotations.get(term),
+                             parsed.term_anotations.get(term))
+        for term in self.ontology:
+            self.assertEqual(loaded.get_all_annotations(term),
+                             parsed.get_all_annotations(term))
+        for aspect in [None, "P"]:
+            incidence = parsed.term_incidence(aspect=aspect)
+            incidence_ = loaded.term_incidence(aspect=aspect)
+            self.assertEqual(set(incidence.genes), set(incidence_.genes))
+            self.assertEqual(set(incidence.terms), set(incidence_.terms))
+            self.assertEqual(incidence.matrix.nnz, incidence_.matrix.nnz)
+        for genes in [["G1", "G3", "G4"], ["g1", "G5_id", "G6"]]:
+            for engine in ["python", "sparse"]:
+                expected = parsed.get_enriched_terms(genes)
+                actual = loaded.get_enriched_terms(genes, engine=engine)
+                self.assertEqual(set(actual), set(expected))
+                for term in expected:
+                    self.assertEqual(sorted(actual[term][0]),
+                                     sorted(expected[term][0]))
+                    self.assertAlmostEqual(actual[term][1],
+                                           expected[term][1])
+
+    def test_columns_cache(self):
+        parsed = go.Annotations(self.filename, ontology=self.ontology)
+        self.assertIsInstance(parsed.annotations, list)
+        self.assertTrue(os.path.exists(self.filename + ".columns"))
+
+        loaded = go.Annotations(self.filename, ontology=self.ontology)
+        self.assertNotIsInstance(loaded.annotations, list)
+        self.assertSameAnnotations(parsed, loaded)
+
+        os.utime(self.filename, (0, 0))
+        reparsed = go.Annotations(self.filename, ontology=self.ontology)
+        self.assertIsInstance(reparsed.annotations, list)
+
+    def test_write_columns(self):
+        parsed = go.Annotations(annotations_file(), ontology=self.ontology)
+        path = os.path.join(self.tmpdir, "annotations.columns")
+        parsed.write_columns(path)
+        loaded = go.Annotations(path, ontology=self.ontology)
+        self.assertSameAnnotations(parsed, loaded)
+        self.assertEqual(loaded.annotations[-1], parsed.annotations[-1])
+        self.assertEqual(loaded.annotations[1:3], parsed.annotations[1:3])
+
+        loaded.add_annotation(
+            "\t".join(["DB", "G9_id", "G9", "", "GO:0000002", "", "IDA", "",
+                       "P", "", "", "gene", "taxon:1", "20100101", "DB", "",
+                       ""]))
+        self.assertEqual(len(loaded), len(parsed) + 1)
+        self.assertIn("G9", loaded.gene_names)
+        self.assertIn("G9", loaded.get_all_genes("GO:0000001"))
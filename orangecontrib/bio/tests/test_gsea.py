@@ -0,0 +1,62 @@
+import unittest
+
+import numpy
+
+from orangecontrib.bio.utils import gseacore
+
+
+class TestEnrichmentScores(unittest.TestCase):
+    def setUp(self):
+        rng = numpy.random.RandomState(42)
+        self.lcor = list(rng.normal(size=60))
+        self.lcor[7] = self.lcor[11] = 0.0
+        self.lcor[20] = self.lcor[21]  # ties
+        self.subsets = [list(rng.choice(60, size, replace=False))
+                        for size in [1, 3, 5, 10, 25]]
+        self.subsets.append([7, 11])  # zero weights only
+        self.subsets.append([0, 20, 21, 59])
+
+    def assertResultsEqual(self, first, second):
+        first, second = list(first), list(second)
+        self.assertEqual(len(first), len(second))
+        for a, b in zip(first, second):
+            numpy.testing.assert_allclose(a, b, rtol=1e-12, atol=1e-12)
+
+    def test_ranked_scores(self):
+        rng = numpy.random.RandomState(0)
+        rankings = numpy.vstack([self.lcor, rng.normal(size=(9, 60))])
+        membership = gseacore.geneSetMembership(self.subsets, 60)
+        for p in [1.0, 0.5]:
+            scores = gseacore.enrichmentScoresRanked(
+                membership, rankings, p=p, blockSize=40)
+            for i, lcor in enumerate(rankings.tolist()):
+                ordered = gseacore.orderedPointersCorr(lcor)
+                for si, subset in enumerate(self.subsets):
+                    es = gseacore.enrichmentScoreRanked(
+                        subset, lcor, ordered, p=p)[0]
+                    self.assertAlmostEqual(scores[i, si], es, places=12)
+
+    def test_engines(self):
+        python = gseacore.gseaR(self.lcor, self.subsets, 20, engine="python")
+        vectorized = gseacore.gseaR(self.lcor, self.subsets, 20,
+                                    engine="vectorized")
+        self.assertResultsEqual(python, vectorized)
+
+
+class TestParallel(unittest.TestCase):
+    def test_n_jobs(self):
+        rng = numpy.random.RandomState(1)
+        lcor = list(rng.normal(size=40))
+        subsets = [list(rng.choice(40, size, replace=False))
+                   for size in [2, 5, 8, 15]]
+        for engine in ["python", "vectorized"]:
+            serial = list(gseacore.gseaR(lcor, subsets, 13, engine=engine))
+            for n_jobs, chunkSize in [(2, None), (3, 1), (2, 13)]:
+                parallel = list(gseacore.gseaParallel(
+                    lcor, subsets, n=13, n_jobs=n_jobs, engine=engine,
+                    chunkSize=chunkSize))
+                self.assertEqual(parallel, serial)
+            self.assertEqual(
+                list(gseacore.gseaR(lcor, subsets, 13, engine=engine,
+                                    n_jobs=2)),
+                serial)
@@ -0,0 +1,427 @@
+import os
+import stat
+import gzip
+import shutil
+import sqlite3
+import tempfile
+import unittest
+import warnings
+
+try:
+    from unittest import mock
+except ImportError:
+    import backports.unittest_mock
+    backports.unittest_mock.install()
+    from unittest import mock
+
+import numpy
+
+from orangecontrib.bio import ppi
+
+
+def string_db(filename, nproteins=30):
+    con = sqlite3.connect(filename)
+    with con:
+        ppi.STRING.clear_db(con)
+        ids = ["9606.P%d" % i for i in range(nproteins)]
+        con.executemany("INSERT INTO proteins VALUES (?, ?)",
+                        [(id, "9606") for id in ids])
+        con.executemany(
+            "INSERT INTO links VALUES (?, ?, ?)",
+            [(id1, id2, (i * 37 + j * 11) % 1000)
+             for i, id1 in enumerate(ids) for j, id2 in enumerate(ids)
+             if (i + j) % 3 == 0 and i != j])
+        con.executemany(
+            "INSERT INTO aliases VALUES (?, ?, ?)",
+            [(id, alias, "source")
+             for i, id in enumerate(ids)
+             for alias in ["G%d" % i, "S%d" % (i // 2)]])
+        con.executemany(
+            "INSERT INTO actions VALUES (?, ?, ?, ?, ?)",
+            [(ids[i], ids[i + 1], "binding", "activation" if i % 2 else None,
+              100 + i) for i in range(0, nproteins - 1, 4)])
+        ppi.STRING.create_db_index(con)
+    con.close()
+
+
+def drop_indexes(filename, tables=()):
+    con = sqlite3.connect(filename)
+    for table in tables:
+        con.execute("DROP TABLE %s" % table)
+    for name, in con.execute("SELECT name FROM sqlite_master "
+                             "WHERE type='index'").fetchall():
+        con.execute("DROP INDEX %s" % name)
+    con.commit()
+    con.close()
+
+
+def open_read_only(filename, open_db):
+    """
+    Open the database with `open_db` with `filename` made read-only.
+    Return the database and the issued warnings.
+    """
+    os.chmod(filename, stat.S_IREAD)
+    with open(filename, "rb") as f:
+        contents = f.read()
+    # (file permissions do not apply to root)
+    with warnings.catch_warnings(record=True) as warns, \
+            mock.patch.object(ppi.os, "access", return_value=False):
+        warnings.simplefilter("always")
+        db = open_db(filename)
+    with open(filename, "rb") as f:
+        assert f.read() == contents
+    return db, warns
+
+
+class TestSTRING(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmpdir, "string.sqlite")
+        string_db(self.filename)
+        self.string = ppi.STRING(database=self.filename)
+
+    def tearDown(self):
+        self.string.db.close()
+        shutil.rmtree(self.tmpdir)
+
+    def test_search_ids(self):
+        names = ["G1", "S3", "missing", "G1"]
+        self.assertEqual(self.string.search_ids(names),
+                         [list(self.string.search_id(name))
+                          for name in names])
+        self.assertEqual(sorted(self.string.search_ids(["S3"])[0]),
+                         ["9606.P6", "9606.P7"])
+        self.assertEqual(self.string.search_ids(["G1"], taxid="10090"),
+                         [[]])
+
+    def test_synonyms_many(self):
+        ids = self.string.ids() + ["missing"]
+        self.assertEqual(
+            [sorted(s) for s in self.string.synonyms_many(ids)],
+            [sorted(self.string.synonyms(id)) for id in ids])
+
+    def test_edges_many(self):
+        ids = self.string.ids()[:10]
+        edges = self.string.edges_many(ids)
+        self.assertEqual(sorted(edges),
+                         sorted(e for id in ids for e in self.string.edges(id)))
+        self.assertEqual(
+            sorted(self.string.edges_many(ids, min_score=500)),
+            sorted(e for e in edges if e[2] >= 500))
+        self.assertEqual(self.string.edges_many([]), [])
+
+    def test_chunks(self):
+        self.assertEqual(list(ppi.chunks(range(5), 2)),
+                         [[0, 1], [2, 3], [4]])
+        ids = ["9606.P%d" % (i % 30) for i in range(2000)]
+        self.assertEqual(len(self.string.synonyms_many(ids)), 2000)
+
+
+    def test_all_edges_annotated(self):
+        edges = self.string.all_edges_annotated("9606")
+        self.assertEqual(
+            sorted(edges),
+            sorted(e for id in self.string.ids()
+                   for e in self.string.edges_annotated(id)))
+        self.assertEqual(self.string.all_edges_annotated("10090"), [])
+
+    def test_init_db_index(self):
+        # indexes missing in databases from older versions are added
+        self.string.db.close()
+        con = sqlite3.connect(self.filename)
+        con.execute("DROP INDEX index_link_protein_id1_score")
+        con.close()
+        self.string = ppi.STRING(database=self.filename)
+        indexes = [name for name, in self.string.db.execute(
+            "SELECT name FROM sqlite_master WHERE type='index'")]
+        self.assertIn("index_link_protein_id1_score", indexes)
+
+    def test_read_only(self):
+        # missing indexes are not required
+        self.string.db.close()
+        drop_indexes(self.filename)
+        string, warns = open_read_only(
+            self.filename, lambda f: ppi.STRING(database=f))
+        self.addCleanup(string.db.close)
+        self.assertEqual(len(warns), 1)
+        self.assertEqual(string.db.execute(
+            "SELECT count(*) FROM sqlite_master WHERE type='index'"
+            ).fetchone()[0], 0)
+        ids = string.ids()[:10]
+        self.assertEqual(sorted(string.edges_many(ids)),
+                         sorted(e for id in ids for e in string.edges(id)))
+        self.assertEqual(sorted(string.search_ids(["S3"])[0]),
+                         ["9606.P6", "9606.P7"])
+
+
+def write_gz(filename, lines):
+    with gzip.open(filename, "wb") as f:
+        f.write("".join(line + "\n" for line in lines).encode("utf-8"))
+
+
+class TestSTRINGInitDB(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        pattern = os.path.join(self.tmpdir, "9606.{}.v10.txt.gz")
+        write_gz(pattern.format("protein.links"),
+                 ["protein1 protein2 combined_score"] +
+                 ["9606.P%d 9606.P%d %d" % (i, j, 100 * i + j)
+                  for i in range(5) for j in range(5) if i != j])
+        write_gz(pattern.format("protein.actions"),
+                 ["item_id_a\titem_id_b\tmode\taction\t"
+                  "a_is_acting\tscore",
+                  "9606.P0\t9606.P1\tbinding\t\t0\t900",
+                  "9606.P1\t9606.P2\tactivation\tactivation\t1\t500"])
+        write_gz(pattern.format("protein.aliases"),
+                 ["## string_protein_id ## alias ## source ##"] +
+                 ["9606.P%d\tG%d\tEnsembl" % (i, i) for i in range(5)])
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_init_db(self):
+        dbfilename = os.path.join(self.tmpdir, "string.sqlite")
+        progress = []
+        ppi.STRING.init_db("v10", "9606", cache_dir=self.tmpdir,
+                           dbfilename=dbfilename,
+                           progress_callback=lambda *args:
+                               progress.append(args))
+        self.assertFalse(os.path.exists(dbfilename + ".tmp"))
+        string = ppi.STRING(database=dbfilename)
+        try:
+            self.assertEqual(string.organisms(), ["9606"])
+            self.assertEqual(string.ids(),
+                             ["9606.P%d" % i for i in range(5)])
+            self.assertEqual(sorted(string.edges("9606.P2")),
+                             [("9606.P2", "9606.P%d" % j, 200 + j)
+                              for j in [0, 1, 3, 4]])
+            self.assertEqual(list(string.search_id("G3")), ["9606.P3"])
+            annotated = string.edges_annotated("9606.P1")
+            self.assertIn(("9606.P1", "9606.P2", 102, "activation",
+                           "activation", 500), annotated)
+            version = string.db.execute("SELECT * FROM version").fetchall()
+            self.assertEqual(version, [("v10", ppi.STRING.VERSION)])
+        finally:
+            string.db.close()
+
+        total = sum(os.stat(os.path.join(self.tmpdir, f)).st_size
+                    for f in os.listdir(self.tmpdir) if f.endswith(".gz"))
+        self.assertEqual(progress[-1], (total, total))
+        processed = [p for p, _ in progress]
+        self.assertEqual(processed, sorted(processed))
+
+    def test_rebuild_open_db(self):
+        dbfilename = os.path.join(self.tmpdir, "string.sqlite")
+        ppi.STRING.init_db("v10", "9606", cache_dir=self.tmpdir,
+                           dbfilename=dbfilename)
+        string = ppi.STRING(database=dbfilename)
+        self.assertEqual(list(string.search_id("G3")), ["9606.P3"])
+        write_gz(os.path.join(self.tmpdir, "9606.protein.aliases.v10.txt.gz"),
+                 ["## string_protein_id ## alias ## source ##",
+                  "9606.P3\tH3\tEnsembl"])
+        ppi.STRING.init_db("v10", "9606", cache_dir=self.tmpdir,
+                           dbfilename=dbfilename)
+        # the shared connections to the replaced file were closed
+        string = ppi.STRING(database=dbfilename)
+        try:
+            self.assertEqual(list(string.search_id("G3")), [])
+            self.assertEqual(list(string.search_id("H3")), ["9606.P3"])
+        finally:
+            string.db.close()
+
+
+def biogrid_tab2(filename):
+    def protein(i):
+        # biogrid id, entrez, systematic name, symbol, synonyms, organism
+        return ("%d" % (100 + i), "%d" % (1000 + i), "-", "B%d" % i,
+                "X%d|Y%d" % (i, i // 2), "9606" if i < 6 else "10090")
+
+    rows = []
+    for n, (i, j) in enumerate([(0, 1), (0, 2), (1, 2), (2, 3), (3, 3),
+                                (4, 0), (6, 7), (5, 6), (1, 2)]):
+        a, b = protein(i), protein(j)
+        rows.append([str(n), a[1], b[1], a[0], b[0], a[2], b[2], a[3],
+                     b[3], a[4], b[4], "Two-hybrid", "physical", "Author",
+                     "123", a[5], b[5], "High", "-" if n % 2 else str(n),
+                     "-", "-", "-", "-", "BIOGRID"])
+    with open(filename, "w") as f:
+        f.write("\t".join(["#header"] * 24) + "\n")
+        for row in rows:
+            f.write("\t".join(row) + "\n")
+
+
+class TestBioGRID(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        filepath = os.path.join(self.tmpdir, "BIOGRID-ALL.tab2")
+        biogrid_tab2(filepath)
+        ppi.BioGRID.init_db(filepath)
+        self.biogrid = ppi.BioGRID(
+            database=os.path.join(self.tmpdir, ppi.BioGRID.SERVER_FILE))
+
+    def tearDown(self):
+        self.biogrid.db.close()
+        shutil.rmtree(self.tmpdir)
+
+    def test_edges(self):
+        links = self.biogrid.all_edges()
+        self.assertEqual(len(links), 9)
+        for id in self.biogrid.ids():
+            self.assertEqual(
+                sorted(self.biogrid.edges(id), key=str),
+                sorted([e for e in links if id in e[:2]], key=str))
+            self.assertEqual(len(self.biogrid.edges_annotated(id)),
+                             len(self.biogrid.edges(id)))
+        # self interaction
+        self.assertEqual(self.biogrid.edges("103").count(
+            ("103", "103", 4.0)), 1)
+        ids = ["100", "102", "missing"]
+        self.assertEqual(sorted(self.biogrid.edges_many(ids), key=str),
+                         sorted([e for id in ids
+                                 for e in self.biogrid.edges(id)], key=str))
+
+    def test_all_edges_taxid(self):
+        mouse = self.biogrid.all_edges("10090")
+        self.assertEqual(sorted(mouse, key=str),
+                         sorted([("106", "107", 6.0), ("105", "106", None)],
+                                key=str))
+        self.assertEqual(len(self.biogrid.all_edges("9606")), 8)
+        self.assertEqual(len(self.biogrid.all_edges_annotated("10090")), 2)
+
+    def test_search(self):
+        self.assertEqual(self.biogrid.search_id("B3"), ["103"])
+        self.assertEqual(self.biogrid.search_id("1003"), ["103"])
+        self.assertEqual(self.biogrid.search_id("103"), ["103"])
+        self.assertEqual(sorted(self.biogrid.search_id("Y3")),
+                         ["106", "107"])
+        self.assertEqual(self.biogrid.search_id("Y3", taxid="9606"), [])
+        self.assertEqual(self.biogrid.search_ids(["X1", "missing", "X1"]),
+                         [["101"], [], ["101"]])
+
+    def test_synonyms(self):
+        ids = self.biogrid.ids() + ["missing"]
+        self.assertEqual(self.biogrid.synonyms_many(ids),
+                         [self.biogrid.synonyms(id) for id in ids])
+        self.assertEqual(self.biogrid.synonyms("101"),
+                         ["1001", "B1", "X1", "Y0"])
+
+    def test_index_seek(self):
+        plan = self.biogrid.db.execute(
+            "EXPLAIN QUERY PLAN "
+            "SELECT * FROM edges JOIN links ON edges.link_id=links.rowid "
+            "WHERE edges.biogrid_id=?", ("100",)).fetchall()
+        self.assertFalse(any("SCAN" in row[-1] for row in plan))
+
+    def test_read_only(self):
+        # lookup tables missing in older databases are built in memory
+        expected = (sorted(self.biogrid.all_edges(), key=str),
+                    self.biogrid.synonyms("101"),
+                    sorted(self.biogrid.search_id("Y3")))
+        self.biogrid.db.close()
+        drop_indexes(self.biogrid.filename, ["edges", "synonyms"])
+        biogrid, warns = open_read_only(
+            self.biogrid.filename, lambda f: ppi.BioGRID(database=f))
+        self.biogrid = biogrid
+        self.assertEqual(len(warns), 1)
+        self.assertEqual((sorted(biogrid.all_edges(), key=str),
+                          biogrid.synonyms("101"),
+                          sorted(biogrid.search_id("Y3"))),
+                         expected)
+        self.assertEqual(sorted(biogrid.edges("100"), key=str),
+                         sorted([e for e in expected[0] if "100" in e[:2]],
+                                key=str))
+
+
+class TestPPIAdjacency(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmpdir, "string.sqlite")
+        string_db(self.filename)
+        self.string = ppi.STRING(database=self.filename)
+
+    def tearDown(self):
+        self.string.db.close()
+        shutil.rmtree(self.tmpdir)
+
+    def test_edges(self):
+        adj = self.string.adjacency("9606")
+        self.assertEqual(adj.ids(), sorted(self.string.ids()))
+        sources, targets, scores = adj.edges()
+        ids = adj.ids()
+        self.assertEqual(
+            sorted(zip([ids[i] for i in sources], [ids[i] for i in targets],
+                       scores.tolist())),
+            sorted(self.string.all_edges("9606")))
+        self.assertEqual(scores.dtype, numpy.int16)
+
+        id = "9606.P3"
+        i = adj.index(id)
+        self.assertEqual(adj.ids(adj.neighbors([i])),
+                         sorted(set(e[1] for e in self.string.edges(id))))
+        self.assertEqual(
+            adj.ids(adj.neighbors([i], min_score=500)),
+            sorted(set(e[1] for e in self.string.edges(id) if e[2] >= 500)))
+        self.assertEqual(adj.index_many([id, "missing"]).tolist(), [i, -1])
+
+    def test_actions(self):
+        adj = self.string.adjacency()
+        sources, targets, modes, actions, scores = adj.actions()
+        ids = adj.ids()
+        cur = self.string.db.execute(
+            "SELECT protein_id1, protein_id2, mode, action, score "
+            "FROM actions")
+        self.assertEqual(
+            sorted(zip([ids[i] for i in sources], [ids[i] for i in targets],
+                       [adj.mode_names[m] for m in modes],
+                       [adj.action_names[a] for a in actions],
+                       scores.tolist())),
+            sorted(cur.fetchall()))
+
+    def test_neighborhood_subgraph(self):
+        adj = self.string.adjacency()
+        seed = adj.index_many(["9606.P0"])
+        one = adj.neighborhood(seed, k=1)
+        self.assertEqual(set(one), set(adj.neighbors(seed)) | set(seed))
+        two = adj.neighborhood(seed, k=2)
+        self.assertEqual(set(two), set(adj.neighbors(one)) | set(one))
+        self.assertEqual(adj.neighborhood(seed, k=0).tolist(),
+                         seed.tolist())
+
+        sub = adj.subgraph(one)
+        self.assertEqual(sub.ids(), adj.ids(one))
+        s, t, _ = sub.edges()
+        members = set(adj.ids(one))
+        expected = [(id1, id2) for id1, id2, _ in self.string.all_edges()
+                    if id1 in members and id2 in members]
+        self.assertEqual(
+            sorted(zip(sub.ids(s), sub.ids(t))), sorted(expected))
+        self.assertEqual(sub.to_sparse().nnz, len(expected))
+
+    def test_cache(self):
+        adj = self.string.adjacency()
+        path = self.filename + ".all.adjacency"
+        self.assertTrue(os.path.exists(path))
+        loaded = self.string.adjacency()
+        self.assertIsInstance(loaded.indptr, numpy.ndarray)
+        numpy.testing.assert_array_equal(loaded.indices, adj.indices)
+        numpy.testing.assert_array_equal(loaded.scores, adj.scores)
+        self.assertEqual(loaded.action_names, adj.action_names)
+
+        # A changed database invalidates the cached adjacency
+        with self.string.db:
+            self.string.db.execute("DELETE FROM links")
+        os.utime(self.filename, (0, 0))
+        self.assertEqual(len(self.string.adjacency().indices), 0)
+
+    def test_symmetrize(self):
+        adj = ppi.PPIAdjacency.from_edges(
+            ["a", "b", "c"], [("a", "b", None), ("b", "c", 1.5)],
+            symmetrize=True, score_dtype=numpy.float32,
+            missing_score=numpy.nan)
+        self.assertEqual(adj.ids(adj.neighbors([adj.index("b")])),
+                         ["a", "c"])
+        self.assertTrue(numpy.isnan(adj.edges([0])[2]).all())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,80 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import unittest
+
+from orangecontrib.bio.utils import sqlitepool
+
+
+class TestConnectionPool(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmpdir, "test.sqlite")
+        con = sqlite3.connect(self.filename)
+        with con:
+            con.execute("CREATE TABLE t (a INT)")
+            con.executemany("INSERT INTO t VALUES (?)",
+                            [(i,) for i in range(100)])
+        con.close()
+
+    def tearDown(self):
+        sqlitepool.release(self.filename)
+        shutil.rmtree(self.tmpdir)
+
+    def count(self, pool):
+        return pool.execute("SELECT COUNT(*) FROM t").fetchone()[0]
+
+    def test_threads(self):
+        pool = sqlitepool.ConnectionPool(self.filename, readonly=True)
+        connections, counts = [], []
+
+        def query():
+            connections.append(pool.connection())
+            counts.append(self.count(pool))
+
+        threads = [threading.Thread(target=query) for _ in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(counts, [100] * 4)
+        self.assertEqual(len(set(map(id, connections))), 4)
+        self.assertIs(pool.connection(), pool.connection())
+        # connections of the finished threads were closed
+        self.assertEqual(len(pool._connections), 1)
+        pool.close()
+
+    def test_readonly(self):
+        pool = sqlitepool.ConnectionPool(self.filename, readonly=True)
+        with self.assertRaises(sqlite3.OperationalError):
+            pool.execute("INSERT INTO t VALUES (1)")
+        self.assertGreater(
+            pool.execute("PRAGMA mmap_size").fetchone()[0], 0)
+        pool.close()
+
+    def test_transaction(self):
+        pool = sqlitepool.ConnectionPool(self.filename)
+        with pool:
+            pool.execute("INSERT INTO t VALUES (100)")
+        with self.assertRaises(ValueError):
+            with pool:
+                pool.execute("INSERT INTO t VALUES (101)")
+                raise ValueError
+        pool.close()
+        # reconnects after close
+        self.assertEqual(self.count(pool), 101)
+        pool.close()
+
+    def test_shared(self):
+        pool = sqlitepool.shared(self.filename, readonly=True)
+        self.assertIs(sqlitepool.shared(self.filename, readonly=True), pool)
+        self.assertIsNot(sqlitepool.shared(self.filename), pool)
+        sqlitepool.release(self.filename)
+        self.assertIsNot(sqlitepool.shared(self.filename, readonly=True),
+                         pool)
+
+
+if __name__ == "__main__":
+    unittest.main()
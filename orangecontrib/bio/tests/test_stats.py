@@ -0,0 +1,87 @@
+import unittest
+
+import numpy
+
+from orangecontrib.bio.utils import stats
+
+
+class TestDistributions(unittest.TestCase):
+    def setUp(self):
+        rng = numpy.random.RandomState(42)
+        self.N = rng.randint(1, 500, 300)
+        self.m = (rng.rand(300) * (self.N + 1)).astype(int)
+        self.n = (rng.rand(300) * (self.N + 1)).astype(int)
+        self.k = (rng.rand(300) * (self.n + 3)).astype(int) - 1
+
+    def assertPValues(self, prob):
+        k, N, m, n = self.k, self.N, self.m, self.n
+        expected = [prob.p_value(int(k_), int(N_), int(m_), int(n_))
+                    for k_, N_, m_, n_ in zip(k, N, m, n)]
+        numpy.testing.assert_allclose(
+            prob.p_values(k, N, m, n), expected, rtol=1e-7, atol=1e-12)
+
+    def test_binomial(self):
+        prob = stats.Binomial()
+        self.assertPValues(prob)
+        numpy.testing.assert_allclose(
+            prob.p_values([0, 1, 5, 6], 10, [0, 10, 5, 5], 5),
+            [1.0, 1.0, 0.03125, 0.0])
+
+    def test_hypergeometric(self):
+        prob = stats.Hypergeometric()
+        self.assertPValues(prob)
+        self.assertAlmostEqual(float(prob.p_values(3, 100, 10, 5)),
+                               prob.p_value(3, 100, 10, 5))
+
+    def test_hypergeometric_out_of_support(self):
+        # no possible outcomes if more than N are drawn (or positive);
+        # this is not reported as an enrichment
+        prob = stats.Hypergeometric()
+        args = [(0, 5, 2, 6), (1, 5, 2, 6), (2, 5, 2, 8), (1, 5, 7, 3),
+                (0, 0, 1, 1)]
+        for k, N, m, n in args:
+            self.assertEqual(prob.p_value(k, N, m, n), 1.0)
+        k, N, m, n = numpy.array(args).T
+        numpy.testing.assert_array_equal(prob.p_values(k, N, m, n), 1.0)
+
+    def test_small_p_values(self):
+        prob = stats.Hypergeometric()
+        p = prob.p_values([60, 120], 20000, 400, 400)
+        self.assertTrue(numpy.all(p > 0))
+        self.assertLess(p[1], p[0])
+        self.assertEqual(prob.p_values([], [], [], []).shape, (0,))
+
+
+class TestCorrections(unittest.TestCase):
+    p_values = [0.01, 0.04, 0.03, 0.005]
+
+    def test_fdr(self):
+        fdr = stats.FDR(self.p_values)
+        self.assertIsInstance(fdr, list)
+        numpy.testing.assert_allclose(fdr, [0.02, 0.04, 0.04, 0.02])
+        numpy.testing.assert_allclose(
+            stats.FDR(self.p_values, m=8), [0.04, 0.08, 0.08, 0.04])
+        numpy.testing.assert_allclose(
+            stats.FDR(sorted(self.p_values), ordered=True),
+            [0.02, 0.02, 0.04, 0.04])
+        self.assertEqual(stats.FDR([]), [])
+
+        fdr = stats.FDR(numpy.array(self.p_values))
+        self.assertIsInstance(fdr, numpy.ndarray)
+
+    def test_dependent_fdr(self):
+        harmonic = 1 + 1 / 2. + 1 / 3. + 1 / 4.
+        numpy.testing.assert_allclose(
+            stats.BenjaminiYekutieli(self.p_values),
+            numpy.array([0.02, 0.04, 0.04, 0.02]) * harmonic)
+        self.assertAlmostEqual(stats._harmonic(2000000),
+                               numpy.sum(1.0 / numpy.arange(1, 2000001)))
+
+    def test_bonferroni(self):
+        numpy.testing.assert_allclose(
+            stats.Bonferroni(self.p_values), [0.04, 0.16, 0.12, 0.02])
+        numpy.testing.assert_allclose(stats.Bonferroni([0.5], m=3), [1.0])
+
+    def test_holm(self):
+        numpy.testing.assert_allclose(
+            stats.Holm(self.p_values), [0.03, 0.06, 0.06, 0.02])
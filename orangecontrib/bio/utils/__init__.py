@@ -3,6 +3,7 @@ import os
 
 from . import stats
 from . import expression
+from . import gseacore
 from . import group
 from . import environ
 
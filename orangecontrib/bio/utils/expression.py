@@ -31,6 +31,13 @@ class MA_pearsonCorrelation:
         a,c = data2.toNumpy("A/C")
         return numpy.corrcoef(c,a[:,0])[0,1]
 
+    def scores(self, X, y, class_var=None):
+        """
+        Return Pearson correlations of all columns of `X` with `y` at once
+        (see :func:`pearson_correlation`).
+        """
+        return pearson_correlation(X, y)
+
 class MA_signalToNoise:
     """
     Returns signal to noise measurement: difference of means of two classes
@@ -58,8 +65,8 @@ class MA_signalToNoise:
         cv = data.domain.class_var
         #print data.domain
 
-        if self.a == None: self.a = cv.values[0]
-        if self.b == None: self.b = cv.values[1]
+        a = cv.values[0] if self.a is None else self.a
+        b = cv.values[1] if self.b is None else self.b
 
         def stdev(l):
             return numpy.std(l, ddof=1)
@@ -76,8 +83,8 @@ class MA_signalToNoise:
         def avWCVal(value):
             return [ex[i].value for ex in data if ex[-1].value == value and not ex[i].isSpecial() ]
 
-        exa = avWCVal(self.a)
-        exb = avWCVal(self.b)
+        exa = avWCVal(a)
+        exb = avWCVal(b)
 
         try:
             rval = (mean(exa)-mean(exb))/(stdevm(exa)+stdevm(exb))
@@ -87,6 +94,15 @@ class MA_signalToNoise:
             #TODO rather throw exception? 
             return 0
 
+    def scores(self, X, y, class_var=None):
+        """
+        Return signal to noise of all columns of `X` at once (see
+        :func:`signal_to_noise`). If `class_var` is given, `a` and `b` are
+        its values, otherwise they are class indices.
+        """
+        a, b = _class_indices(class_var, self.a, self.b)
+        return signal_to_noise(X, y, a, b)
+
 class MA_t_test(object):
     def __init__(self, a=None, b=None, prob=False):
         self.a = a
@@ -101,14 +117,14 @@ class MA_t_test(object):
         data = Orange.data.Table(dom2, data)
         i = 0
 
-        if self.a == None: self.a = cv.values[0]
-        if self.b == None: self.b = cv.values[1]
+        a = cv.values[0] if self.a is None else self.a
+        b = cv.values[1] if self.b is None else self.b
 
         def avWCVal(value):
             return [ex[i].value for ex in data if ex[cv] == value and not ex[i].isSpecial() ]
 
-        exa = avWCVal(self.a)
-        exb = avWCVal(self.b)
+        exa = avWCVal(a)
+        exb = avWCVal(b)
 
         try:
             t, prob = scipy.stats.ttest_ind(exa, exb)
@@ -116,6 +132,15 @@ class MA_t_test(object):
         except:
             return 1.0 if self.prob else 0.0
 
+    def scores(self, X, y, class_var=None):
+        """
+        Return t statistics (or p-values) of all columns of `X` at once
+        (see :func:`t_test`).
+        """
+        a, b = _class_indices(class_var, self.a, self.b)
+        t, prob = t_test(X, y, a, b)
+        return prob if self.prob else t
+
 class MA_fold_change(object):
     def __init__(self, a=None, b=None):
         self.a = a
@@ -129,20 +154,28 @@ class MA_fold_change(object):
         data = Orange.data.Table(dom2, data)
         i = 0
 
-        if self.a == None: self.a = cv.values[0]
-        if self.b == None: self.b = cv.values[1]
+        a = cv.values[0] if self.a is None else self.a
+        b = cv.values[1] if self.b is None else self.b
 
         def avWCVal(value):
             return [ex[i].value for ex in data if ex[cv] == value and not ex[i].isSpecial() ]
 
-        exa = avWCVal(self.a)
-        exb = avWCVal(self.b)
+        exa = avWCVal(a)
+        exb = avWCVal(b)
 
         try:
             return mean(exa)/mean(exb)
         except:
             return 1
 
+    def scores(self, X, y, class_var=None):
+        """
+        Return fold changes of all columns of `X` at once (see
+        :func:`fold_change`).
+        """
+        a, b = _class_indices(class_var, self.a, self.b)
+        return fold_change(X, y, a, b)
+
 class MA_anova(object):
     def __init__(self, prob=False):
         self.prob = prob
@@ -166,6 +199,170 @@ class MA_anova(object):
         except:
             return 1.0 if self.prob else 0.0
 
+    def scores(self, X, y, class_var=None):
+        """
+        Return ANOVA F statistics (or p-values) of all columns of `X` at
+        once (see :func:`anova`).
+        """
+        n_classes = len(class_var.values) if class_var is not None else None
+        f, prob = anova(X, y, n_classes)
+        return prob if self.prob else f
+
+
+# Array versions of the measures. They score all columns (genes) of an
+# (n_samples x n_genes) array `X` (nan for missing values) against a class
+# vector `y` (class value indices) at once. `y` can also be a 2D array of
+# class vectors (for example class permutations), in which case a row of
+# scores is returned for each.
+
+def _class_indices(class_var, a, b):
+    a = 0 if a is None else a
+    b = 1 if b is None else b
+    if class_var is not None:
+        values = list(class_var.values)
+        a = values.index(a) if a in values else a
+        b = values.index(b) if b in values else b
+    return a, b
+
+
+def _as_arrays(X, y):
+    X = numpy.asarray(X, dtype=float)
+    y = numpy.asarray(y, dtype=float)
+    return X, numpy.atleast_2d(y), y.ndim == 1
+
+
+def _centered(X):
+    """
+    Return X with column means subtracted (and zeros for missing values),
+    the mask of known values and the column means.
+    """
+    valid = ~numpy.isnan(X)
+    counts = valid.sum(axis=0)
+    shift = numpy.where(valid, X, 0.0).sum(axis=0) / numpy.maximum(counts, 1)
+    return numpy.where(valid, X - shift, 0.0), valid.astype(float), shift
+
+
+def _class_stats(centered, Y, c):
+    """
+    Return the number of known values, their means and sums of squared
+    deviations from the mean in class `c` for all columns of a
+    :func:`_centered` array and for all class vectors (rows) of `Y`.
+    """
+    Xc, valid, shift = centered
+    A = (Y == c).astype(float)
+    n = A.dot(valid)
+    s = A.dot(Xc)
+    q = A.dot(Xc ** 2)
+    with numpy.errstate(divide="ignore", invalid="ignore"):
+        mean = s / n
+        ss = numpy.maximum(q - s * mean, 0.0)
+    return n, mean + shift, ss
+
+
+def _result(scores, single):
+    return scores[0] if single else scores
+
+
+def signal_to_noise(X, y, a=0, b=1):
+    """
+    Return signal to noise of all columns of `X` for classes `a` and `b`
+    (see :class:`MA_signalToNoise`).
+    """
+    X, Y, single = _as_arrays(X, y)
+    centered = _centered(X)
+    na, ma_, ssa = _class_stats(centered, Y, a)
+    nb, mb, ssb = _class_stats(centered, Y, b)
+
+    with numpy.errstate(divide="ignore", invalid="ignore"):
+        def stdevm(n, m, ss):
+            # minimally 0.2*|m|, where m=0 is adjusted to m=1
+            return numpy.maximum(numpy.sqrt(ss / (n - 1)),
+                                 0.2 * numpy.abs(numpy.where(m == 0, 1.0, m)))
+        s2n = (ma_ - mb) / (stdevm(na, ma_, ssa) + stdevm(nb, mb, ssb))
+    return _result(s2n, single)
+
+
+def t_test(X, y, a=0, b=1):
+    """
+    Return a (t statistics, p-values) tuple of two sample t-tests of all
+    columns of `X` for classes `a` and `b` (see :class:`MA_t_test`).
+    """
+    X, Y, single = _as_arrays(X, y)
+    centered = _centered(X)
+    na, ma_, ssa = _class_stats(centered, Y, a)
+    nb, mb, ssb = _class_stats(centered, Y, b)
+
+    df = na + nb - 2
+    with numpy.errstate(divide="ignore", invalid="ignore"):
+        svar = numpy.where(df > 0, (ssa + ssb) / df, numpy.nan)
+        t = (ma_ - mb) / numpy.sqrt(svar * (1.0 / na + 1.0 / nb))
+        prob = 2 * scipy.stats.t.sf(numpy.abs(t), df)
+    return _result(t, single), _result(prob, single)
+
+
+def fold_change(X, y, a=0, b=1):
+    """
+    Return the ratios of class means (`a` / `b`) of all columns of `X`
+    (1 where undefined, see :class:`MA_fold_change`).
+    """
+    X, Y, single = _as_arrays(X, y)
+    centered = _centered(X)
+    na, ma_, _ = _class_stats(centered, Y, a)
+    nb, mb, _ = _class_stats(centered, Y, b)
+
+    defined = (na > 0) & (nb > 0) & (mb != 0)
+    with numpy.errstate(divide="ignore", invalid="ignore"):
+        fc = numpy.where(defined, ma_ / mb, 1.0)
+    return _result(fc, single)
+
+
+def pearson_correlation(X, y):
+    """
+    Return Pearson correlations of all columns of `X` with `y` (see
+    :class:`MA_pearsonCorrelation`). Only samples with known values are
+    used.
+    """
+    X, Y, single = _as_arrays(X, y)
+    Xc, valid, _ = _centered(X)
+    known = (~numpy.isnan(Y)).astype(float)
+    Y0 = numpy.where(known > 0, Y, 0.0)
+
+    n = known.dot(valid)
+    sx, sxx = known.dot(Xc), known.dot(Xc ** 2)
+    sy, syy = Y0.dot(valid), (Y0 ** 2).dot(valid)
+    sxy = Y0.dot(Xc)
+    with numpy.errstate(divide="ignore", invalid="ignore"):
+        cov = sxy - sx * sy / n
+        r = cov / numpy.sqrt((sxx - sx ** 2 / n) * (syy - sy ** 2 / n))
+    return _result(r, single)
+
+
+def anova(X, y, n_classes=None):
+    """
+    Return a (F statistics, p-values) tuple of one-way ANOVA of all columns
+    of `X` (see :class:`MA_anova`). Classes without known values are
+    ignored; where fewer than two classes remain F is 0 and p-value 1.
+    """
+    X, Y, single = _as_arrays(X, y)
+    if n_classes is None:
+        n_classes = int(numpy.nanmax(Y)) + 1
+    centered = _centered(X)
+    stats = [_class_stats(centered, Y, c) for c in range(n_classes)]
+
+    n = sum(n_c for n_c, _, _ in stats)
+    k = sum((n_c > 0).astype(float) for n_c, _, _ in stats)
+    with numpy.errstate(divide="ignore", invalid="ignore"):
+        grand = sum(numpy.where(n_c > 0, n_c * m_c, 0.0)
+                    for n_c, m_c, _ in stats) / n
+        ssb = sum(numpy.where(n_c > 0, n_c * (m_c - grand) ** 2, 0.0)
+                  for n_c, m_c, _ in stats)
+        ssw = sum(numpy.where(n_c > 0, ss_c, 0.0) for n_c, _, ss_c in stats)
+        defined = (k >= 2) & (n > k)
+        f = numpy.where(defined, (ssb / (k - 1)) / (ssw / (n - k)), 0.0)
+        prob = numpy.where(defined, scipy.stats.f.sf(f, k - 1, n - k), 1.0)
+    return _result(f, single), _result(prob, single)
+
+
 import numpy as np
 import numpy.ma as ma
 
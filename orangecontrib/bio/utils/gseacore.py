@@ -0,0 +1,584 @@
+"""
+Numeric core of gene set enrichment analysis (see orangecontrib.bio.gsea):
+enrichment scores of ranked genes, their null distributions and
+significance. Works on plain sequences and arrays of gene correlations
+with the class, so it does not depend on Orange.
+"""
+from __future__ import absolute_import
+
+import random
+from functools import reduce
+
+import numpy
+import scipy.sparse
+
+
+def mean(l):
+    return float(sum(l))/len(l)
+
+def orderedPointersCorr(lcor):
+    """
+    Return a list of integers: indexes in original
+    lcor. Elements in the list are ordered by
+    their lcor[i] value. Higher correlations first.
+    """
+    ordered = [ (i,a) for i,a in enumerate(lcor) ] #original pos + correlation
+    ordered.sort(key=lambda x: -x[1]) #sort by correlation, descending
+    ordered = nth(ordered, 0) #contains positions in the original list
+    return ordered
+
+def enrichmentScoreRanked(subset, lcor, ordered, p=1.0, rev2=None):
+    """
+    Input data and subset. 
+    
+    subset: list of attribute indices of the input data belonging
+        to the same set.
+    lcor: correlations with class for each attribute in a list. 
+
+    Returns enrichment score on given data.
+
+    This implementation efficiently handles "sparse" genesets (that
+    cover only a small subset of all genes in the dataset).
+    """
+
+    #print lcor
+
+    subset = set(subset)
+
+    if rev2 is None:
+        def rev(l):
+            return numpy.argsort(l)
+        rev2 = rev(ordered)
+
+    #add if gene is not in the subset
+    notInA = -(1. / (len(lcor)-len(subset)))
+    #base for addition if gene is in the subset
+
+    cors = [ abs(lcor[i])**p for i in subset ] #belowe in numpy
+    sumcors = sum(cors)
+
+    #this should not happen
+    if sumcors == 0.0:
+        return (0.0, None)
+    
+    inAb = 1./sumcors
+
+    ess = [0.0]
+    
+    map = {}
+    for i in subset:
+        orderedpos = rev2[i]
+        map[orderedpos] = inAb*abs(lcor[i]**p)
+        
+    last = 0
+
+    maxSum = minSum = csum = 0.0
+
+    for a,b in sorted(map.items()):
+        diff = a-last
+        csum += notInA*diff
+        last = a+1
+        
+        if csum < minSum:
+            minSum = csum
+        
+        csum += b
+
+        if csum > maxSum:
+            maxSum = csum
+
+    #finish it
+    diff = (len(ordered))-last
+    csum += notInA*diff
+
+    if csum < minSum:
+        minSum = csum
+
+    #print "MY", (maxSum if abs(maxSum) > abs(minSum) else minSum)
+
+    """
+    #BY DEFINITION
+    print("subset", subset)
+
+    for i in ordered:
+        ess.append(ess[-1] + \
+            (inAb*abs(lcor[i]**p) if i in subset else notInA)
+        )
+        if i in subset:
+            print(ess[-2], ess[-1])
+            print(i, (inAb*abs(lcor[i]**p)))
+
+    maxEs = max(ess)
+    minEs = min(ess)
+    
+    print("REAL", (maxEs if abs(maxEs) > abs(minEs) else minEs, ess[1:]))
+
+    """
+    return (maxSum if abs(maxSum) > abs(minSum) else minSum, [])
+
+def geneSetMembership(subsets, ngenes):
+    """
+    Return a sparse (gene sets x genes) membership matrix (a
+    scipy.sparse.csr_matrix). The gene indices in each row are kept in the
+    iteration order of set(subset), which enrichmentScoreRanked uses for
+    summing the weights.
+    """
+    rows = [ list(set(subset)) for subset in subsets ]
+    indptr = numpy.cumsum([0] + [ len(row) for row in rows ])
+    indices = numpy.array([ i for row in rows for i in row ], dtype=int)
+    return scipy.sparse.csr_matrix(
+        (numpy.ones(len(indices), dtype=bool), indices, indptr),
+        shape=(len(rows), ngenes))
+
+def rankingPositions(rankings):
+    """
+    Return positions of genes in orderings by decreasing correlations
+    (the vectorized orderedPointersCorr followed by argsort) for each
+    row of a 2D array of correlations.
+    """
+    rankings = numpy.atleast_2d(rankings)
+    ordered = numpy.argsort(-rankings, axis=1, kind="mergesort")
+    positions = numpy.empty_like(ordered)
+    rows = numpy.arange(len(rankings))[:, numpy.newaxis]
+    positions[rows, ordered] = numpy.arange(rankings.shape[1])
+    return positions
+
+def enrichmentScoresRanked(membership, rankings, p=1.0, blockSize=2**20):
+    """
+    Vectorized enrichmentScoreRanked for many gene sets and rankings.
+
+    membership: a sparse gene set membership matrix (see
+        geneSetMembership).
+    rankings: a 2D array (n_rankings x n_genes) of correlations with the
+        class, for example the rankings of permutations.
+    blockSize: maximal number of elements of the intermediate arrays
+        (rankings are processed in blocks).
+
+    Returns an (n_rankings x n_gene_sets) array of enrichment scores,
+    identical to the ones of enrichmentScoreRanked.
+    """
+    rankings = numpy.atleast_2d(numpy.asarray(rankings, dtype=float))
+    nrank, ngenes = rankings.shape
+    positions = rankingPositions(rankings)
+    weights = numpy.abs(rankings) ** p
+    indptr, indices = membership.indptr, membership.indices
+
+    scores = numpy.zeros((nrank, len(indptr) - 1))
+    for si in range(len(indptr) - 1):
+        subset = indices[indptr[si]:indptr[si+1]]
+        k = len(subset)
+        if k == 0:
+            continue
+        notInA = -(1. / (ngenes - k))
+        step = max(1, blockSize // (2 * k + 1))
+
+        for start in range(0, nrank, step):
+            block = slice(start, start + step)
+            pos = positions[block, subset]
+            w = weights[block, subset]
+            # sum in the same (set iteration) order as enrichmentScoreRanked
+            sumcors = numpy.cumsum(w, axis=1)[:, -1]
+            valid = sumcors != 0.0
+            inAb = 1. / numpy.where(valid, sumcors, 1.0)
+
+            order = numpy.argsort(pos, axis=1)
+            rows = numpy.arange(len(pos))[:, numpy.newaxis]
+            pos = pos[rows, order]
+            w = w[rows, order]
+
+            # The running sum interleaves the steps for missed genes
+            # before each hit with the hits (the same sequence of
+            # additions as enrichmentScoreRanked).
+            misses = numpy.diff(pos, axis=1, prepend=-1) - 1
+            steps = numpy.empty((len(pos), 2 * k + 1))
+            steps[:, 0:-1:2] = notInA * misses
+            steps[:, 1::2] = inAb[:, numpy.newaxis] * w
+            steps[:, -1] = notInA * (ngenes - 1 - pos[:, -1])
+            csum = numpy.cumsum(steps, axis=1)
+
+            maxSum = numpy.maximum(csum[:, 1::2].max(axis=1), 0.0)
+            minSum = numpy.minimum(csum[:, 0::2].min(axis=1), 0.0)
+            es = numpy.where(numpy.abs(maxSum) > numpy.abs(minSum),
+                             maxSum, minSum)
+            scores[block, si] = numpy.where(valid, es, 0.0)
+
+    return scores
+
+def shuffleList(l, rand=random.Random(0)):
+    """
+    Returns a copy of a shuffled input list.
+    """
+    import copy
+    l2 = copy.copy(l)
+    rand.shuffle(l2)
+    return l2
+
+def gseapval(es, esnull):
+    """
+    From article (PNAS):
+    estimate nominal p-value for S from esnull by using the positive
+    or negative portion of the distribution corresponding to the sign 
+    of the observed ES(S).
+    """
+    
+    try:
+        if es < 0:
+            return float(len([ a for a in esnull if a <= es ]))/ \
+                len([ a for a in esnull if a < 0])    
+        else: 
+            return float(len([ a for a in esnull if a >= es ]))/ \
+                len([ a for a in esnull if a >= 0])
+    except:
+        return 1.0
+
+def runOptCallbacks(callback):
+    if callback is not None:
+        try:
+            [ a() for a in callback ]
+        except:
+            callback()            
+
+def gseaR(rankings, subsets, n, callback=None, engine="python", n_jobs=1):
+    """
+    """
+    if n_jobs > 1 and n > 1:
+        return gseaParallel(rankings, subsets, n=n, n_jobs=n_jobs,
+            engine=engine, callback=callback)
+
+    if engine == "vectorized":
+        return gseaVectorized(rankings, subsets, n=n, callback=callback)
+
+    enrichmentScores = []
+    ordered = orderedPointersCorr(rankings)
+    
+    def rev(l):
+        return numpy.argsort(l)
+
+    rev2 = rev(ordered)
+
+    for subset in subsets:
+
+        es = enrichmentScoreRanked(subset, rankings, ordered, rev2=rev2)[0]
+        enrichmentScores.append(es)
+    
+    runOptCallbacks(callback)
+
+    enrichmentNulls = [ [] for a in range(len(subsets)) ]
+
+    for i in range(n):
+        
+        r2 = shuffleList(rankings, random.Random(2000+i))
+        ordered2 = orderedPointersCorr(r2)
+        rev22 = rev(ordered2)
+
+        for si,subset in enumerate(subsets):
+
+            esn = enrichmentScoreRanked(subset, r2, ordered2, rev2=rev22)[0]
+            enrichmentNulls[si].append(esn)
+
+        runOptCallbacks(callback)
+
+    return gseaSignificance(enrichmentScores, enrichmentNulls)
+
+def permutationMatrix(ngenes, n):
+    """
+    Return an (n x ngenes) array of the gene permutations used by
+    gseaE and gseaR (with seeds 2000+i).
+    """
+    perms = numpy.empty((n, ngenes), dtype=int)
+    for i in range(n):
+        perms[i] = shuffleList(list(range(ngenes)), random.Random(2000+i))
+    return perms
+
+def gseaVectorized(lcor, subsets, n=100, classRankings=None,
+        callback=None):
+    """
+    GSEA with the enrichment scores of all permutations computed at
+    once (see enrichmentScoresRanked). Gives the same results as gseaE
+    and gseaR.
+
+    lcor: correlations with class for each gene.
+    classRankings: a function returning the correlations for the i-th
+        class permutation or an (n x ngenes) array of correlations of all
+        class permutations. If None, genes are permuted (the permutations
+        are an (n x ngenes) index array).
+    """
+    lcor = numpy.asarray(lcor, dtype=float)
+    membership = geneSetMembership(subsets, len(lcor))
+
+    enrichmentScores = \
+        enrichmentScoresRanked(membership, lcor[numpy.newaxis, :])[0]
+    runOptCallbacks(callback)
+
+    if callable(classRankings):
+        rankings = numpy.empty((n, len(lcor)))
+        for i in range(n):
+            rankings[i] = classRankings(i)
+            runOptCallbacks(callback)
+    elif classRankings is not None:
+        rankings = numpy.asarray(classRankings, dtype=float)
+    else:
+        rankings = lcor[permutationMatrix(len(lcor), n)]
+
+    nulls = enrichmentScoresRanked(membership, rankings)
+
+    if not callable(classRankings):
+        for i in range(n):
+            runOptCallbacks(callback)
+
+    return gseaSignificance(list(enrichmentScores), nulls.T.tolist())
+
+def permutationNulls(subsets, lcor, permutations, classRankings=None,
+        engine="python"):
+    """
+    Return enrichment scores of `permutations` (permutation indices,
+    permutation i is seeded with 2000+i) as a partial null distribution:
+    a list with a list of scores for each gene set.
+
+    classRankings: a function returning the correlations for the i-th
+        class permutation. If None, genes are permuted.
+    """
+    permutations = list(permutations)
+    if classRankings is not None:
+        rankings = [ classRankings(i) for i in permutations ]
+    else:
+        rankings = [ shuffleList(lcor, random.Random(2000+i))
+                     for i in permutations ]
+
+    if engine == "vectorized":
+        membership = geneSetMembership(subsets, len(lcor))
+        nulls = enrichmentScoresRanked(membership, numpy.array(rankings))
+        return nulls.T.tolist()
+
+    enrichmentNulls = [ [] for a in range(len(subsets)) ]
+    for r2 in rankings:
+        ordered2 = orderedPointersCorr(r2)
+        rev22 = numpy.argsort(ordered2)
+        for si,subset in enumerate(subsets):
+            esn = enrichmentScoreRanked(subset, r2, ordered2, rev2=rev22)[0]
+            enrichmentNulls[si].append(esn)
+    return enrichmentNulls
+
+
+_permutationWorker = None
+
+def _initPermutationWorker(subsets, lcor, classRankings, engine):
+    global _permutationWorker
+    _permutationWorker = (subsets, lcor, classRankings, engine)
+
+def _permutationNullsWorker(permutations):
+    subsets, lcor, classRankings, engine = _permutationWorker
+    return permutationNulls(subsets, lcor, permutations,
+        classRankings=classRankings, engine=engine)
+
+def gseaParallel(lcor, subsets, n=100, n_jobs=2, classRankings=None,
+        engine="python", callback=None, chunkSize=None):
+    """
+    GSEA with permutations computed in a pool of n_jobs worker processes.
+    Gives the same results as gseaR (and gseaE), because each
+    permutation i is seeded with 2000+i regardless of the worker
+    computing it.
+
+    lcor: correlations with class for each gene.
+    classRankings: a picklable function returning the correlations for
+        the i-th class permutation (called in the workers). If None,
+        genes are permuted.
+    chunkSize: number of permutations in a task (by default the
+        permutations are split in about 4 tasks per worker).
+    """
+    import multiprocessing
+
+    if engine == "vectorized":
+        membership = geneSetMembership(subsets, len(lcor))
+        enrichmentScores = list(enrichmentScoresRanked(
+            membership, numpy.array(lcor, dtype=float)[numpy.newaxis, :])[0])
+    else:
+        ordered = orderedPointersCorr(lcor)
+        rev2 = numpy.argsort(ordered)
+        enrichmentScores = [
+            enrichmentScoreRanked(subset, lcor, ordered, rev2=rev2)[0]
+            for subset in subsets ]
+    runOptCallbacks(callback)
+
+    if chunkSize is None:
+        chunkSize = max(1, int(numpy.ceil(float(n) / (4 * n_jobs))))
+    chunks = [ range(i, min(i + chunkSize, n))
+               for i in range(0, n, chunkSize) ]
+
+    pool = multiprocessing.Pool(min(n_jobs, len(chunks)),
+        initializer=_initPermutationWorker,
+        initargs=(subsets, lcor, classRankings, engine))
+    try:
+        partialNulls = []
+        for chunk, nulls in zip(chunks,
+                pool.imap(_permutationNullsWorker, chunks)):
+            partialNulls.append(nulls)
+            for i in chunk:
+                runOptCallbacks(callback)
+    finally:
+        pool.terminate()
+
+    return gseaSignificance(enrichmentScores, partialNulls, partial=True)
+
+def gseaSignificance(enrichmentScores, enrichmentNulls, partial=False):
+    """
+    If partial, enrichmentNulls is a list of partial null distributions
+    (for consecutive ranges of permutations, as returned by
+    permutationNulls), which are merged first.
+    """
+
+    if partial:
+        merged = [ [] for a in range(len(enrichmentScores)) ]
+        for nulls in enrichmentNulls:
+            for si, esn in enumerate(nulls):
+                merged[si].extend(esn)
+        enrichmentNulls = merged
+
+    #print enrichmentScores
+
+    import time
+
+    tb1 = time.time()
+
+    enrichmentPVals = []
+    nEnrichmentScores = []
+    nEnrichmentNulls = []
+
+    for i in range(len(enrichmentScores)):
+        es = enrichmentScores[i]
+        enrNull = enrichmentNulls[i]
+        #print es, enrNull
+
+        enrichmentPVals.append(gseapval(es, enrNull))
+
+        #normalize the ES(S,pi) and the observed ES(S), separetely rescaling
+        #the positive and negative scores by divident by the mean of the 
+        #ES(S,pi)
+
+        #print es, enrNull
+
+        def normalize(s):
+            try:
+                if s == 0:
+                    return 0.0
+                if s >= 0:
+                    meanPos = mean([a for a in enrNull if a >= 0])
+                    #print s, meanPos
+                    return s/meanPos
+                else:
+                    meanNeg = mean([a for a in enrNull if a < 0])
+                    #print s, meanNeg
+                    return -s/meanNeg
+            except:
+                return 0.0 #return if according mean value is uncalculable
+
+
+        nes = normalize(es)
+        nEnrichmentScores.append(nes)
+        
+        nenrNull = [ normalize(s) for s in enrNull ]
+        nEnrichmentNulls.append(nenrNull)
+ 
+
+    #print "First part", time.time() - tb1
+
+    #FDR computation
+    #create a histogram of all NES(S,pi) over all S and pi
+    vals = reduce(lambda x,y: x+y, nEnrichmentNulls, [])
+
+
+    def shorten(l, p=10000):
+        """
+        Take each len(l)/p element, if len(l)/p >= 2.
+        """
+        e = len(l)/p
+        if e <= 1:
+            return l
+        else:
+            return [ l[i] for i in xrange(0, len(l), e) ]
+
+    #vals = shorten(vals) -> this can speed up second part. is it relevant TODO?
+
+    """
+    Use this null distribution to compute an FDR q value, for a given NES(S) =
+    NES* >= 0. The FDR is the ratio of the percantage of all (S,pi) with
+    NES(S,pi) >= 0, whose NES(S,pi) >= NES*, divided by the percentage of
+    observed S wih NES(S) >= 0, whose NES(S) >= NES*, and similarly if NES(S)
+    = NES* <= 0.
+    """
+
+    nvals = numpy.array(sorted(vals))
+    nnes = numpy.array(sorted(nEnrichmentScores))
+
+    #print "LEN VALS", len(vals), len(nEnrichmentScores)
+
+    fdrs = []
+
+    import operator
+
+    for i in range(len(enrichmentScores)):
+
+        nes = nEnrichmentScores[i]
+
+        """
+        #Strighfoward but slow implementation follows in comments.
+        #Useful as code description.
+        
+        if nes >= 0:
+            op0 = operator.ge
+            opn = operator.ge
+        else:
+            op0 = operator.lt
+            opn = operator.le
+
+        allPos = [a for a in vals if op0(a,0)]
+        allHigherAndPos = [a for a in allPos if opn(a,nes) ]
+
+        nesPos = [a for a in nEnrichmentScores if op0(a,0) ]
+        nesHigherAndPos = [a for a in nesPos if opn(a,nes) ]
+
+        top = len(allHigherAndPos)/float(len(allPos)) #p value
+        down = len(nesHigherAndPos)/float(len(nesPos))
+        
+        l1 = [ len(allPos), len(allHigherAndPos), len(nesPos), len(nesHigherAndPos)]
+
+        allPos = allHigherAndPos = nesPos =  nesHigherAndPos = 1
+
+        """
+
+        #this could be speed up twice with the same accuracy! 
+        if nes >= 0:
+            allPos = int(len(vals) - numpy.searchsorted(nvals, 0, side="left"))
+            allHigherAndPos = int(len(vals) - numpy.searchsorted(nvals, nes, side="left"))
+            nesPos = len(nnes) - int(numpy.searchsorted(nnes, 0, side="left"))
+            nesHigherAndPos = len(nnes) - int(numpy.searchsorted(nnes, nes, side="left"))
+        else:
+            allPos = int(numpy.searchsorted(nvals, 0, side="left"))
+            allHigherAndPos = int(numpy.searchsorted(nvals, nes, side="right"))
+            nesPos = int(numpy.searchsorted(nnes, 0, side="left"))
+            nesHigherAndPos = int(numpy.searchsorted(nnes, nes, side="right"))
+           
+        """
+        #Comparing results
+        l2 = [ allPos, allHigherAndPos, nesPos, nesHigherAndPos ]
+        diffs = [ l1[i]-l2[i] for i in range(len(l1)) ]
+        sumd = sum( [ abs(a) for a in diffs ] )
+        if sumd > 0:
+            print(nes > 0)
+            print("orig", l1)
+            print("modi", l2)
+        """
+
+        try:
+            top = allHigherAndPos/float(allPos) #p value
+            down = nesHigherAndPos/float(nesPos)
+
+            fdrs.append(top/down)
+        except:
+            fdrs.append(1000000000.0)
+    
+    #print "Whole part", time.time() - tb1
+
+    return zip(enrichmentScores, nEnrichmentScores, enrichmentPVals, fdrs)
+
+def nth(l,n): return [ a[n] for a in l ]
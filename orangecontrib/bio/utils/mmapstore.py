@@ -0,0 +1,256 @@
+"""
+A simple versioned on-disk format for a set of NumPy arrays.
+
+The file starts with a magic string, the length of a JSON header and the
+header itself (format version, user metadata and the array layout),
+followed by the array data (each aligned to 64 bytes). :func:`read`
+memory-maps the file, so opening it is O(1) regardless of its size.
+
+"""
+from __future__ import absolute_import
+
+import os
+import io
+import sys
+import json
+import mmap
+import struct
+import tempfile
+
+import numpy
+
+MAGIC = b"OBIMMAP\x01"
+
+_ALIGN = 64
+_LENGTH = struct.Struct("<Q")
+
+
+class FormatError(ValueError):
+    """The file is not in the expected format (or version)."""
+
+
+def write(path, arrays, meta=None, version=0):
+    """
+    Write `arrays` (a dict of name: ndarray) and `meta` (a JSON
+    serializable dict) to `path`.
+
+    The file is first written to a temporary file in the same directory
+    and then renamed, so concurrent readers never see a partial file.
+
+    """
+    arrays = dict((name, numpy.ascontiguousarray(array))
+                  for name, array in arrays.items())
+    layout = {}
+    offset = 0
+    for name in sorted(arrays):
+        array = arrays[name]
+        offset = _aligned(offset)
+        layout[name] = {"dtype": array.dtype.str,
+                        "shape": list(array.shape),
+                        "offset": offset}
+        offset += array.nbytes
+
+    header = json.dumps({"version": version,
+                         "meta": meta or {},
+                         "arrays": layout}).encode("utf-8")
+    data_start = _aligned(len(MAGIC) + _LENGTH.size + len(header))
+
+    dirname = os.path.dirname(os.path.abspath(path))
+    fd, tmppath = tempfile.mkstemp(
+        prefix=os.path.basename(path) + ".", suffix=".tmp", dir=dirname)
+    try:
+        with io.open(fd, "wb") as f:
+            f.write(MAGIC)
+            f.write(_LENGTH.pack(len(header)))
+            f.write(header)
+            for name in sorted(arrays):
+                _pad_to(f, data_start + layout[name]["offset"])
+                f.write(arrays[name].tobytes())
+        _replace(tmppath, path)
+    except BaseException:
+        if os.path.exists(tmppath):
+            os.remove(tmppath)
+        raise
+
+
+def read(path, version=None):
+    """
+    Read (memory-map) a file written by :func:`write`. Return a
+    (meta, arrays) tuple. The arrays are read-only views into the mapped
+    file.
+
+    Raise :class:`FormatError` if the file is not in the right format or
+    its version does not match `version` (if given).
+
+    """
+    with open(path, "rb") as f:
+        magic = f.read(len(MAGIC))
+        if magic != MAGIC:
+            raise FormatError("%r is not a mmapstore file" % path)
+        length, = _LENGTH.unpack(f.read(_LENGTH.size))
+        header = json.loads(f.read(length).decode("utf-8"))
+        if version is not None and header["version"] != version:
+            raise FormatError("%r has version %r (expected %r)" %
+                              (path, header["version"], version))
+        data_start = _aligned(len(MAGIC) + _LENGTH.size + length)
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    arrays = {}
+    for name, spec in header["arrays"].items():
+        dtype = numpy.dtype(str(spec["dtype"]))
+        shape = tuple(spec["shape"])
+        count = int(numpy.prod(shape)) if shape else 1
+        if count == 0:
+            arrays[name] = numpy.zeros(shape, dtype=dtype)
+            continue
+        array = numpy.frombuffer(buffer, dtype=dtype, count=count,
+                                 offset=data_start + spec["offset"])
+        arrays[name] = array.reshape(shape)
+    return header["meta"], arrays
+
+
+def is_store(path):
+    """Is `path` a file written by :func:`write`."""
+    try:
+        with open(path, "rb") as f:
+            return f.read(len(MAGIC)) == MAGIC
+    except (IOError, OSError):
+        return False
+
+
+def pack_strings(strings):
+    """
+    Pack a sequence of strings into a (utf-8 bytes blob, offsets) pair of
+    arrays (see :class:`StringTable`).
+    """
+    encoded = [s.encode("utf-8") for s in strings]
+    offsets = numpy.zeros(len(encoded) + 1, dtype=numpy.int64)
+    offsets[1:] = numpy.cumsum([len(s) for s in encoded])
+    blob = numpy.frombuffer(b"".join(encoded), dtype=numpy.uint8)
+    return blob, offsets
+
+
+class StringTable(object):
+    """
+    A read-only sequence of strings stored as a utf-8 blob and offsets
+    (as returned by :func:`pack_strings`). Strings are decoded on access.
+    """
+    def __init__(self, blob, offsets):
+        self.blob = blob
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        start, end = self.offsets[index], self.offsets[index + 1]
+        return self.blob[start:end].tobytes().decode("utf-8")
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+
+def sorted_keys(strings):
+    """
+    Return a sorted fixed width bytes array of (unique) `strings` suitable
+    for :func:`key_index` lookups, and an index array mapping the position
+    in the sorted array to the position in `strings`.
+    """
+    encoded = numpy.array([s.encode("utf-8") for s in strings],
+                          dtype=bytes)
+    if not len(encoded):
+        encoded = numpy.array([], dtype="S1")
+    order = numpy.argsort(encoded, kind="mergesort")
+    return encoded[order], order
+
+
+def key_index(keys, key):
+    """
+    Return the position of `key` (a string) in a sorted keys array (as
+    returned by :func:`sorted_keys`) or -1 if not present.
+    """
+    key = key.encode("utf-8")
+    if len(key) > keys.dtype.itemsize:
+        return -1
+    i = int(numpy.searchsorted(keys, key))
+    if i < len(keys) and keys[i] == key:
+        return i
+    else:
+        return -1
+
+
+def key_indices(keys, strings):
+    """
+    Vectorized :func:`key_index`. Return an int64 array with positions of
+    `strings` in a sorted keys array (-1 for strings not present).
+    """
+    encoded = [s.encode("utf-8") for s in strings]
+    result = numpy.full(len(encoded), -1, dtype=numpy.int64)
+    if not len(keys) or not encoded:
+        return result
+    # strings longer than the key width would be truncated (and could
+    # match a prefix)
+    fits = numpy.array([len(s) <= keys.dtype.itemsize for s in encoded],
+                       dtype=bool)
+    encoded = numpy.array(encoded, dtype=keys.dtype)
+    pos = numpy.minimum(numpy.searchsorted(keys, encoded), len(keys) - 1)
+    found = fits & (keys[pos] == encoded)
+    result[found] = pos[found]
+    return result
+
+
+def file_stamp(filename):
+    """
+    Return a [size, mtime] stamp identifying the contents of a file (to
+    store in the metadata of a store derived from it).
+    """
+    stat = os.stat(filename)
+    return [stat.st_size, stat.st_mtime]
+
+
+def csr(rows, columns, nrows, *values):
+    """
+    Sort the (`rows`, `columns`, `*values`) coordinate arrays by row and
+    column and return the CSR row pointers, column indices and values.
+    """
+    order = numpy.lexsort((columns, rows))
+    indptr = numpy.zeros(nrows + 1, dtype=numpy.int64)
+    indptr[1:] = numpy.cumsum(numpy.bincount(rows, minlength=nrows))
+    return (indptr, columns[order]) + tuple(v[order] for v in values)
+
+
+def gather(indptr, rows):
+    """
+    Return the positions of all entries of `rows` in a CSR structure
+    with row pointers `indptr`.
+    """
+    rows = numpy.asarray(rows, dtype=numpy.int64)
+    starts = indptr[rows]
+    lengths = indptr[rows + 1] - starts
+    shift = numpy.cumsum(lengths) - lengths
+    return (numpy.repeat(starts - shift, lengths) +
+            numpy.arange(lengths.sum(), dtype=numpy.int64))
+
+
+def _aligned(offset):
+    return (offset + _ALIGN - 1) // _ALIGN * _ALIGN
+
+
+def _pad_to(f, position):
+    current = f.tell()
+    if position > current:
+        f.write(b"\0" * (position - current))
+
+
+if sys.version_info >= (3, 3):
+    _replace = os.replace
+else:
+    def _replace(src, dst):
+        if sys.platform == "win32" and os.path.exists(dst):
+            os.remove(dst)
+        os.rename(src, dst)
@@ -0,0 +1,182 @@
+"""
+Per-thread sqlite3 connections to a database file.
+
+A `sqlite3.Connection` can only be used from the thread that created it.
+:class:`ConnectionPool` opens one connection per thread on first use and
+can be used in place of a connection (it has the same `execute`,
+`executemany`, `executescript`, `commit` ... methods and works as a
+transaction context manager), so a database object can be safely shared
+between threads.
+
+Read-only pools open the database with ``mode=ro&immutable=1`` (no
+locking or change detection) and enable memory-mapped I/O. These are
+meant for the downloaded (serverfiles) databases that are never modified
+while in use.
+
+Use :func:`shared` to get a process wide pool for a database file.
+
+"""
+from __future__ import absolute_import
+
+import os
+import sqlite3
+import weakref
+import threading
+
+try:
+    from urllib import pathname2url
+except ImportError:
+    from urllib.request import pathname2url
+
+#: Default memory-mapped I/O size (in bytes) for read-only pools.
+MMAP_SIZE = 2 ** 28
+
+
+def readonly_uri(filename):
+    """
+    Return a sqlite URI for an immutable read-only access to `filename`.
+    """
+    path = pathname2url(os.path.abspath(filename))
+    return "file:{}?mode=ro&immutable=1".format(path)
+
+
+def _finished(thread):
+    # dereference the (weakref to a) thread only once, it can be
+    # collected at any time
+    thread = thread()
+    return thread is None or not thread.is_alive()
+
+
+class ConnectionPool(object):
+    """
+    A pool of per-thread connections to the sqlite database `filename`.
+
+    :param bool readonly: Open the database in read-only immutable mode.
+    :param int mmap_size:
+        Memory-mapped I/O size (by default `MMAP_SIZE` for read-only
+        pools and disabled otherwise).
+    :param float timeout: Database lock timeout.
+    :param init: A function called with every new connection.
+
+    """
+    def __init__(self, filename, readonly=False, mmap_size=None,
+                 timeout=5.0, init=None):
+        if mmap_size is None:
+            mmap_size = MMAP_SIZE if readonly else 0
+        self.filename = filename
+        self.readonly = readonly
+        self.mmap_size = mmap_size
+        self.timeout = timeout
+        self.init = init
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        # (weakref to the owner thread, connection) pairs
+        self._connections = []
+        self._generation = 0
+
+    def _connect(self):
+        con = None
+        if self.readonly:
+            try:
+                con = sqlite3.connect(
+                    readonly_uri(self.filename), timeout=self.timeout,
+                    check_same_thread=False, uri=True)
+            except TypeError:
+                # No uri support (Python 2)
+                pass
+        if con is None:
+            con = sqlite3.connect(self.filename, timeout=self.timeout,
+                                  check_same_thread=False)
+        if self.mmap_size:
+            con.execute("PRAGMA mmap_size={:d}".format(self.mmap_size))
+        if self.init is not None:
+            self.init(con)
+        return con
+
+    def connection(self):
+        """
+        Return the connection for the current thread (connect if needed).
+        """
+        generation, con = getattr(self._local, "connection", (None, None))
+        if con is None or generation != self._generation:
+            con = self._connect()
+            with self._lock:
+                # Close the connections of finished threads
+                finished = [c for thread, c in self._connections
+                            if _finished(thread)]
+                self._connections = [
+                    (thread, c) for thread, c in self._connections
+                    if c not in finished]
+                self._connections.append(
+                    (weakref.ref(threading.current_thread()), con))
+                self._local.connection = (self._generation, con)
+            for c in finished:
+                c.close()
+        return con
+
+    def execute(self, *args):
+        return self.connection().execute(*args)
+
+    def executemany(self, *args):
+        return self.connection().executemany(*args)
+
+    def executescript(self, *args):
+        return self.connection().executescript(*args)
+
+    def cursor(self):
+        return self.connection().cursor()
+
+    def commit(self):
+        self.connection().commit()
+
+    def rollback(self):
+        self.connection().rollback()
+
+    def __enter__(self):
+        return self.connection().__enter__()
+
+    def __exit__(self, *args):
+        return self.connection().__exit__(*args)
+
+    def close(self):
+        """
+        Close all open connections. The pool can still be used (threads
+        reconnect on next use), but any query in progress in another
+        thread will fail.
+        """
+        with self._lock:
+            connections, self._connections = self._connections, []
+            self._generation += 1
+        for _, con in connections:
+            con.close()
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def shared(filename, readonly=False, **kwargs):
+    """
+    Return a (process wide) shared :class:`ConnectionPool` for `filename`
+    (all arguments are passed to the :class:`ConnectionPool`).
+    """
+    key = (os.path.abspath(filename), readonly, tuple(sorted(kwargs.items())))
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = ConnectionPool(
+                filename, readonly=readonly, **kwargs)
+    return pool
+
+
+def release(filename):
+    """
+    Close and forget all shared pools for `filename` (e.g. before the
+    file is removed or replaced).
+    """
+    path = os.path.abspath(filename)
+    with _pools_lock:
+        keys = [key for key in _pools if key[0] == path]
+        pools = [_pools.pop(key) for key in keys]
+    for pool in pools:
+        pool.close()
@@ -2,6 +2,9 @@ import math
 import threading
 import six
 
+import numpy
+from scipy.special import gammaln, xlogy, xlog1py
+
 
 def _lngamma(z):
     x = 0
@@ -20,8 +23,8 @@ def _lngamma(z):
 
 class LogBin(object):
     _max = 2
-    _lookup = [0.0, 0.0]
-    _max_factorial = 1
+    #: log(i!) for i in range(_max)
+    _lookup = numpy.zeros(2)
     _lock = threading.Lock()
 
     def __init__(self, max=1000):
@@ -29,31 +32,102 @@ class LogBin(object):
 
     @staticmethod
     def _extend(max):
+        if max <= LogBin._max:
+            return
         with LogBin._lock:
             if max <= LogBin._max:
                 return
-            for i in range(LogBin._max, max):
-                if i > 1000: ## an arbitrary cuttof
-                    LogBin._lookup.append(LogBin._logfactorial(i))
-                else:
-                    LogBin._max_factorial *= i
-                    LogBin._lookup.append(math.log(LogBin._max_factorial))
+            # grow geometrically, so repeated extensions stay cheap
+            max = int(numpy.maximum(max, 2 * LogBin._max))
+            # swap in a complete table; readers see either the old or the
+            # new one
+            LogBin._lookup = gammaln(numpy.arange(max, dtype=float) + 1)
             LogBin._max = max
 
     def _logbin(self, n, k):
         if n >= self._max:
             self._extend(n + 100)
         if k < n and k >= 0:
-            return self._lookup[n] - self._lookup[n - k] - self._lookup[k]
+            lookup = self._lookup
+            return float(lookup[n] - lookup[n - k] - lookup[k])
         else:
             return 0.0
 
+    def _logbin_array(self, n, k):
+        """Vectorized log binomial coefficient (`n` and `k` must be valid,
+        i.e. `0 <= k <= n`)."""
+        lookup = self._lookup
+        return lookup[n] - lookup[n - k] - lookup[k]
+
     @staticmethod
     def _logfactorial(n):
         if (n <= 1):
             return 0.0
         else:
-            return _lngamma(n + 1)
+            return float(gammaln(n + 1))
+
+    def _support(self, N, m, n):
+        """Return the (low, high) bounds of the distribution support."""
+        raise NotImplementedError
+
+    def _log_pmf(self, i, N, m, n):
+        """Vectorized log probability of `i` positive out of `n`."""
+        raise NotImplementedError
+
+    def _log_sum_range(self, start, stop, N, m, n):
+        """Return log(sum(pmf(i) for i in range(start, stop + 1))) for
+        each element using log-sum-exp (an empty range gives -inf)."""
+        out = numpy.full(len(start), -numpy.inf)
+        lengths = stop - start + 1
+        nonempty = numpy.flatnonzero(lengths > 0)
+        if not len(nonempty):
+            return out
+        lengths = lengths[nonempty]
+        offsets = numpy.cumsum(lengths) - lengths
+        segment = numpy.repeat(numpy.arange(len(nonempty)), lengths)
+        i = (start[nonempty][segment] +
+             numpy.arange(lengths.sum()) - offsets[segment])
+        index = nonempty[segment]
+        logp = self._log_pmf(i, N[index], m[index], n[index])
+
+        logmax = numpy.maximum.reduceat(logp, offsets)
+        logmax[~numpy.isfinite(logmax)] = 0.0
+        with numpy.errstate(divide="ignore"):
+            out[nonempty] = logmax + numpy.log(
+                numpy.add.reduceat(numpy.exp(logp - logmax[segment]), offsets))
+        return out
+
+    def p_values(self, k, N, m, n):
+        """ Vectorized :func:`p_value`. The arguments are arrays (or
+        scalars) which are broadcast against each other. Return an array
+        of probabilities that `k` or more tests are positive.
+        """
+        k, N, m, n = numpy.broadcast_arrays(
+            *[numpy.asarray(a, dtype=numpy.int64) for a in (k, N, m, n)])
+        shape = k.shape
+        k, N, m, n = k.ravel(), N.ravel(), m.ravel(), n.ravel()
+        if not k.size:
+            return numpy.zeros(shape)
+        self._extend(int(max(N.max(), n.max())) + 1)
+
+        low, high = self._support(N, m, n)
+        k = numpy.clip(k, low, high + 1)
+        p = numpy.empty(len(k))
+        # sum the shorter tail (as in p_value)
+        upper = high - k + 1 <= k - low
+        p[upper] = numpy.exp(self._log_sum_range(
+            k[upper], high[upper], N[upper], m[upper], n[upper]))
+        lower = ~upper
+        p[lower] = 1.0 - numpy.exp(self._log_sum_range(
+            low[lower], k[lower] - 1, N[lower], m[lower], n[lower]))
+        # small values are inexact due to the subtraction; sum the upper
+        # tail instead
+        inexact = lower & (p < 1e-3)
+        p[inexact] = numpy.exp(self._log_sum_range(
+            k[inexact], high[inexact], N[inexact], m[inexact], n[inexact]))
+        # no possible outcomes (see Hypergeometric.p_value)
+        p[low > high] = 1.0
+        return numpy.clip(p, 0.0, 1.0).reshape(shape)
 
 class Binomial(LogBin):
     """ `Binomial distribution 
@@ -102,6 +176,14 @@ class Binomial(LogBin):
             else:
                 return value
 
+    def _support(self, N, m, n):
+        return numpy.zeros_like(n), n
+
+    def _log_pmf(self, i, N, m, n):
+        p = m / N.astype(float)
+        return (self._logbin_array(n, i) + xlogy(i, p) +
+                xlog1py(n - i, -p))
+
 class Hypergeometric(LogBin):
     """ `Hypergeometric distribution
     <http://en.wikipedia.org/wiki/Hypergeometric_distribution>`_ is
@@ -129,6 +211,10 @@ class Hypergeometric(LogBin):
         """ 
         The probability that k or more tests are positive.
         """
+        if max(0, n + m - N) > min(n, m):
+            # no possible outcomes (n or m larger than N); report no
+            # enrichment
+            return 1.0
 
         if min(n,m) - k + 1 <= k:
             #starting from k gives the shorter list of values
@@ -144,68 +230,115 @@ class Hypergeometric(LogBin):
             else:
                 return value
 
-## to speed-up FDR, calculate ahead sum([1/i for i in range(1, m+1)]), for m in [1,100000]. For higher values of m use an approximation, with error less or equal to 4.99999157277e-006. (sum([1/i for i in range(1, m+1)])  ~ log(m) + 0.5772..., 0.5572 is an Euler-Mascheroni constant) 
-c = [1.0]
-for m in range(2, 100000):
-    c.append( c[-1] + 1.0/m)
+    def _support(self, N, m, n):
+        return numpy.maximum(0, n + m - N), numpy.minimum(n, m)
+
+    def _log_pmf(self, i, N, m, n):
+        return (self._logbin_array(m, i) + self._logbin_array(N - m, n - i) -
+                self._logbin_array(N, n))
+
+EULER_MASCHERONI = 0.57721566490153286060651209008240243104215933593992
+
+#: Harmonic numbers up to this are summed exactly, larger ones use the
+#: log(m) + gamma + 1/(2m) approximation (with a negligible error).
+_HARMONIC_EXACT_MAX = 1000000
+
+
+def _harmonic(m):
+    """Return the m-th harmonic number (sum([1.0/i for i in range(1, m+1)]))."""
+    if m <= _HARMONIC_EXACT_MAX:
+        return float(numpy.sum(1.0 / numpy.arange(1, m + 1)))
+    else:
+        return math.log(m) + EULER_MASCHERONI + 1.0 / (2 * m)
+
+
+def _as_input_type(p_values, adjusted):
+    """Return `adjusted` as an array if `p_values` was one, else as a list."""
+    if isinstance(p_values, numpy.ndarray):
+        return adjusted
+    else:
+        return adjusted.tolist()
+
 
 def is_sorted(l):
-    return all(l[i] <= l[i+1] for i in range(len(l)-1))
+    l = numpy.asarray(l)
+    return bool(numpy.all(l[:-1] <= l[1:]))
 
 def FDR(p_values, dependent=False, m=None, ordered=False):
     """
     `False Discovery Rate <http://en.wikipedia.org/wiki/False_discovery_rate>`_ correction on a list of p-values.
 
-    :param p_values: a list of p-values.
+    :param p_values: a list (or an array) of p-values.
     :param dependent: use correction for dependent hypotheses (default False).
     :param m: number of hypotheses tested (default ``len(p_values)``).
     :param ordered: prevent sorting of p-values if they are already sorted (default False).
+    :return: FDR values in the same order (and of the same type) as `p_values`.
     """
+    p = numpy.asarray(p_values, dtype=float)
+    if not m:
+        m = len(p)
+    if m <= 0 or not len(p):
+        return _as_input_type(p_values, numpy.array([], dtype=float))
 
-    if not ordered:
-        ordered = is_sorted(p_values)
+    if dependent: # correct q for dependent tests
+        m = m * _harmonic(m)
 
     if not ordered:
-        joined = [ (v,i) for i,v in enumerate(p_values) ]
-        joined.sort()
-        p_values = [ p[0] for p in joined ]
-        indices = [ p[1] for p in joined ]
+        order = numpy.argsort(p, kind="mergesort")
+        p = p[order]
 
-    if not m:
-        m = len(p_values)
-    if m <= 0 or not p_values:
-        return []
+    fdrs = p * m / numpy.arange(1.0, len(p) + 1)
+    fdrs = numpy.minimum.accumulate(fdrs[::-1])[::-1]
 
-    if dependent: # correct q for dependent tests
-        k = c[m-1] if m <= len(c) else math.log(m) + 0.57721566490153286060651209008240243104215933593992
-        m = m * k
+    if not ordered:
+        unsorted = numpy.empty_like(fdrs)
+        unsorted[order] = fdrs
+        fdrs = unsorted
 
-    tmp_fdrs = [p*m/(i+1.0) for (i, p) in enumerate(p_values)]
-    fdrs = []
-    cmin = tmp_fdrs[-1]
-    for f in reversed(tmp_fdrs):
-        cmin = min(f, cmin)
-        fdrs.append( cmin)
-    fdrs.reverse()
+    return _as_input_type(p_values, fdrs)
 
-    if not ordered:
-        new = [ None ] * len(fdrs)
-        for v,i in zip(fdrs, indices):
-            new[i] = v
-        fdrs = new
+def BenjaminiYekutieli(p_values, m=None):
+    """
+    `Benjamini-Yekutieli <https://en.wikipedia.org/wiki/False_discovery_rate#Benjamini.E2.80.93Yekutieli_procedure>`_
+    FDR correction (under arbitrary dependence) on a list of p-values.
+    The same as ``FDR(p_values, dependent=True, m=m)``.
 
-    return fdrs
+    :param p_values: a list (or an array) of p-values.
+    :param m: number of hypotheses tested (default ``len(p_values)``).
+    """
+    return FDR(p_values, dependent=True, m=m)
 
 def Bonferroni(p_values, m=None):
     """
     `Bonferroni correction <http://en.wikipedia.org/wiki/Bonferroni_correction>`_ correction on a list of p-values.
 
-    :param p_values: a list of p-values.
+    :param p_values: a list (or an array) of p-values.
     :param m: number of hypotheses tested (default ``len(p_values)``).
     """
+    p = numpy.asarray(p_values, dtype=float)
     if not m:
-        m = len(p_values)
+        m = len(p)
     if m == 0:
-        return []
-    m = float(m)
-    return [p/m for p in p_values]
+        return _as_input_type(p_values, numpy.array([], dtype=float))
+    return _as_input_type(p_values, numpy.minimum(p * m, 1.0))
+
+def Holm(p_values, m=None):
+    """
+    `Holm-Bonferroni <https://en.wikipedia.org/wiki/Holm%E2%80%93Bonferroni_method>`_
+    step-down correction on a list of p-values.
+
+    :param p_values: a list (or an array) of p-values.
+    :param m: number of hypotheses tested (default ``len(p_values)``).
+    """
+    p = numpy.asarray(p_values, dtype=float)
+    if not m:
+        m = len(p)
+    if m <= 0 or not len(p):
+        return _as_input_type(p_values, numpy.array([], dtype=float))
+
+    order = numpy.argsort(p, kind="mergesort")
+    adjusted = (m - numpy.arange(len(p))) * p[order]
+    adjusted = numpy.minimum(numpy.maximum.accumulate(adjusted), 1.0)
+    unsorted = numpy.empty_like(adjusted)
+    unsorted[order] = adjusted
+    return _as_input_type(p_values, unsorted)
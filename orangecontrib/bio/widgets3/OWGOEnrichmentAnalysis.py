@@ -616,6 +616,7 @@ class OWGOEnrichmentAnalysis(widget.OWWidget):
             self.terms = terms = self.annotations.get_enriched_terms(
                 clusterGenes, referenceGenes, evidences, aspect=aspect,
                 prob=self.probFunctions[self.probFunc], use_fdr=False,
+                engine="sparse",
                 progress_callback=lambda value: pb.advance())
             ids = []
             pvals = []
@@ -291,7 +291,7 @@ def multimap_inverse(multimap):
 
 def ppidb_synonym_mapping(ppidb, taxid):
     keys = ppidb.ids(taxid)
-    mapping = {key: ppidb.synonyms(key) for key in keys}
+    mapping = dict(zip(keys, ppidb.synonyms_many(keys)))
     return multimap_inverse(mapping)
 
 
@@ -396,7 +396,7 @@ def extract_network(ppidb, query, geneinfo, include_neighborhood=True,
     nodeids = defaultdict(partial(next, count()))
 
     def gi_info(names):
-        mapping = [(name, geneinfo.matcher.umatch(name)) for name in names]
+        mapping = list(zip(names, geneinfo.matcher.umatch_many(names)))
         mapping = [(name, match) for name, match in mapping if match]
         entries = [(name, geneinfo[match]) for name, match in mapping]
 
@@ -415,57 +415,48 @@ def extract_network(ppidb, query, geneinfo, include_neighborhood=True,
             return entries[0][1]
 
     # Add query nodes.
-    for key, query_name in query.items():
+    keys = list(query.keys())
+    for key, synonyms in zip(keys, ppidb.synonyms_many(keys)):
         nodeid = nodeids[key]
-        synonyms = ppidb.synonyms(key)
         entry = gi_info(synonyms)
         graph.add_node(
             nodeid,
             key=key,
             synonyms=synonyms,
-            query_name=query_name,
+            query_name=query[key],
             symbol=entry.symbol if entry is not None else ""
         )
 
     if include_neighborhood:
         # extend the set of nodes in the network with immediate neighborers
-        edges_iter = (edge for key in query for edge in ppidb.edges(key))
-        for id1, id2, score in edges_iter:
-            if min_score is None or score >= min_score:
-                nodeid1 = nodeids[id1]
-                nodeid2 = nodeids[id2]
-                if nodeid1 not in graph:
-                    synonyms1 = ppidb.synonyms(id1)
-                    entry1 = gi_info(synonyms1)
-                    symbol1 = entry1.symbol if entry1 is not None else ""
-                    graph.add_node(
-                        nodeid1, key=id1, synonyms=synonyms1,
-                        symbol=symbol1
-                    )
-
-                if nodeid2 not in graph:
-                    synonyms2 = ppidb.synonyms(id2)
-                    entry2 = gi_info(synonyms2)
-                    symbol2 = entry2.symbol if entry2 is not None else ""
-                    graph.add_node(
-                        nodeid2, key=id2, synonyms=synonyms2,
-                        symbol=symbol2
-                    )
+        neighbors = []
+        for id1, id2, score in ppidb.edges_many(query, min_score=min_score):
+            for id in (id1, id2):
+                if id not in nodeids:
+                    nodeids[id]
+                    neighbors.append(id)
+
+        for id, synonyms in zip(neighbors, ppidb.synonyms_many(neighbors)):
+            entry = gi_info(synonyms)
+            graph.add_node(
+                nodeids[id], key=id, synonyms=synonyms,
+                symbol=entry.symbol if entry is not None else ""
+            )
 
     # add edges between nodes
-    for i, id1 in enumerate(nodeids.keys()):
-        if progress is not None:
-            progress(100.0 * i / len(nodeids))
-
-        for _, id2, score in ppidb.edges(id1):
-            if id2 in nodeids and (min_score is None or score >= min_score):
-                nodeid1 = nodeids[id1]
-                nodeid2 = nodeids[id2]
-                assert nodeid1 in graph and nodeid2 in graph
-                if score is not None and report_weights:
-                    graph.add_edge(nodeid1, nodeid2, weight=score)
-                else:
-                    graph.add_edge(nodeid1, nodeid2)
+    edges = ppidb.edges_many(list(nodeids.keys()), min_score=min_score)
+    for i, (id1, id2, score) in enumerate(edges):
+        if progress is not None and i % 1000 == 0:
+            progress(100.0 * i / len(edges))
+
+        if id1 in nodeids and id2 in nodeids:
+            nodeid1 = nodeids[id1]
+            nodeid2 = nodeids[id2]
+            assert nodeid1 in graph and nodeid2 in graph
+            if score is not None and report_weights:
+                graph.add_edge(nodeid1, nodeid2, weight=score)
+            else:
+                graph.add_edge(nodeid1, nodeid2)
 
     nodedomain = Orange.data.Domain(
         [], [],
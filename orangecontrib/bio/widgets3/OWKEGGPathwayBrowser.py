@@ -851,26 +851,23 @@ class OWKEGGPathwayBrowser(widget.OWWidget):
 
 def pathway_enrichment(genesets, genes, reference, prob=None, callback=None):
     result_sets = []
-    p_values = []
     if prob is None:
         prob = stats.Hypergeometric()
 
     for i, gs in enumerate(genesets):
         cluster = gs.genes.intersection(genes)
         ref = gs.genes.intersection(reference)
-        k = len(cluster)
-        N = len(reference)
-        m = len(ref)
-        n = len(genes)
-        if k:
-            p_val = prob.p_value(k, N, m, n)
+        if cluster:
             result_sets.append((gs.id, cluster, ref))
-            p_values.append(p_val)
         if callback is not None:
             callback(100.0 * i / len(genesets))
 
+    p_values = prob.p_values(
+        [len(cluster) for _, cluster, _ in result_sets], len(reference),
+        [len(ref) for _, _, ref in result_sets], len(genes))
+
     # FDR correction
-    p_values = stats.FDR(p_values)
+    p_values = stats.FDR(list(p_values))
 
     return dict([(id, (genes, p_val, len(ref)))
                  for (id, genes, ref), p_val in zip(result_sets, p_values)])
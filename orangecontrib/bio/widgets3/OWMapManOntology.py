@@ -1974,12 +1974,14 @@ def _dag_enrichment(graph, query, reference, querycount, refcount):
         p_query = len(mapped_query) / querycount if querycount else nan
         p_ref = len(mapped_ref) / refcount if refcount else nan
         enrichment = p_query / p_ref if p_ref else nan
-        pval = probmodel.p_value(len(mapped_query), refcount,
-                                 len(mapped_ref), querycount)
         results.append(
-            Result(node, mapped_query, mapped_ref, pval, nan,
+            Result(node, mapped_query, mapped_ref, nan, nan,
                    enrichment)
         )
+    pvals = probmodel.p_values(
+        [len(r.query_mapped) for r in results], refcount,
+        [len(r.reference_mapped) for r in results], querycount)
+    results = [r._replace(p_value=float(p)) for r, p in zip(results, pvals)]
     fdr_vals = stats.FDR([r.p_value for r in results])
     results = [r._replace(fdr_value=min(f, 1.0), p_value=min(r.p_value, 1.0))
                for r, f in zip(results, fdr_vals)]
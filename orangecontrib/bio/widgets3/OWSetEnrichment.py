@@ -716,8 +716,8 @@ class OWSetEnrichment(widget.OWWidget):
 
         def map_unames():
             matcher = namematcher.result()
-            query = list(filter(None, map(matcher.umatch, querynames)))
-            reference = list(filter(None, map(matcher.umatch, ref_set.result())))
+            query = list(filter(None, matcher.umatch_many(querynames)))
+            reference = list(filter(None, matcher.umatch_many(ref_set.result())))
             return query, reference
 
         if self._nogenematching():